@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Synthetic Modbus/TCP Capture Generator
+Writes large pcap files shaped like captures/normal_traffic.pcap and
+captures/attack_traffic.pcap (HMI polls, attacker writes and spoofed PLC
+readings) without scapy, plus a ground-truth JSON file describing what a
+detector should find
+"""
+
+import argparse
+import json
+import random
+import struct
+import sys
+from datetime import datetime
+
+# Start time of the generated capture (same day as the bundled captures)
+DEFAULT_START = datetime(2025, 11, 16, 18, 0, 0).timestamp()
+
+PLC_IP = '10.0.0.1'
+PLC_MAC = bytes.fromhex('020000000001')
+ATTACKER_IP = '10.0.0.66'
+MODBUS_PORT = 502
+
+TCP_SYN, TCP_ACK, TCP_PSH = 0x02, 0x10, 0x08
+
+# Attack name -> (register, raw value, report text, severity)
+ATTACKS = {
+    'temperature': (0, 9999, "Dangerous temperature value written", 'CRITICAL'),
+    'pressure': (1, 5000, "Dangerous pressure value written", 'CRITICAL'),
+    'shutdown': (2, 0, "Motor shutdown detected", 'HIGH'),
+    'valve': (3, 1, "Safety valve opened", 'CRITICAL'),
+    'reading': (0, 9999, "Out-of-range temperature reading from PLC", 'CRITICAL'),
+}
+
+# Attacks that are a poll answered with the spoofed value, not an attacker write
+READING_ATTACKS = ('reading',)
+
+# Drift bands used by simulators/modbus_plc.py simulate_sensors()
+SENSOR_BANDS = ((240, 260), (950, 1050), (1450, 1550), (0, 0))
+
+_RECORD = struct.Struct('<IIII')
+_MBAP_READ = struct.Struct('>HHHBBHH')      # read request / write request / write response
+
+
+def _ip_bytes(ip):
+    return bytes(int(part) for part in ip.split('.'))
+
+
+def _checksum(header):
+    total = sum(struct.unpack(f'>{len(header) // 2}H', header))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class _Endpoint:
+    """One TCP connection between a client and the PLC"""
+
+    def __init__(self, index, ip, mac, port):
+        self.index = index
+        self.ip = _ip_bytes(ip)
+        self.ip_text = ip
+        self.mac = mac
+        self.port = port
+        self.client_seq = 1000
+        self.server_seq = 5000
+        self.trans_id = 0
+
+
+class CaptureWriter:
+    """Builds Ethernet/IPv4/TCP frames and appends pcap records to a file"""
+
+    def __init__(self, f):
+        self.f = f
+        self.packets = 0
+        self._ip_checksums = {}
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+
+    def _ip_header(self, src, dst, total_length):
+        key = (src, dst, total_length)
+        header = self._ip_checksums.get(key)
+        if header is None:
+            header = bytearray(struct.pack('>BBHHHBBH4s4s', 0x45, 0, total_length, 0, 0x4000,
+                                           64, 6, 0, src, dst))
+            struct.pack_into('>H', header, 10, _checksum(bytes(header)))
+            header = self._ip_checksums[key] = bytes(header)
+        return header
+
+    def write(self, ts, src_mac, dst_mac, src_ip, dst_ip, sport, dport, seq, ack, flags, payload=b''):
+        tcp = struct.pack('>HHIIBBHHH', sport, dport, seq, ack, 5 << 4, flags, 65535, 0, 0)
+        ip = self._ip_header(src_ip, dst_ip, 20 + len(tcp) + len(payload))
+        frame = dst_mac + src_mac + b'\x08\x00' + ip + tcp + payload
+        sec = int(ts)
+        self.f.write(_RECORD.pack(sec, int(round((ts - sec) * 1e6)), len(frame), len(frame)))
+        self.f.write(frame)
+        self.packets += 1
+
+
+def generate(output, packets, hosts, poll_rate, attack_ratio, attacks, seed=1, start=DEFAULT_START):
+    """Write a synthetic capture and return its ground truth as a dict"""
+    rng = random.Random(seed)
+    clients = [_Endpoint(i, f'10.0.{1 + i // 250}.{1 + i % 250}',
+                         bytes.fromhex('02000000') + struct.pack('>H', 0x1000 + i), 40000 + i)
+               for i in range(hosts)]
+    attacker = _Endpoint(hosts, ATTACKER_IP, bytes.fromhex('0200000000ee'), 52964)
+    plc_ip = _ip_bytes(PLC_IP)
+
+    truth = {
+        'packets': 0, 'modbus_packets': 0, 'read_requests': 0, 'write_requests': 0,
+        'hosts': hosts, 'poll_rate': poll_rate, 'attack_ratio': attack_ratio, 'seed': seed,
+        'attacks': {name: 0 for name in attacks},
+        'labels': [],
+    }
+    interval = 1.0 / (hosts * poll_rate)
+    ts = start
+
+    with open(output, 'wb') as f:
+        writer = CaptureWriter(f)
+
+        def handshake(ep, when):
+            writer.write(when, ep.mac, PLC_MAC, ep.ip, plc_ip, ep.port, MODBUS_PORT,
+                         ep.client_seq - 1, 0, TCP_SYN)
+            writer.write(when + 0.00001, PLC_MAC, ep.mac, plc_ip, ep.ip, MODBUS_PORT, ep.port,
+                         ep.server_seq - 1, ep.client_seq, TCP_SYN | TCP_ACK)
+            writer.write(when + 0.00002, ep.mac, PLC_MAC, ep.ip, plc_ip, ep.port, MODBUS_PORT,
+                         ep.client_seq, ep.server_seq, TCP_ACK)
+
+        def transaction(ep, when, request, response):
+            ep.trans_id = (ep.trans_id + 1) & 0xFFFF
+            struct.pack_into('>H', request, 0, ep.trans_id)
+            struct.pack_into('>H', response, 0, ep.trans_id)
+            writer.write(when, ep.mac, PLC_MAC, ep.ip, plc_ip, ep.port, MODBUS_PORT,
+                         ep.client_seq, ep.server_seq, TCP_PSH | TCP_ACK, bytes(request))
+            ep.client_seq += len(request)
+            writer.write(when + 0.0005, PLC_MAC, ep.mac, plc_ip, ep.ip, MODBUS_PORT, ep.port,
+                         ep.server_seq, ep.client_seq, TCP_PSH | TCP_ACK, bytes(response))
+            ep.server_seq += len(response)
+            writer.write(when + 0.00051, ep.mac, PLC_MAC, ep.ip, plc_ip, ep.port, MODBUS_PORT,
+                         ep.client_seq, ep.server_seq, TCP_ACK)
+            truth['modbus_packets'] += 2
+
+        for ep in clients + ([attacker] if attacks and attack_ratio > 0 else []):
+            handshake(ep, ts)
+            ts += 0.001
+
+        read_request = bytearray(_MBAP_READ.pack(0, 0, 6, 1, 3, 0, 4))
+        read_response = bytearray(struct.pack('>HHHBBB4H', 0, 0, 11, 1, 3, 8, 0, 0, 0, 0))
+        def poll_sensors(spoofed=None):
+            nonlocal poll
+            ep = clients[poll % hosts]
+            poll += 1
+            for i, (low, high) in enumerate(SENSOR_BANDS):
+                struct.pack_into('>H', read_response, 9 + 2 * i, rng.randint(low, high))
+            if spoofed is not None:
+                struct.pack_into('>H', read_response, 9 + 2 * spoofed[0], spoofed[1])
+            transaction(ep, ts, read_request, read_response)
+            truth['read_requests'] += 1
+
+        poll = 0
+        while writer.packets + 3 <= packets:
+            if attacks and rng.random() < attack_ratio:
+                name = rng.choice(attacks)
+                register, value = ATTACKS[name][:2]
+                if name in READING_ATTACKS:
+                    poll_sensors((register, value))
+                    source = PLC_IP
+                else:
+                    request = bytearray(_MBAP_READ.pack(0, 0, 6, 1, 6, register, value))
+                    transaction(attacker, ts, request, bytearray(request))
+                    truth['write_requests'] += 1
+                    source = attacker.ip_text
+                truth['attacks'][name] += 1
+                truth['labels'].append({'time': round(ts, 6), 'attack': name,
+                                        'source': source, 'register': register, 'value': value})
+            else:
+                poll_sensors()
+            ts += interval
+
+        truth['packets'] = writer.packets
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Modbus/TCP pcap for benchmarking")
+    parser.add_argument('output', help="pcap file to write")
+    parser.add_argument('--packets', type=int, default=1000000, help="approximate packet count")
+    parser.add_argument('--hosts', type=int, default=10, help="number of polling HMIs")
+    parser.add_argument('--poll-rate', type=float, default=0.1,
+                        help="polls per second per HMI (HMISimulator polls every 10 s)")
+    parser.add_argument('--attack-ratio', type=float, default=0.0001,
+                        help="fraction of transactions that are attacker writes")
+    parser.add_argument('--attacks', default=','.join(ATTACKS),
+                        help=f"comma-separated attack mix from: {', '.join(ATTACKS)}")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    attacks = [a for a in args.attacks.split(',') if a]
+    unknown = [a for a in attacks if a not in ATTACKS]
+    if unknown:
+        parser.error(f"unknown attack(s): {', '.join(unknown)}")
+
+    print(f"[*] Writing {args.packets} packets to {args.output}")
+    truth = generate(args.output, args.packets, args.hosts, args.poll_rate,
+                     args.attack_ratio, attacks, args.seed)
+    truth_file = args.output + '.truth.json'
+    with open(truth_file, 'w') as f:
+        json.dump(truth, f, indent=1)
+    print(f"[+] Wrote {truth['packets']} packets "
+          f"({truth['read_requests']} reads, {truth['write_requests']} attack writes)")
+    print(f"[+] Ground truth: {truth_file}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
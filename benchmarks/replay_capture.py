@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Capture Replay Benchmark
+Replays the Modbus requests of a capture against the PLC simulator in real
+time, N times faster or as fast as possible, pipelined over a pool of
+connections, while the live detector watches the wire; reports the replay
+rate and the latency from each malicious write being sent to its alert
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import shlex
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import score_detection
+from run_benchmarks import git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DETECTOR = os.path.join(ROOT, 'scripts', 'detect_anomalies.py')
+PLC = os.path.join(ROOT, 'simulators', 'modbus_plc.py')
+
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+import modbus_decoder  # noqa: E402
+from mbap_reassembly import MbapReassembler  # noqa: E402
+
+# Writes the traffic on the wire as a pcap stream to stdout, one packet at a time
+DEFAULT_CAPTURE_CMD = 'tcpdump -i {iface} -U -w - tcp port {port}'
+
+DEFAULT_CONNECTIONS = 8
+DEFAULT_PIPELINE = 16       # requests in flight per connection
+
+# Seconds for the capture and detector to start, and for trailing alerts after the replay
+DEFAULT_WARMUP = 2.0
+DEFAULT_DRAIN = 2.0
+
+_MBAP = struct.Struct('>HHH')   # transaction ID, protocol ID, length
+_TID = struct.Struct('>H')
+
+
+def parse_speed(text):
+    """'max' -> 0.0 (no pacing), otherwise a positive replay speed factor"""
+    if text == 'max':
+        return 0.0
+    try:
+        speed = float(text)
+    except ValueError:
+        speed = 0.0
+    if speed <= 0:
+        raise argparse.ArgumentTypeError(f"speed must be a positive factor or 'max': {text}")
+    return speed
+
+
+def expected_alerts(capture, register_map=None):
+    """Per-packet alerts of an offline detector run: capture timestamp -> [(type, register)]"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'alerts.jsonl')
+        args = [sys.executable, DETECTOR, '--engine', 'fast', '--alerts-jsonl', path, capture]
+        if register_map:
+            args += ['--register-map', register_map]
+        result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"offline detector run failed: {result.stdout.strip().splitlines()[-1:]}")
+        expected = {}
+        for alert in score_detection.read_jsonl(path):
+            if alert.get('timestamp') is not None:
+                expected.setdefault(alert['timestamp'], []).append((alert['type'], alert.get('register')))
+    return expected
+
+
+def iter_requests(capture, port=modbus_decoder.MODBUS_PORT):
+    """Yield (capture time, (client IP, client port), [request ADUs]) per request segment"""
+    reassembler = MbapReassembler()
+    with modbus_decoder.MappedCapture(capture) as mapped:
+        for linktype, ts, data in mapped.records():
+            frame = modbus_decoder.decode_frame(linktype, ts, data, check_adu=False)
+            if frame is None or frame is modbus_decoder.UNHANDLED:
+                continue
+            if frame.dport != port or not frame.payload:
+                continue
+            adus = reassembler.feed(frame)
+            if adus:
+                yield frame.time, (frame.src_ip, frame.sport), [bytes(adu) for adu in adus]
+
+
+class ReplayConnection:
+    """One pooled connection: requests are written without waiting for responses,
+    up to pipeline in flight, and a reader task matches responses by transaction ID"""
+
+    def __init__(self, reader, writer, pipeline, timeout):
+        self.reader = reader
+        self.writer = writer
+        self.pipeline = pipeline
+        self.timeout = timeout
+        self.window = asyncio.Semaphore(pipeline)
+        self.closed = False
+        self.pending = {}           # transaction ID -> send time (perf_counter)
+        self.next_tid = 0
+        self.responses = self.exceptions = 0
+        self.rtts = []
+
+    async def send(self, adu):
+        """Write one request once the window allows; returns the wall-clock send time"""
+        try:
+            await asyncio.wait_for(self.window.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"no response from the PLC for {self.timeout:g}s")
+        if self.closed:
+            raise ConnectionError("the PLC closed a connection")
+        tid = self.next_tid
+        self.next_tid = (tid + 1) & 0xFFFF
+        # Original transaction IDs may collide once flows share a connection
+        self.pending[tid] = time.perf_counter()
+        sent = time.time()
+        self.writer.write(_TID.pack(tid) + adu[2:])
+        await self.writer.drain()
+        return sent
+
+    async def read_responses(self):
+        reader = self.reader
+        try:
+            while True:
+                tid, _, length = _MBAP.unpack(await reader.readexactly(6))
+                pdu = await reader.readexactly(length)
+                sent = self.pending.pop(tid, None)
+                if sent is None:
+                    continue
+                self.rtts.append(time.perf_counter() - sent)
+                self.responses += 1
+                if len(pdu) > 1 and pdu[1] & 0x80:
+                    self.exceptions += 1
+                self.window.release()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        # Wake a sender waiting for the window; it sees the connection is gone
+        self.closed = True
+        for _ in range(self.pipeline):
+            self.window.release()
+
+    def close(self):
+        self.writer.close()
+
+
+class CaptureReplay:
+    """Paced replay of a capture's requests over a connection pool"""
+
+    def __init__(self, host='127.0.0.1', port=502, connections=DEFAULT_CONNECTIONS,
+                 pipeline=DEFAULT_PIPELINE, speed=1.0, timeout=3.0):
+        self.host = host
+        self.port = port
+        self.connections = connections
+        self.pipeline = pipeline
+        self.speed = speed
+        self.timeout = timeout
+        self.pool = []
+        self.readers = []
+        self.labels = []
+
+    async def connect(self):
+        try:
+            streams = await asyncio.wait_for(asyncio.gather(
+                *(asyncio.open_connection(self.host, self.port) for _ in range(self.connections))),
+                self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectionError(f"Could not connect to PLC at {self.host}:{self.port}: {e}")
+        for reader, writer in streams:
+            writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.pool.append(ReplayConnection(reader, writer, self.pipeline, self.timeout))
+        self.readers = [asyncio.create_task(conn.read_responses()) for conn in self.pool]
+
+    def close(self):
+        for conn in self.pool:
+            conn.close()
+
+    async def run(self, capture, expected, repeat=1):
+        """Replay capture repeat times; returns the replay summary"""
+        speed = self.speed
+        flows = {}                  # original (client IP, port) -> pooled connection
+        requests = late = 0
+        started = time.perf_counter()
+        for _ in range(repeat):
+            first = None
+            pass_started = time.perf_counter()
+            for ts, flow, adus in iter_requests(capture):
+                if first is None:
+                    first = ts
+                if speed:
+                    delay = pass_started + (ts - first) / speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    elif delay < -0.001:
+                        late += 1
+                conn = flows.get(flow)
+                if conn is None:
+                    # A flow keeps one connection, so its requests stay in order
+                    conn = flows[flow] = self.pool[len(flows) % len(self.pool)]
+                sent = [await conn.send(adu) for adu in adus][0]
+                requests += len(adus)
+                alerts = expected.get(ts)
+                if alerts:
+                    self.labels.append({
+                        'id': len(self.labels),
+                        'pattern': alerts[0][0],
+                        'background_rate': speed,
+                        'unit_id': adus[0][6] if len(adus[0]) > 6 else None,
+                        'capture_time': ts,
+                        'expected_alerts': [{'type': kind, 'register': register, 'sent': sent}
+                                            for kind, register in alerts],
+                    })
+        sent_elapsed = time.perf_counter() - started
+
+        # Wait for the responses still in flight
+        deadline = time.perf_counter() + self.timeout
+        while any(conn.pending for conn in self.pool) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        rtts = sorted(rtt for conn in self.pool for rtt in conn.rtts)
+
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+        return {
+            'speed': speed or 'max',
+            'connections': len(self.pool),
+            'pipeline': self.pipeline,
+            'flows': len(flows),
+            'requests': requests,
+            'responses': sum(conn.responses for conn in self.pool),
+            'exceptions': sum(conn.exceptions for conn in self.pool),
+            'unanswered': sum(len(conn.pending) for conn in self.pool),
+            'late_requests': late,
+            'seconds': round(elapsed, 3),
+            'send_rate': round(requests / sent_elapsed, 1) if sent_elapsed else None,
+            'response_rate': round(sum(conn.responses for conn in self.pool) / elapsed, 1) if elapsed else None,
+            'rtt_p50_ms': ms(score_detection._percentile(rtts, 50)),
+            'rtt_p99_ms': ms(score_detection._percentile(rtts, 99)),
+        }
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def start_detector(args, alerts_path, report):
+    """Start the capture command piped into the live detector; returns both processes"""
+    command = shlex.split(args.capture_cmd.format(iface=args.iface, port=args.port))
+    capture = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    detector_args = [sys.executable, DETECTOR, '-', '--alerts-jsonl', alerts_path]
+    if args.register_map:
+        detector_args += ['--register-map', args.register_map]
+    detector = subprocess.Popen(detector_args, stdin=capture.stdout, stdout=report,
+                                stderr=subprocess.STDOUT)
+    capture.stdout.close()
+    return capture, detector
+
+
+def stop_detector(capture, detector, timeout=30):
+    """End the capture (the detector then sees end of stream and prints its report)"""
+    if capture.poll() is None:
+        capture.send_signal(signal.SIGINT)
+    for proc in (capture, detector):
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+async def replay(args, expected):
+    replayer = CaptureReplay(args.host, args.port, args.connections, args.pipeline, args.speed,
+                             args.timeout)
+    await replayer.connect()
+    try:
+        summary = await replayer.run(args.capture, expected, args.repeat)
+    finally:
+        replayer.close()
+    return summary, replayer.labels
+
+
+def print_detection(scores):
+    """Recall and send-to-alert latency per alert type"""
+    if not scores['rates']:
+        print("[*] No malicious writes in the replayed capture")
+        return
+    rate = scores['rates'][0]
+    print(f"  {'alert type':<30} {'expected':>9} {'detected':>9} {'recall':>8} "
+          f"{'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, row in list(rate['patterns'].items()) + [('overall', rate['overall'])]:
+        recall = f"{row['recall']:.1%}" if row['recall'] is not None else '-'
+        cells = [f"{row[k]:.1f}" if row[k] is not None else '-'
+                 for k in ('latency_p50_ms', 'latency_p99_ms', 'latency_max_ms')]
+        print(f"  {name:<30} {row['expected_alerts']:>9} {row['detected']:>9} {recall:>8} "
+              f"{cells[0]:>9} {cells[1]:>9} {cells[2]:>9}")
+    if scores['unmatched_alerts']:
+        extra = ', '.join(f"{kind}={count}" for kind, count in scores['unmatched_alerts'].items())
+        print(f"  Alerts not matched to a replayed write: {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a capture's Modbus requests against the PLC simulator and measure "
+                    "live detection latency")
+    parser.add_argument('capture', help="pcap/pcapng capture (e.g. captures/attack_traffic.pcap)")
+    parser.add_argument('--speed', type=parse_speed, default=1.0,
+                        help="replay speed: 1 = real time, N = N times faster, 'max' = unpaced")
+    parser.add_argument('--repeat', type=int, default=1, help="replay the capture N times")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=502,
+                        help="PLC port (the live detector decodes Modbus on port 502)")
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help="pooled connections; each original client flow keeps one")
+    parser.add_argument('--pipeline', type=int, default=DEFAULT_PIPELINE,
+                        help="requests in flight per connection (default: %(default)s)")
+    parser.add_argument('--timeout', type=float, default=3.0)
+    parser.add_argument('--start-plc', action='store_true',
+                        help="start simulators/modbus_plc.py on --port for the run")
+    parser.add_argument('--no-detector', action='store_true',
+                        help="only replay and measure the PLC (no capture, no detector)")
+    parser.add_argument('--iface', default='lo', help="interface the capture command listens on")
+    parser.add_argument('--capture-cmd', default=DEFAULT_CAPTURE_CMD,
+                        help="command writing a pcap stream of the wire to stdout; {iface} and {port} "
+                             "are substituted (default: %(default)s)")
+    parser.add_argument('--register-map', metavar='FILE',
+                        help="register map for the offline ground truth and the live detector")
+    parser.add_argument('--warmup', type=float, default=DEFAULT_WARMUP,
+                        help="seconds to let the capture and detector start (default: %(default)s)")
+    parser.add_argument('--drain', type=float, default=DEFAULT_DRAIN,
+                        help="seconds to wait for trailing alerts (default: %(default)s)")
+    parser.add_argument('--tolerance', type=float, default=score_detection.DEFAULT_TOLERANCE,
+                        help="alert matching window in seconds (default: %(default)s)")
+    parser.add_argument('--alerts-jsonl', metavar='FILE', help="keep the live detector's alerts")
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.no_detector:
+        expected = {}
+    else:
+        print(f"[*] Finding the malicious writes in {args.capture}...")
+        try:
+            expected = expected_alerts(args.capture, args.register_map)
+        except (OSError, RuntimeError) as e:
+            print(f"[!] {e}")
+            return 1
+        print(f"[+] {sum(len(alerts) for alerts in expected.values())} per-packet alerts in the capture")
+
+    procs = []
+    tmpdir = tempfile.TemporaryDirectory()
+    alerts_path = args.alerts_jsonl or os.path.join(tmpdir.name, 'alerts.jsonl')
+    report_path = os.path.join(tmpdir.name, 'report.txt')
+    try:
+        if args.start_plc:
+            plc = subprocess.Popen([sys.executable, PLC, '--port', str(args.port)],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            procs.append(plc)
+            if not wait_for_port(args.host, args.port, 10):
+                print(f"[!] PLC simulator did not start on port {args.port}")
+                return 1
+        if not args.no_detector:
+            report = open(report_path, 'w')
+            capture, detector = start_detector(args, alerts_path, report)
+            report.close()
+            time.sleep(args.warmup)
+            if capture.poll() is not None or detector.poll() is not None:
+                print(f"[!] Capture or detector exited early (capture command: {args.capture_cmd})")
+                stop_detector(capture, detector)
+                return 1
+
+        speed = f"{args.speed:g}x" if args.speed else "max speed"
+        print(f"[*] Replaying {args.capture} at {speed} to {args.host}:{args.port} "
+              f"({args.connections} connections, {args.pipeline} in flight each)")
+        try:
+            summary, labels = asyncio.run(replay(args, expected))
+        except ConnectionError as e:
+            print(f"[!] {e}")
+            return 1
+        print(f"[+] {summary['requests']} requests in {summary['seconds']:.2f}s: "
+              f"{summary['send_rate']:.0f} req/s sent, {summary['response_rate']:.0f} responses/s, "
+              f"RTT p50 {summary['rtt_p50_ms']} ms, p99 {summary['rtt_p99_ms']} ms")
+        print(f"    {summary['exceptions']} exception responses, {summary['unanswered']} unanswered, "
+              f"{summary['late_requests']} sent late")
+
+        scores = detector_stats = None
+        if not args.no_detector:
+            time.sleep(args.drain)
+            stop_detector(capture, detector)
+            with open(report_path, encoding='utf-8', errors='replace') as f:
+                report_text = f.read()
+            match = re.search(r"Modbus Packets: (\d+)", report_text)
+            detector_stats = {'modbus_packets': int(match.group(1)) if match else None,
+                              'exit_code': detector.returncode}
+            try:
+                alerts = score_detection.read_jsonl(alerts_path)
+            except (OSError, ValueError) as e:
+                print(f"[!] Error reading the detector's alerts: {e}")
+                return 1
+            scores = score_detection.summarize(*score_detection.score(labels, alerts, args.tolerance))
+            print(f"\n[*] Detection ({detector_stats['modbus_packets']} Modbus packets seen, "
+                  f"{len(alerts)} alerts)")
+            print_detection(scores)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        tmpdir.cleanup()
+
+    if args.output:
+        results = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'capture': os.path.abspath(args.capture),
+            'repeat': args.repeat,
+            'replay': summary,
+            'detector': detector_stats,
+            'detection': scores,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n[+] Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
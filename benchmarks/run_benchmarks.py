@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Detector Throughput Benchmarks
+Runs scripts/detect_anomalies.py over a synthetic capture in each ingestion
+mode and records packets/sec, peak RSS and correctness against the
+generator's ground truth as JSON, so releases can be compared. --consistency
+instead checks that every ingestion mode reports what the serial fast engine
+reports
+"""
+
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import generate_traffic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DETECTOR = os.path.join(ROOT, 'scripts', 'detect_anomalies.py')
+
+# Mode name -> extra detect_anomalies.py arguments ('-' means the capture is piped to stdin)
+MODES = {
+    'scapy': [],
+    'stream': ['--stream'],
+    'fast': ['--engine', 'fast'],
+    'reassemble': ['--engine', 'fast', '--reassemble'],
+    'batch': ['--batch'],
+    'parallel': ['--engine', 'fast', '--jobs', str(os.cpu_count() or 1)],
+    'live': ['-'],
+}
+DEFAULT_MODES = ['fast', 'reassemble', 'batch', 'parallel', 'live']
+
+# Sustained throughput the live (stdin) path is expected to keep up with
+LIVE_TARGET_PPS = 20000
+
+# A mode is flagged as a regression when it is this much slower than the baseline
+REGRESSION_TOLERANCE = 0.10
+
+# --consistency: modes whose report and alert log must equal the serial fast engine's.
+# Modes sharing a state directory run one after the other (cold, then from the cache or
+# checkpoint); a resumed checkpoint run only writes new alerts, so just its report is compared.
+CONSISTENCY_MODES = [
+    ('batch', None, ['--batch']),
+    ('parallel', None, ['--engine', 'fast', '--jobs', '2']),
+    ('batch-parallel', None, ['--batch', '--jobs', '2']),
+    ('cache-cold', 'cache', ['--engine', 'fast', '--jobs', '2', '--cache']),
+    ('cache-warm', 'cache', ['--engine', 'fast', '--jobs', '2', '--cache']),
+    ('batch-cache-cold', 'batch-cache', ['--batch', '--cache']),
+    ('batch-cache-warm', 'batch-cache', ['--batch', '--cache']),
+    ('checkpoint', 'checkpoint', ['--engine', 'fast', '--checkpoint']),
+    ('checkpoint-resumed', 'checkpoint', ['--engine', 'fast', '--checkpoint']),
+]
+CONSISTENCY_PACKETS = 300000    # large enough for --jobs 2 to split the capture
+
+STAT_PATTERNS = {
+    'packets': r"Total Packets: (\d+)",
+    'modbus_packets': r"Modbus Packets: (\d+)",
+    'read_requests': r"Read Operations: (\d+)",
+    'write_requests': r"Write Operations: (\d+)",
+}
+
+
+def run_mode(mode, capture):
+    """Run the detector once; return wall time, peak RSS (MB) and its stdout"""
+    args = [sys.executable, DETECTOR] + MODES[mode]
+    stdin = None
+    if args[-1] != '-':
+        args.append(capture)
+    else:
+        stdin = open(capture, 'rb')
+    started = time.perf_counter()
+    try:
+        proc = subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = proc.stdout.read().decode('utf-8', 'replace')
+        # wait4 gives the resource usage of this child alone
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        if stdin is not None:
+            stdin.close()
+    elapsed = time.perf_counter() - started
+    return elapsed, usage.ru_maxrss / 1024.0, proc.returncode, output
+
+
+def check_report(output, truth):
+    """Compare a detector report with the ground truth; returns a list of mismatches"""
+    report = output.split("ICS SECURITY ANALYSIS REPORT", 1)[-1]
+    mismatches = []
+    for key, pattern in STAT_PATTERNS.items():
+        match = re.search(pattern, report)
+        found = int(match.group(1)) if match else None
+        if found != truth[key]:
+            mismatches.append(f"{key}: expected {truth[key]}, got {found}")
+    for name, expected in truth['attacks'].items():
+        found = report.count(generate_traffic.ATTACKS[name][2])
+        if found != expected:
+            mismatches.append(f"{name} alerts: expected {expected}, got {found}")
+    return mismatches
+
+
+def run_report(args, capture, workdir):
+    """Run the detector; returns its exit code, report lines and alert records"""
+    alerts = os.path.join(workdir, 'alerts.jsonl')
+    proc = subprocess.run([sys.executable, DETECTOR] + args + ['--alerts-jsonl', alerts, capture],
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    report = proc.stdout.split("ICS SECURITY ANALYSIS REPORT", 1)[-1]
+    lines = [line for line in report.splitlines()
+             if not line.startswith(('PCAP File:', 'Analysis Time:', '[*]', '[+]', '[!]'))]
+    records = []
+    if os.path.exists(alerts):
+        with open(alerts) as f:
+            records = [json.loads(line) for line in f]
+        os.remove(alerts)
+    return proc.returncode, lines, records
+
+
+def check_consistency(capture, truth, workdir):
+    """Diff each mode's report and alert log against the serial fast engine; returns failed modes"""
+    _, expected, expected_alerts = run_report(['--engine', 'fast'], capture, workdir)
+    failed = []
+    readings = sum(record['type'] == 'OUT_OF_RANGE_READING' for record in expected_alerts)
+    if readings != truth['attacks'].get('reading', 0):
+        # Otherwise a mode skipping the response checks would go unnoticed
+        print(f"[!] fast engine found {readings} spoofed readings, "
+              f"expected {truth['attacks'].get('reading', 0)}")
+        failed.append('fast')
+    for mode, state, args in CONSISTENCY_MODES:
+        state = os.path.join(workdir, state or mode)
+        if '--cache' in args:
+            args = args + ['--cache-dir', state]
+        elif '--checkpoint' in args:
+            args = args + [state]
+        returncode, lines, alerts = run_report(args, capture, workdir)
+        problems = [f"exit code {returncode}"] if returncode else []
+        problems += [line for line in difflib.unified_diff(expected, lines, 'fast', mode, lineterm='', n=0)
+                     if line[:1] in '+-' and line[:3] not in ('+++', '---')][:6]
+        if mode != 'checkpoint-resumed' and alerts != expected_alerts:
+            problems.append(f"alert log differs ({len(alerts)} records, expected {len(expected_alerts)})")
+        print(f"[+] {mode:<18} " + ("OK" if not problems else "MISMATCH"))
+        for problem in problems:
+            print(f"      {problem}")
+        if problems:
+            failed.append(mode)
+
+    tables = flow_tables(capture)
+    for mode in ('batch', 'parallel'):
+        same = tables[mode] == tables['fast']
+        print(f"[+] {mode + ' flows':<18} " + ("OK" if same else "MISMATCH"))
+        if not same:
+            print(f"      {len(tables[mode][0])} flows, {tables[mode][1]} evicted "
+                  f"(fast: {len(tables['fast'][0])} flows, {tables['fast'][1]} evicted)")
+            failed.append(f"{mode} flows")
+    return failed
+
+
+def flow_tables(capture):
+    """Full flow tables (LRU order, counters, evictions) of the fast, batch and --jobs 2 engines"""
+    sys.path.insert(0, os.path.dirname(DETECTOR))
+    import detect_anomalies
+
+    def table(detector):
+        flows = [(key, flow.first, flow.last, flow.packets, flow.bytes)
+                 for key, flow in detector.flows.flows.items()]
+        return flows, detector.flows.evicted
+
+    tables = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mode, options in (('fast', {'engine': 'fast'}), ('batch', {'batch': True})):
+            detector = detect_anomalies.ModbusAnomalyDetector(capture, **options)
+            detector.load_pcap()
+            detector.analyze()
+            tables[mode] = table(detector)
+        tables['parallel'] = table(detect_anomalies.analyze_captures([capture], 2, engine='fast'))
+    return tables
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', '-C', ROOT, 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file):
+    """Print throughput changes against an earlier results file"""
+    with open(baseline_file) as f:
+        baseline = {r['mode']: r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\n[*] Compared with {baseline_file}")
+    for result in results:
+        old = baseline.get(result['mode'])
+        if not old or not old['packets_per_sec']:
+            continue
+        change = result['packets_per_sec'] / old['packets_per_sec'] - 1
+        flag = ''
+        if change < -REGRESSION_TOLERANCE:
+            flag = '  <-- REGRESSION'
+            regressions.append(result['mode'])
+        print(f"  {result['mode']:<12} {old['packets_per_sec']:>12.0f} -> "
+              f"{result['packets_per_sec']:>12.0f} pps ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detect_anomalies.py ingestion modes")
+    parser.add_argument('--capture', help="existing synthetic capture (with .truth.json next to it)")
+    parser.add_argument('--packets', type=int,
+                        help=f"packets to synthesize (default: 1000000, {CONSISTENCY_PACKETS} with --consistency)")
+    parser.add_argument('--hosts', type=int, default=10)
+    parser.add_argument('--poll-rate', type=float, default=0.1)
+    parser.add_argument('--attack-ratio', type=float, default=0.0001)
+    parser.add_argument('--attacks', default=','.join(generate_traffic.ATTACKS))
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES),
+                        help=f"comma-separated modes from: {', '.join(MODES)}")
+    parser.add_argument('--output', default='benchmark_results.json', help="results JSON file")
+    parser.add_argument('--baseline', help="earlier results JSON to compare against")
+    parser.add_argument('--consistency', action='store_true',
+                        help="check that batch, --jobs, --cache and --checkpoint runs report exactly what "
+                             "the serial fast engine reports (exits non-zero on differences)")
+    args = parser.parse_args()
+    if args.packets is None:
+        args.packets = CONSISTENCY_PACKETS if args.consistency else 1000000
+
+    modes = [m for m in args.modes.split(',') if m]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    tmpdir = None
+    capture = args.capture
+    if capture is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        capture = os.path.join(tmpdir.name, 'synthetic.pcap')
+        print(f"[*] Synthesizing {args.packets} packets...")
+        truth = generate_traffic.generate(capture, args.packets, args.hosts, args.poll_rate,
+                                          args.attack_ratio, [a for a in args.attacks.split(',') if a])
+    else:
+        with open(capture + '.truth.json') as f:
+            truth = json.load(f)
+    truth.pop('labels', None)
+
+    if args.consistency:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(f"[*] Comparing ingestion modes with the serial fast engine on {capture}...")
+            failed = check_consistency(capture, truth, workdir)
+        if tmpdir is not None:
+            tmpdir.cleanup()
+        print(f"\n[{'!' if failed else '+'}] {len(failed)} mode(s) inconsistent"
+              + (f": {', '.join(failed)}" if failed else ""))
+        return 1 if failed else 0
+
+    results = []
+    try:
+        for mode in modes:
+            print(f"[*] Running {mode}...")
+            elapsed, rss, returncode, output = run_mode(mode, capture)
+            mismatches = check_report(output, truth) if returncode == 0 else [f"exit code {returncode}"]
+            result = {
+                'mode': mode,
+                'seconds': round(elapsed, 3),
+                'packets_per_sec': round(truth['packets'] / elapsed, 1),
+                'peak_rss_mb': round(rss, 1),
+                'correct': not mismatches,
+                'mismatches': mismatches,
+            }
+            if mode == 'live':
+                result['target_pps'] = LIVE_TARGET_PPS
+                result['meets_target'] = result['packets_per_sec'] >= LIVE_TARGET_PPS
+            results.append(result)
+            status = "OK" if not mismatches else "MISMATCH: " + "; ".join(mismatches)
+            print(f"[+] {mode:<12} {elapsed:8.2f}s {result['packets_per_sec']:>12.0f} pps "
+                  f"{rss:8.1f} MB  {status}")
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    summary = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'capture': truth,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"\n[+] Results written to {args.output}")
+
+    failed = [r['mode'] for r in results if not r['correct']]
+    if args.baseline:
+        failed += compare(results, args.baseline)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
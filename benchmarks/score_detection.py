@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Detection Coverage Scoring
+Matches the ground-truth labels written by scripts/attack_scenarios.py with
+the alerts detect_anomalies.py wrote to --alerts-jsonl, and reports recall
+and alert latency per background rate and attack pattern
+"""
+
+import argparse
+import bisect
+import json
+import sys
+
+# An alert matches an expected alert captured at most this many seconds after it was sent
+DEFAULT_TOLERANCE = 2.0
+
+# Capture timestamps may read slightly earlier than the sender's clock
+CLOCK_SLACK = 0.05
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def score(labels, alerts, tolerance=DEFAULT_TOLERANCE):
+    """Per-rate, per-pattern recall and latency, plus unmatched alerts per type.
+
+    Each alert is credited to the most recent still-unmatched expected alert of
+    the same type and register (any register when the label names none) sent
+    at most tolerance seconds before the alert's capture timestamp. Latency is
+    reported_at - sent when the detector stamped its lines (live mode),
+    otherwise capture time - sent.
+    """
+    results = {}
+    expected_by_key = {}        # (type, register) -> [(sent, pattern results)]
+    for label in labels:
+        pattern = results.setdefault(label['background_rate'], {}).setdefault(
+            label['pattern'], {'attacks': 0, 'expected': 0, 'detected': 0, 'latencies': []})
+        pattern['attacks'] += 1
+        for expected in label['expected_alerts']:
+            pattern['expected'] += 1
+            expected_by_key.setdefault((expected['type'], expected['register']), []).append(
+                (expected['sent'], pattern))
+    sends = {}
+    for key, entries in expected_by_key.items():
+        entries.sort(key=lambda entry: entry[0])
+        sends[key] = [sent for sent, _ in entries]
+    matched = set()
+    all_sends = sorted(sent for times in sends.values() for sent in times)
+
+    unmatched = {}
+    for alert in sorted((a for a in alerts if a.get('timestamp') is not None),
+                        key=lambda a: a['timestamp']):
+        timestamp = alert['timestamp']
+        for key in ((alert['type'], alert.get('register')), (alert['type'], None)):
+            times = sends.get(key)
+            if not times:
+                continue
+            i = bisect.bisect_right(times, timestamp + CLOCK_SLACK) - 1
+            while i >= 0 and timestamp - times[i] <= tolerance and (key, i) in matched:
+                i -= 1
+            if i >= 0 and timestamp - times[i] <= tolerance:
+                matched.add((key, i))
+                sent, pattern = expected_by_key[key][i]
+                pattern['detected'] += 1
+                pattern['latencies'].append(alert.get('reported_at', timestamp) - sent)
+                break
+        else:
+            # Only count stray alerts raised while the scenarios were running
+            if all_sends and all_sends[0] - CLOCK_SLACK <= timestamp <= all_sends[-1] + tolerance:
+                unmatched[alert['type']] = unmatched.get(alert['type'], 0) + 1
+    return results, unmatched
+
+
+def summarize(results, unmatched):
+    """JSON-ready summary: recall and p50/p99/max latency (ms) per rate and pattern"""
+    rates = []
+    for rate, patterns in sorted(results.items()):
+        rows = {}
+        totals = {'expected': 0, 'detected': 0, 'latencies': []}
+        for name, p in sorted(patterns.items()):
+            rows[name] = _row(p['attacks'], p['expected'], p['detected'], p['latencies'])
+            totals['expected'] += p['expected']
+            totals['detected'] += p['detected']
+            totals['latencies'] += p['latencies']
+        rates.append({
+            'background_rate': rate,
+            'patterns': rows,
+            'overall': _row(sum(p['attacks'] for p in patterns.values()),
+                            totals['expected'], totals['detected'], totals['latencies']),
+        })
+    return {'rates': rates, 'unmatched_alerts': dict(sorted(unmatched.items()))}
+
+
+def _row(attacks, expected, detected, latencies):
+    latencies = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+    return {
+        'attacks': attacks,
+        'expected_alerts': expected,
+        'detected': detected,
+        'recall': round(detected / expected, 4) if expected else None,
+        'latency_p50_ms': ms(_percentile(latencies, 50)),
+        'latency_p99_ms': ms(_percentile(latencies, 99)),
+        'latency_max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+
+def print_summary(summary):
+    for rate in summary['rates']:
+        print(f"\n[*] Background rate {rate['background_rate']:g} req/s")
+        print(f"  {'pattern':<14} {'attacks':>8} {'expected':>9} {'detected':>9} {'recall':>8} "
+              f"{'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for name, row in list(rate['patterns'].items()) + [('overall', rate['overall'])]:
+            recall = f"{row['recall']:.1%}" if row['recall'] is not None else '-'
+            cells = [f"{row[k]:.1f}" if row[k] is not None else '-'
+                     for k in ('latency_p50_ms', 'latency_p99_ms', 'latency_max_ms')]
+            print(f"  {name:<14} {row['attacks']:>8} {row['expected_alerts']:>9} {row['detected']:>9} "
+                  f"{recall:>8} {cells[0]:>9} {cells[1]:>9} {cells[2]:>9}")
+    if summary['unmatched_alerts']:
+        extra = ', '.join(f"{kind}={count}" for kind, count in summary['unmatched_alerts'].items())
+        print(f"\n[*] Alerts not matched to a label: {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score detector recall and alert latency against labels")
+    parser.add_argument('labels', help="labels JSONL from scripts/attack_scenarios.py")
+    parser.add_argument('alerts', help="alerts JSONL from detect_anomalies.py --alerts-jsonl")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="matching window in seconds (default: %(default)s)")
+    parser.add_argument('--output', help="write the scores as JSON")
+    args = parser.parse_args()
+
+    try:
+        labels = read_jsonl(args.labels)
+        alerts = read_jsonl(args.alerts)
+    except (OSError, ValueError) as e:
+        print(f"[!] Error reading input: {e}")
+        return 1
+
+    summary = summarize(*score(labels, alerts, args.tolerance))
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"\n[+] Scores written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
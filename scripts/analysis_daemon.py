@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Analysis Daemon
+Long-running analysis service on a local UNIX socket: scapy layers, numpy
+and the compiled rule tables are loaded once, and each submitted job runs in
+a forked child of the warm process. The submit/status/stop commands are a
+thin client that imports nothing from the detector
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from capture_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_SOCKET = os.environ.get(
+    'ICS_ANALYSIS_SOCKET',
+    os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                 f'ics-analysis-{os.getuid()}.sock'))
+
+# Jobs analyzed at once (one forked child each); further connections wait
+DEFAULT_MAX_JOBS = 8
+
+# Seconds `stop` waits for the daemon to finish running jobs and remove its socket
+STOP_TIMEOUT = 60
+
+# Request options and their defaults (same meaning as the detect_anomalies.py flags)
+JOB_OPTIONS = {
+    'engine': 'scapy',
+    'stream': False,
+    'batch': False,
+    'reassemble': False,
+    'rate_window': None,
+    'aggregate': False,
+    'jobs': 1,
+    'cache': False,
+}
+
+
+def send_request(path, request, timeout=None):
+    """Send one JSON request line and return the decoded response line"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("analysis daemon closed the connection without a response")
+    return json.loads(line)
+
+
+def run_job(request, warm):
+    """Analyze the captures of one request; returns the response dict"""
+    import contextlib
+    import io
+    from detect_anomalies import ModbusAnomalyDetector, analyze_captures, find_captures
+
+    options = {name: request.get(name, default) for name, default in JOB_OPTIONS.items()}
+    if options['engine'] not in ('scapy', 'fast'):
+        return {'ok': False, 'error': f"unknown engine: {options['engine']}"}
+    captures = find_captures(request.get('captures', []))
+    if not captures:
+        return {'ok': False, 'error': "No capture files found"}
+    if options['rate_window'] and (options['batch'] or options['jobs'] > 1 or len(captures) != 1):
+        return {'ok': False, 'error': "rate_window needs a single capture, jobs 1 and no batch"}
+    if options['reassemble'] and options['batch']:
+        return {'ok': False, 'error': "reassemble is not supported in batch mode"}
+
+    shared = dict(engine=options['engine'], batch=options['batch'], reassemble=options['reassemble'],
+                  aggregate=options['aggregate'], register_map=warm['register_map'],
+                  baseline=warm['baseline'], cache=warm['cache'] if options['cache'] else None)
+    output = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            if options['jobs'] > 1 or len(captures) != 1:
+                detector = analyze_captures(captures, options['jobs'], **shared)
+            else:
+                detector = ModbusAnomalyDetector(captures[0], stream=options['stream'],
+                                                 rate_window=options['rate_window'], **shared)
+                detector.load_pcap()
+                detector.analyze()
+            detector.print_report()
+    except SystemExit:
+        # The detector exits on unreadable captures after printing why
+        lines = output.getvalue().strip().splitlines()
+        return {'ok': False, 'error': lines[-1].removeprefix('[!] ') if lines else "analysis failed"}
+    return {
+        'ok': True,
+        'elapsed': time.perf_counter() - started,
+        'report': output.getvalue(),
+        'stats': detector.stats,
+        'anomalies': [entry.to_dict() for entry in detector.anomalies.entries()],
+    }
+
+
+def serve(args):
+    import socketserver
+
+    # Everything a job needs is imported and compiled here, once
+    from detect_anomalies import DEFAULT_REGISTER_MAP, _import_scapy
+    from baseline_profile import BaselineProfile
+    from capture_cache import CaptureCache
+    from register_map import RegisterMap
+
+    started = time.perf_counter()
+    _import_scapy()
+    try:
+        import modbus_events  # noqa: F401  (numpy, for batch jobs)
+    except ImportError:
+        pass
+    try:
+        register_map = RegisterMap.load(args.register_map) if args.register_map else RegisterMap(DEFAULT_REGISTER_MAP)
+        baseline = BaselineProfile.load(args.baseline) if args.baseline else None
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[!] Error loading rules: {e}")
+        return 1
+    warm = {'register_map': register_map, 'baseline': baseline, 'cache': CaptureCache(args.cache_dir)}
+    status = {'pid': os.getpid(), 'socket': args.socket, 'started': time.time(),
+              'register_map': args.register_map, 'baseline': args.baseline, 'max_jobs': args.max_jobs}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)   # a job child just dies on SIGTERM
+            try:
+                request = json.loads(self.rfile.readline())
+                op = request.get('op')
+                if op == 'analyze':
+                    response = run_job(request, warm)
+                elif op == 'status':
+                    response = dict(status, ok=True, uptime=time.time() - status['started'])
+                elif op == 'stop':
+                    response = {'ok': True}
+                    os.kill(status['pid'], signal.SIGTERM)
+                else:
+                    response = {'ok': False, 'error': f"unknown op: {op}"}
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+
+    class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        max_children = args.max_jobs
+
+    if os.path.exists(args.socket):
+        try:
+            send_request(args.socket, {'op': 'status'}, timeout=2)
+            print(f"[!] An analysis daemon is already listening on {args.socket}")
+            return 1
+        except (OSError, ValueError):
+            os.unlink(args.socket)  # left behind by a daemon that did not shut down
+
+    old_umask = os.umask(0o077)     # jobs read any file the daemon can: owner only
+    try:
+        server = Server(args.socket, Handler)
+    finally:
+        os.umask(old_umask)
+
+    def stop(signum, frame):
+        # Raising here could land inside a fork hook and be swallowed; shutdown()
+        # blocks until serve_forever() returns, so it cannot run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    print(f"[+] Rules and decoders loaded in {time.perf_counter() - started:.2f}s")
+    print(f"[*] Analysis daemon listening on {args.socket} (pid {os.getpid()}, Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        print("[+] Analysis daemon stopped")
+    return 0
+
+
+def submit(args):
+    request = {
+        'op': 'analyze',
+        'captures': [os.path.abspath(path) for path in args.pcap_file],
+        'engine': args.engine,
+        'stream': args.stream,
+        'batch': args.batch,
+        'reassemble': args.reassemble,
+        'rate_window': args.rate_window,
+        'aggregate': args.aggregate,
+        'jobs': args.jobs,
+        'cache': args.cache,
+    }
+    try:
+        response = send_request(args.socket, request)
+    except (OSError, ValueError) as e:
+        print(f"[!] Could not reach the analysis daemon on {args.socket}: {e}")
+        return 1
+    if not response['ok']:
+        print(f"[!] {response['error']}")
+        return 1
+    print(response['report'], end='')
+    if args.alerts_jsonl:
+        with open(args.alerts_jsonl, 'w', encoding='utf-8') as f:
+            for record in response['anomalies']:
+                f.write(json.dumps(record) + '\n')
+        print(f"[+] {len(response['anomalies'])} anomaly records written to {args.alerts_jsonl}")
+    return 0
+
+
+def control(args):
+    try:
+        response = send_request(args.socket, {'op': args.command}, timeout=10)
+    except (OSError, ValueError) as e:
+        print(f"[!] Could not reach the analysis daemon on {args.socket}: {e}")
+        return 1
+    if args.command == 'stop':
+        print(f"[*] Analysis daemon on {args.socket} stopping")
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while os.path.exists(args.socket):
+            if time.monotonic() > deadline:
+                print(f"[!] Analysis daemon on {args.socket} did not stop within {STOP_TIMEOUT}s")
+                return 1
+            time.sleep(0.1)
+        print("[+] Analysis daemon stopped")
+    else:
+        print(f"[+] Analysis daemon pid {response['pid']} on {response['socket']}, "
+              f"up {response['uptime']:.0f}s, up to {response['max_jobs']} concurrent jobs")
+        print(f"    Register map: {response['register_map'] or 'built-in'}, "
+              f"baseline: {response['baseline'] or 'none'}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm Modbus analysis service and its client")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help="UNIX socket path (default: %(default)s, or $ICS_ANALYSIS_SOCKET)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="run the analysis daemon")
+    serve_parser.add_argument('--register-map', metavar='FILE',
+                              help="JSON/YAML register map used for every job")
+    serve_parser.add_argument('--baseline', metavar='FILE',
+                              help="learned baseline profile used for every job")
+    serve_parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS, metavar='N',
+                              help="jobs analyzed concurrently (default: %(default)s)")
+    serve_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, metavar='DIR',
+                              help="analysis cache for jobs submitted with --cache (default: %(default)s)")
+
+    submit_parser = commands.add_parser('submit', help="analyze captures in the daemon")
+    submit_parser.add_argument('pcap_file', nargs='+', help="pcap/pcapng capture(s); directories are expanded")
+    submit_parser.add_argument('--engine', choices=['scapy', 'fast'], default='scapy')
+    submit_parser.add_argument('--stream', action='store_true')
+    submit_parser.add_argument('--batch', action='store_true')
+    submit_parser.add_argument('--reassemble', action='store_true')
+    submit_parser.add_argument('--rate-window', type=float, metavar='SECONDS')
+    submit_parser.add_argument('--aggregate', action='store_true')
+    submit_parser.add_argument('--jobs', type=int, default=1, metavar='N')
+    submit_parser.add_argument('--cache', action='store_true')
+    submit_parser.add_argument('--alerts-jsonl', metavar='FILE',
+                               help="write the job's anomalies to FILE as JSON Lines")
+
+    commands.add_parser('status', help="show the running daemon")
+    commands.add_parser('stop', help="stop the running daemon")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        return serve(args)
+    if args.command == 'submit':
+        return submit(args)
+    return control(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
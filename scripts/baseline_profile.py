@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Learned Register Baselines
+Per-(PLC, unit ID, register) value profiles learned from normal traffic with
+constant-memory streaming estimators (Welford mean/variance, P-square
+quantiles), saved as JSON and compiled into a band lookup for detection
+"""
+
+import hashlib
+import json
+import math
+import os
+import tempfile
+
+# Bump when the saved estimator layout changes
+PROFILE_VERSION = 1
+
+# Learned band: these quantiles, widened by BASELINE_MARGIN of their distance
+# (plus 1/samples of it, as short captures rarely reach the true extremes)
+BASELINE_QUANTILES = (0.001, 0.999)
+BASELINE_MARGIN = 0.1
+
+# Registers seen fewer times than this are not enforced
+MIN_SAMPLES = 10
+
+
+class RunningStats:
+    """Count, mean, variance (Welford), minimum and maximum of a value stream"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, min=None, max=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2, self.min, self.max]
+
+
+class P2Quantile:
+    """One quantile of a stream in five markers (Jain & Chlamtac P-square)"""
+
+    __slots__ = ('p', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p, heights=None, positions=None, desired=None):
+        self.p = p
+        self.heights = heights if heights is not None else []
+        self.positions = positions if positions is not None else [0, 1, 2, 3, 4]
+        self.desired = desired if desired is not None else [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = (0, p / 2, p, (1 + p) / 2, 1)
+
+    def add(self, value):
+        q = self.heights
+        if len(q) < 5:
+            q.append(value)
+            q.sort()
+            return
+
+        n = self.positions
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self.desired
+        for i, increment in enumerate(self.increments):
+            desired[i] += increment
+
+        # Move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic estimate overshoots a neighbour: fall back to linear
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    @property
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(len(q) - 1, int(len(q) * self.p))]
+        return q[2]
+
+    def to_list(self):
+        return [self.heights, self.positions, self.desired]
+
+
+class RegisterProfile:
+    """Learned distribution of one register's values"""
+
+    __slots__ = ('stats', 'low', 'high')
+
+    def __init__(self, stats=None, low=None, high=None):
+        self.stats = stats or RunningStats()
+        self.low = low or P2Quantile(BASELINE_QUANTILES[0])
+        self.high = high or P2Quantile(BASELINE_QUANTILES[1])
+
+    def add(self, value):
+        self.stats.add(value)
+        self.low.add(value)
+        self.high.add(value)
+
+    def band(self):
+        """(low, high, mean, std) of values considered normal"""
+        low, high = self.low.value, self.high.value
+        margin = (high - low) * (BASELINE_MARGIN + 1 / self.stats.count)
+        return (low - margin, high + margin, self.stats.mean, self.stats.std)
+
+
+class BaselineBand:
+    __slots__ = ('low', 'high', 'mean', 'std')
+
+    def __init__(self, low, high, mean, std):
+        self.low = low
+        self.high = high
+        self.mean = mean
+        self.std = std
+
+    def deviation(self, value):
+        """Distance from the mean in standard deviations (None for constant registers)"""
+        return (value - self.mean) / self.std if self.std else None
+
+
+class BaselineProfile:
+    """Register profiles keyed by (PLC address, unit ID, register).
+
+    Learning is O(1) memory per register; bands holds the compiled
+    (PLC, unit ID, register) -> BaselineBand lookup used for detection.
+    """
+
+    def __init__(self, min_samples=MIN_SAMPLES):
+        self.min_samples = min_samples
+        self.registers = {}
+        self.bands = {}
+
+    def __len__(self):
+        return len(self.registers)
+
+    def observe(self, plc, unit_id, register, value):
+        key = (plc, unit_id, register)
+        profile = self.registers.get(key)
+        if profile is None:
+            profile = self.registers[key] = RegisterProfile()
+        profile.add(value)
+
+    def compile(self):
+        """Build the detection lookup from the registers with enough samples"""
+        self.bands = {key: BaselineBand(*profile.band())
+                      for key, profile in self.registers.items()
+                      if profile.stats.count >= self.min_samples}
+        return self.bands
+
+    def digest(self):
+        """Short fingerprint of the compiled bands (part of analysis cache keys)"""
+        bands = sorted((list(key), band.low, band.high) for key, band in self.bands.items())
+        return hashlib.blake2b(json.dumps(bands).encode(), digest_size=10).hexdigest()
+
+    def deviation_mask(self, plc, unit_id, register, value, addresses):
+        """Vectorized check: boolean mask of values outside their learned band.
+
+        plc holds indices into addresses (as in the columnar event table).
+        """
+        import numpy as np
+
+        mask = np.zeros(len(register), dtype=bool)
+        if not self.bands or not len(register):
+            return mask
+        keys = np.stack([plc.astype(np.int64), unit_id.astype(np.int64), register.astype(np.int64)])
+        combos, inverse = np.unique(keys, axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        lows = np.full(combos.shape[1], -np.inf)
+        highs = np.full(combos.shape[1], np.inf)
+        for i, (code, unit, reg) in enumerate(combos.T.tolist()):
+            band = self.bands.get((addresses[code], unit, reg))
+            if band is not None:
+                lows[i] = band.low
+                highs[i] = band.high
+        return (value < lows[inverse]) | (value > highs[inverse])
+
+    @classmethod
+    def load(cls, path, min_samples=MIN_SAMPLES):
+        """Load a saved profile and compile it for detection"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != PROFILE_VERSION:
+            raise ValueError(f"Unsupported baseline profile: {path}")
+        profile = cls(min_samples)
+        for entry in data['registers']:
+            count, mean, m2, low, high = entry['stats']
+            profile.registers[(entry['plc'], entry['unit_id'], entry['register'])] = RegisterProfile(
+                RunningStats(count, mean, m2, low, high),
+                P2Quantile(BASELINE_QUANTILES[0], *entry['low']),
+                P2Quantile(BASELINE_QUANTILES[1], *entry['high']))
+        profile.compile()
+        return profile
+
+    def save(self, path):
+        """Write the estimator state (learning can resume from the saved file)"""
+        registers = []
+        for (plc, unit_id, register), profile in sorted(self.registers.items(), key=_entry_order):
+            low, high, mean, std = profile.band()
+            registers.append({
+                'plc': plc,
+                'unit_id': unit_id,
+                'register': register,
+                'band': [low, high],
+                'mean': mean,
+                'std': std,
+                'stats': profile.stats.to_list(),
+                'low': profile.low.to_list(),
+                'high': profile.high.to_list(),
+            })
+        data = {'version': PROFILE_VERSION, 'quantiles': list(BASELINE_QUANTILES),
+                'margin': BASELINE_MARGIN, 'registers': registers}
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.json', delete=False,
+                                         encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(f.name, path)
+
+
+def _entry_order(item):
+    plc, unit_id, register = item[0]
+    return (str(plc), unit_id if isinstance(unit_id, int) else -1, register)
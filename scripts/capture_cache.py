@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Capture Analysis Cache
+On-disk cache of parsed Modbus event tables and per-capture detector state,
+keyed by the capture's content hash, so repeat runs and forensic queries
+skip re-parsing unchanged captures
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+# Bump when the event table or detector state layout changes
+CACHE_VERSION = 6
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'ICS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ics-security-monitoring'))
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class CaptureCache:
+    """Directory of cache entries, one per capture content hash.
+
+    <dir>/hashes.json remembers (size, mtime, inode) -> hash for each path, so an
+    unchanged capture is only hashed once; any change to the file gives a new
+    hash and therefore a fresh entry.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def content_hash(self, path):
+        """BLAKE2b of the file contents (memoized by path and stat)"""
+        st = os.stat(path)
+        signature = [st.st_size, st.st_mtime_ns, st.st_ino]
+        real_path = os.path.realpath(path)
+        index_file = os.path.join(self.directory, 'hashes.json')
+        try:
+            with open(index_file) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        entry = index.get(real_path)
+        if entry is not None and entry[:3] == signature:
+            return entry[3]
+
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        index[real_path] = signature + [content_hash]
+        os.makedirs(self.directory, exist_ok=True)
+        _write_atomic(index_file, json.dumps(index).encode())
+        return content_hash
+
+    def entry_dir(self, path):
+        return os.path.join(self.directory, f"v{CACHE_VERSION}", self.content_hash(path))
+
+    def load_state(self, path, options):
+        """Return the cached detector state for (capture, analysis options), or None"""
+        state_file = os.path.join(self.entry_dir(path), f"state-{_options_key(options)}.pickle")
+        try:
+            with open(state_file, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def store_state(self, path, options, state):
+        entry = self.entry_dir(path)
+        os.makedirs(entry, exist_ok=True)
+        state = dict(state, metrics=None)
+        _write_atomic(os.path.join(entry, f"state-{_options_key(options)}.pickle"),
+                      pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def events(self, path):
+        """Event table for a capture, parsed once and then loaded from the cache"""
+        import numpy as np
+        from modbus_events import ModbusEventTable
+
+        entry = self.entry_dir(path)
+        columns_file = os.path.join(entry, 'events.npz')
+        meta_file = os.path.join(entry, 'events.json')
+        try:
+            with open(meta_file) as f:
+                meta = json.load(f)
+            with np.load(columns_file, allow_pickle=False) as data:
+                columns = {name: data[name] for name in data.files if name != 'readings'}
+                readings = data['readings']
+            flow_counts = {tuple(key): counters for key, counters in meta['flow_counts']}
+            return ModbusEventTable(columns, meta['addresses'], dict(meta['source_counts']),
+                                    meta['total_packets'], flow_counts, readings)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        table = ModbusEventTable.from_pcap(path)
+        os.makedirs(entry, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=entry, suffix='.npz', delete=False) as f:
+            np.savez(f, readings=table.readings, **table.columns)
+        os.replace(f.name, columns_file)
+        meta = {
+            'addresses': table.addresses,
+            # (address, count) pairs: addresses are not always strings
+            'source_counts': list(table.source_counts.items()),
+            'total_packets': table.total_packets,
+            'flow_counts': list(table.flow_counts.items()),
+        }
+        _write_atomic(meta_file, json.dumps(meta).encode())
+        return table
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _options_key(options):
+    return hashlib.blake2b(json.dumps(options, sort_keys=True, default=str).encode(),
+                           digest_size=10).hexdigest()
+
+
+def _write_atomic(path, data):
+    """Write a file via a temporary file so readers never see a partial one"""
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or manage the capture analysis cache")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="cache directory (default: %(default)s, or $ICS_CACHE_DIR)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query = commands.add_parser('query', help="query the Modbus events of a capture")
+    query.add_argument('pcap_file')
+    query.add_argument('--start', type=float, help="events at or after this epoch time")
+    query.add_argument('--end', type=float, help="events before this epoch time")
+    query.add_argument('--func-code', type=int)
+    query.add_argument('--register', type=int)
+    query.add_argument('--src-ip')
+    query.add_argument('--dst-ip')
+    query.add_argument('--unit-id', type=int)
+    query.add_argument('--requests-only', action='store_true')
+    query.add_argument('--limit', type=int, default=20, help="rows to print (default: %(default)s)")
+
+    commands.add_parser('clear', help="delete every cache entry")
+    args = parser.parse_args()
+
+    cache = CaptureCache(args.cache_dir)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"[+] Cleared {args.cache_dir}")
+        return
+
+    started = time.perf_counter()
+    try:
+        events = cache.events(args.pcap_file)
+    except (OSError, ValueError) as e:
+        print(f"[!] Error reading pcap: {e}")
+        sys.exit(1)
+    result = events.query(start=args.start, end=args.end, func_code=args.func_code,
+                          register=args.register, src_ip=args.src_ip, dst_ip=args.dst_ip,
+                          unit_id=args.unit_id, requests_only=args.requests_only)
+    elapsed = (time.perf_counter() - started) * 1000
+    for i, row in enumerate(result.rows()):
+        if i == args.limit:
+            print(f"  ... {len(result) - args.limit} more")
+            break
+        print(f"  {row}")
+    print(f"[+] {len(result)} of {len(events)} events ({elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
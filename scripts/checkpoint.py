@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Detector Checkpoints
+Saves the detector's running state (counters, recent anomalies, pending
+transactions, rate windows, request cadences, reassembly buffers) after each
+capture of a rotated series, so the next run resumes where the last one stopped
+"""
+
+import os
+import pickle
+import tempfile
+
+# Bump when the saved detector state layout changes
+CHECKPOINT_VERSION = 4
+
+
+class Checkpoint:
+    """Running detector state plus the captures already folded into it.
+
+    Captures are remembered by real path with their size, so a capture that
+    is passed again is skipped instead of being counted twice. Captures that
+    no longer exist are forgotten when the checkpoint is loaded, so rotating
+    old files away keeps the list short.
+    """
+
+    def __init__(self, path, options, captures=None, state=None):
+        self.path = path
+        self.options = options
+        self.captures = captures if captures is not None else {}    # real path -> size
+        self.state = state
+
+    @classmethod
+    def load(cls, path, options):
+        """Load a checkpoint, or start an empty one if the file does not exist yet"""
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return cls(path, options)
+        except (EOFError, pickle.UnpicklingError) as e:
+            raise ValueError(f"Corrupt checkpoint {path}: {e}")
+        if not isinstance(data, dict) or data.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint: {path}")
+        if data['options'] != options:
+            raise ValueError(f"Checkpoint {path} was written with different analysis options")
+        captures = {capture: size for capture, size in data['captures'].items() if os.path.exists(capture)}
+        return cls(path, options, captures, data['state'])
+
+    def seen(self, capture):
+        """None for a new capture, else the size it had when it was analyzed"""
+        return self.captures.get(os.path.realpath(capture))
+
+    def save(self, capture, state):
+        """Record capture as analyzed and write the state it left behind"""
+        self.captures[os.path.realpath(capture)] = os.path.getsize(capture)
+        self.state = state
+        data = {'version': CHECKPOINT_VERSION, 'options': self.options,
+                'captures': self.captures, 'state': state}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.tmp', delete=False) as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, self.path)
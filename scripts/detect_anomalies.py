@@ -4,12 +4,30 @@ ICS Security Monitoring - Modbus Anomaly Detection
 Analyzes pcap files for malicious activity in Modbus traffic
 """
 
-from scapy.all import rdpcap, TCP
-from scapy.contrib.modbus import ModbusADUResponse, ModbusADURequest
 import sys
+import os
+import struct
+import time
+import argparse
+import heapq
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+import modbus_decoder
+from anomaly_records import Anomaly, AnomalyLog, AnomalySummary, JsonLinesWriter
+from baseline_profile import BaselineProfile
+from capture_cache import DEFAULT_CACHE_DIR, CaptureCache
+from checkpoint import Checkpoint
+from flow_table import (DEFAULT_FLOW_IDLE, DEFAULT_MAX_FLOWS, DEFAULT_TOP_SOURCES, FlowTable,
+                        HeavyHitters, format_flow)
+from mbap_reassembly import MbapReassembler
+from pipeline_metrics import PipelineMetrics
+from rate_tracker import RateTracker
+from register_map import RegisterMap, with_unit
+from timing_analysis import JITTER_WINDOW, TimingTracker
+from transaction_tracker import LatencyHistogram, PendingRequest, TransactionTracker
+
 # Define normal operating ranges for our ICS environment
 NORMAL_RANGES = {
     'temperature': (200, 300),      # 20.0-30.0°C (stored as x10)
@@ -18,15 +36,149 @@ NORMAL_RANGES = {
     'valve_state': (0, 1)           # 0=Closed, 1=Open
 }
 
+# Default register map profile (same format as a --register-map JSON/YAML file).
+# Unit IDs are omitted, so these rules apply to every unit.
+DEFAULT_REGISTER_MAP = {
+    'registers': [
+        {
+            'address': 0,
+            'name': 'Temperature',
+            'scale': 10,                   # stored as x10
+            'unit': '°C',
+            'range': list(NORMAL_RANGES['temperature']),
+            'severity': 'CRITICAL',
+            'description': "Dangerous temperature value written: {value}",
+        },
+        {
+            'address': 1,
+            'name': 'Pressure',
+            'unit': 'PSI',
+            'range': list(NORMAL_RANGES['pressure']),
+            'severity': 'CRITICAL',
+            'description': "Dangerous pressure value written: {value}",
+        },
+        {
+            'address': 2,
+            'name': 'Motor Speed',
+            'unit': 'RPM',
+            'range': list(NORMAL_RANGES['motor_speed']),
+            'severity': 'MEDIUM',
+            'description': "Abnormal motor speed written: {value}",
+            'forbidden': [{
+                'value': 0,
+                'type': 'MOTOR_SHUTDOWN',
+                'severity': 'HIGH',
+                'description': "Motor shutdown detected (speed set to 0)",
+            }],
+        },
+        {
+            'address': 3,
+            'name': 'Safety Valve',
+            'forbidden': [{
+                'value': 1,
+                'type': 'UNAUTHORIZED_VALVE_OPERATION',
+                'severity': 'CRITICAL',
+                'description': "Safety valve opened - potential unauthorized access",
+            }],
+        },
+    ]
+}
+
 # Thresholds for attack detection
 WRITE_THRESHOLD = 5  # More than 5 writes in capture = suspicious
 DOS_THRESHOLD = 50   # More than 50 packets from single source = DoS
 
+# Sliding-window rate thresholds (used with --rate-window instead of the totals above)
+DOS_RATE_THRESHOLD = 50.0    # packets/sec from a single source
+WRITE_RATE_THRESHOLD = 2.0   # writes/sec from a single source or to a single register
+
+# Parallel mode: captures are only split into pieces at least this large
+MIN_SPLIT_SIZE = 16 * 1024 * 1024
+CAPTURE_EXTENSIONS = ('.pcap', '.pcapng', '.cap')
+
+# Live mode (and --alerts-jsonl, which has the full list) keeps only the most
+# recent anomalies for the final report
+LIVE_ANOMALY_HISTORY = 1000
+
+# --checkpoint keeps only the most recent anomalies in the saved state (older ones
+# are counted), so saving and loading it does not slow down as the series grows
+CHECKPOINT_ANOMALY_HISTORY = 1000
+
+# --checkpoint: detector attributes carried from one capture of a rotated series to the next
+CHECKPOINT_ATTRIBUTES = ('stats', 'source_ips', 'flows', 'write_operations', 'anomalies',
+                         'transactions', 'reassembler', 'source_rates', 'write_rates', 'register_rates',
+                         'timing')
+
+# Busiest sources and flows listed in the report
+TOP_TALKERS = 5
+
+# --metrics: detector methods timed as pipeline stages, per-packet handlers and rules
+# Request function code -> handler method (each decodes its PDU once)
+REQUEST_HANDLERS = {
+    modbus_decoder.FC_READ_HOLDING_REGISTERS: 'handle_read',
+    modbus_decoder.FC_WRITE_SINGLE_REGISTER: 'handle_write_register',
+    modbus_decoder.FC_WRITE_SINGLE_COIL: 'handle_write_block',
+    modbus_decoder.FC_WRITE_MULTIPLE_COILS: 'handle_write_block',
+    modbus_decoder.FC_WRITE_MULTIPLE_REGISTERS: 'handle_write_block',
+    modbus_decoder.FC_READ_WRITE_MULTIPLE_REGISTERS: 'handle_write_block',
+}
+
+PROFILED_STAGES = {
+    'load_pcap': 'load',
+    'analyze_packets': 'analyze',
+    'run_live': 'live',
+    'run_capture_rules': 'capture_rules',
+    'print_report': 'report',
+}
+PROFILED_HANDLERS = ('analyze_packet', 'analyze_frame', 'analyze_adu', 'check_response_values',
+                     'handle_read', 'handle_write_register', 'handle_write_block')
+PROFILED_RULES = {
+    'check_write_anomaly': 'write_range',
+    'check_write_block': 'write_block_range',
+    'check_reading': 'reading_range',
+    'check_baseline': 'baseline',
+    'track_source': 'source_tracking',
+    'track_packet_rate': 'packet_rate',
+    'track_write_rate': 'write_rate',
+    'track_timing': 'timing',
+    'detect_dos': 'dos_totals',
+    'detect_excessive_writes': 'write_totals',
+}
+
+# scapy names bound by _import_scapy(): the fast and batch engines never need them
+rdpcap = PcapReader = TCP = ModbusADURequest = ModbusADUResponse = None
+
+
+def _import_scapy():
+    """Load the scapy layers the scapy engine uses (only the first call imports anything)"""
+    global rdpcap, PcapReader, TCP, ModbusADURequest, ModbusADUResponse
+    if TCP is not None:
+        return
+    modbus_decoder.load_scapy()
+    from scapy.utils import rdpcap, PcapReader
+    from scapy.layers.inet import TCP
+    from scapy.contrib.modbus import ModbusADURequest, ModbusADUResponse
+
 class ModbusAnomalyDetector:
-    def __init__(self, pcap_file):
+    def __init__(self, pcap_file, stream=False, engine='scapy', batch=False, register_map=None,
+                 byte_range=(None, None), live=False, rate_window=None, reassemble=False,
+                 metrics=None, aggregate=False, alert_sink=None, cache=None, baseline=None,
+                 learn_baseline=False, max_flows=DEFAULT_MAX_FLOWS, flow_idle=DEFAULT_FLOW_IDLE,
+                 top_sources=DEFAULT_TOP_SOURCES, timing=False, anomaly_history=None):
         self.pcap_file = pcap_file
+        self.byte_range = byte_range
+        self.live = live
+        self.register_map = register_map or RegisterMap(DEFAULT_REGISTER_MAP)
+        self.stream = stream
+        self.engine = engine
+        self.batch = batch
+        self.events = None
+        self.cache = cache
+        self.cached_state = None
         self.packets = []
-        self.anomalies = []
+        if anomaly_history is None and (live or alert_sink is not None):
+            anomaly_history = LIVE_ANOMALY_HISTORY
+        self.anomalies = AnomalyLog(aggregate, anomaly_history, alert_sink)
         self.stats = {
             'total_packets': 0,
             'modbus_packets': 0,
@@ -36,165 +188,759 @@ class ModbusAnomalyDetector:
             'suspicious_writes': 0
         }
         self.write_operations = defaultdict(int)
-        self.source_ips = defaultdict(int)
+        
+        # Fixed-size per-source (Space-Saving) and per-flow (LRU) packet counters
+        self.source_ips = HeavyHitters(top_sources)
+        self.flows = FlowTable(max_flows, flow_idle)
+        
+        # Request/response correlation by (flow, transaction ID)
+        self.transactions = TransactionTracker()
+        
+        # TCP stream reassembly: one entry per ADU instead of one per packet
+        self.reassembler = MbapReassembler() if reassemble else None
+        
+        # Learned per-(PLC, unit, register) value bands (--baseline), or the profile
+        # being learned from this traffic (--learn-baseline)
+        self.baseline = baseline
+        self.learn_baseline = learn_baseline
+        
+        # Per-source / per-register rates over the last rate_window seconds
+        self.rate_window = rate_window
+        self.source_rates = self.write_rates = self.register_rates = None
+        if rate_window:
+            self.source_rates = RateTracker(rate_window, DOS_RATE_THRESHOLD)
+            self.write_rates = RateTracker(rate_window, WRITE_RATE_THRESHOLD)
+            self.register_rates = RateTracker(rate_window, WRITE_RATE_THRESHOLD)
+        
+        # Learned polling cadence per (client, PLC, unit, function code) request stream
+        self.timing = TimingTracker() if timing else None
+        
+        # Profiling (--metrics) wraps this instance's methods; nothing is timed otherwise
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.instrument(self, PROFILED_STAGES, PROFILED_HANDLERS, PROFILED_RULES)
+        
+        # Bound after instrumentation so profiled handlers are the ones dispatched to
+        self.request_handlers = {func_code: getattr(self, name)
+                                 for func_code, name in REQUEST_HANDLERS.items()}
         
     def load_pcap(self):
         """Load and parse pcap file"""
+        if self.cache is not None:
+            try:
+                self.cached_state = self.load_cached_state()
+            except OSError as e:
+                print(f"[!] Error loading pcap: {e}")
+                sys.exit(1)
+            if self.cached_state is not None:
+                print(f"[+] Using cached analysis of {self.pcap_file}")
+                return
+        if self.batch:
+            print(f"[*] Indexing pcap file: {self.pcap_file} (columnar batch mode)")
+            try:
+                self.load_events()
+            except (OSError, ValueError) as e:
+                print(f"[!] Error loading pcap: {e}")
+                sys.exit(1)
+            print(f"[+] Indexed {len(self.events)} Modbus events from {self.events.total_packets} packets")
+            return
+        if self.engine == 'fast':
+            # Records are decoded straight from a memory map in analyze()
+            print(f"[*] Mapping pcap file: {self.pcap_file} (fast decoder)")
+            return
+        if self.stream:
+            # Packets are read one at a time in analyze()
+            print(f"[*] Streaming pcap file: {self.pcap_file}")
+            return
         print(f"[*] Loading pcap file: {self.pcap_file}")
         try:
+            _import_scapy()
             self.packets = rdpcap(self.pcap_file)
-            self.stats['total_packets'] = len(self.packets)
+            self.stats['total_packets'] += len(self.packets)
             print(f"[+] Loaded {len(self.packets)} packets")
         except Exception as e:
             print(f"[!] Error loading pcap: {e}")
             sys.exit(1)
     
+    def load_events(self):
+        """Build the columnar event table for batch mode"""
+        if self.cache is not None and self.byte_range == (None, None):
+            self.events = self.cache.events(self.pcap_file)
+            return
+        import modbus_events  # needs numpy, only loaded in batch mode
+        self.events = modbus_events.ModbusEventTable.from_pcap(self.pcap_file, self.byte_range)
+    
+    def cache_options(self):
+        """Settings that change the per-packet results (part of the cache key)"""
+        return {
+            'engine': self.engine,
+            'batch': self.batch,
+            'reassemble': self.reassembler is not None,
+            'rate_window': self.rate_window,
+            'timing': self.timing is not None,
+            'aggregate': self.anomalies.aggregate,
+            'history': self.anomalies.history,
+            'register_map': self.register_map.config,
+            'baseline': self.baseline.digest() if self.baseline is not None else None,
+            'flows': (self.source_ips.capacity, self.flows.max_flows, self.flows.idle_timeout),
+        }
+    
+    def load_cached_state(self):
+        """Cached per-packet results for this capture, or None"""
+        state = self.cache.load_state(self.pcap_file, self.cache_options())
+        if state is not None and self.anomalies.sink is not None and not state['anomalies'].complete:
+            # The alert log needs every anomaly, not just the ones kept for the report
+            return None
+        return state
+    
+    def store_cached_state(self, state=None):
+        """Save per-packet results for later runs (only when no anomaly was left out)"""
+        state = state or self.partial_state()
+        if not state['anomalies'].complete:
+            return
+        try:
+            self.cache.store_state(self.pcap_file, self.cache_options(), state)
+        except OSError as e:
+            print(f"[!] Could not update analysis cache: {e}")
+    
+    def iter_packets(self):
+        """Yield packets from the pcap file one at a time (constant memory)"""
+        _import_scapy()
+        try:
+            with PcapReader(self.pcap_file) as reader:
+                for pkt in reader:
+                    self.stats['total_packets'] += 1
+                    yield pkt
+        except Exception as e:
+            print(f"[!] Error reading pcap: {e}")
+            sys.exit(1)
+    
+    def analyze_fast(self):
+        """Decode records without scapy, falling back to it only when needed"""
+        try:
+            with modbus_decoder.MappedCapture(self.pcap_file) as capture:
+                self.analyze_records(capture.records(*self.byte_range))
+        except (OSError, ValueError) as e:
+            print(f"[!] Error reading pcap: {e}")
+            sys.exit(1)
+    
+    def analyze_records(self, records):
+        """Run the fast decoder over (linktype, timestamp, data) records"""
+        decode_frame = modbus_decoder.decode_frame
+        unhandled = modbus_decoder.UNHANDLED
+        check_adu = self.reassembler is None
+        for linktype, ts, data in records:
+            self.stats['total_packets'] += 1
+            frame = decode_frame(linktype, ts, data, check_adu)
+            if frame is None:
+                continue
+            if frame is unhandled:
+                _import_scapy()
+                self.analyze_packet(modbus_decoder.to_scapy(linktype, ts, data))
+            else:
+                self.analyze_frame(frame)
+    
+    def resume_transactions(self, earlier):
+        """Re-track the requests of the last TRANSACTION_TIMEOUT seconds before this byte range.
+        
+        Responses near the start of a piece then match requests at the end of
+        the previous one, as in a serial run. earlier holds the start offsets
+        of the capture's earlier pieces; only the transaction table is
+        affected (no counters, latency or rules).
+        """
+        start, end = self.byte_range
+        with modbus_decoder.MappedCapture(self.pcap_file) as capture:
+            first = next(capture.records(start, end), None)
+            if first is None:
+                return
+            cutoff = first[1] - self.transactions.timeout
+            earlier = list(earlier)
+            lookback = earlier.pop()
+            while earlier and next(capture.records(lookback, start))[1] > cutoff:
+                lookback = earlier.pop()
+            transactions = self.transactions
+            decode_frame = modbus_decoder.decode_frame
+            for linktype, ts, data in capture.records(lookback, start):
+                if ts < cutoff:
+                    continue
+                frame = decode_frame(linktype, ts, data, True)
+                if frame is None or frame is modbus_decoder.UNHANDLED:
+                    continue
+                if len(frame.payload) < modbus_decoder.MBAP_SIZE:
+                    continue
+                if frame.dport == modbus_decoder.MODBUS_PORT:
+                    # Not self.track_request: --metrics wraps that one to count function codes
+                    ModbusAnomalyDetector.track_request(self, frame, frame.payload)
+                elif frame.sport == modbus_decoder.MODBUS_PORT:
+                    transactions.match_response((frame.dst_ip, frame.dport), (frame.src_ip, frame.sport),
+                                                modbus_decoder.MBAP.unpack_from(frame.payload)[0], ts)
+        transactions.latency = {}
+        transactions.stats = dict.fromkeys(transactions.stats, 0)
+    
+    def analyze_live_packet(self, pkt):
+        """sniff() callback for live interface capture"""
+        self.stats['total_packets'] += 1
+        self.analyze_packet(pkt)
+    
+    def run_live(self, stream=None, iface=None, bpf_filter=None, follow=None):
+        """Analyze a live pcap stream (e.g. stdin), a growing capture file or an interface
+        until it ends or Ctrl+C"""
+        print(f"[*] Live monitoring: {self.pcap_file} (Ctrl+C to stop)")
+        started = time.perf_counter()
+        try:
+            if stream is not None:
+                self.analyze_records(modbus_decoder.iter_stream_records(stream))
+            elif follow is not None:
+                self.analyze_records(modbus_decoder.follow_records(follow))
+            else:
+                _import_scapy()
+                from scapy.sendrecv import sniff
+                sniff(iface=iface, filter=bpf_filter, prn=self.analyze_live_packet, store=False)
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[!] Error reading live capture: {e}")
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        total = self.stats['total_packets']
+        print(f"\n[+] Processed {total} packets in {elapsed:.1f}s ({total / elapsed:.0f} packets/sec)")
+        
+        self.run_capture_rules()
+        print(f"[+] Analysis complete\n")
+    
+    def report_anomaly(self, anomaly):
+        """Record an anomaly; in live mode it is also printed immediately"""
+        self.anomalies.add(anomaly)
+        if self.live:
+            when = anomaly.time or datetime.now().strftime('%H:%M:%S.%f')[:-3]
+            print(f"[!] ALERT {anomaly.severity} [{when}] {anomaly.description}", flush=True)
+    
     def analyze_packet(self, pkt):
         """Analyze individual Modbus packet"""
         if not pkt.haslayer(TCP):
             return
         
-        # Track source IPs for DoS detection
-        if hasattr(pkt, 'src'):
-            self.source_ips[pkt.src] += 1
+        if self.reassembler is not None:
+            # Reassembly works on raw TCP payloads, so use the fast-path analysis
+            self.analyze_frame(modbus_decoder.frame_from_scapy(pkt))
+            return
+        
+        # Track source IPs and flows for DoS detection
+        frame = modbus_decoder.frame_from_scapy(pkt)
+        self.track_source(frame)
         
-        # Check for Modbus layer
+        # Check for Modbus layer; the ADU bytes go through the same dispatch as the fast path
         if pkt.haslayer(ModbusADURequest):
-            self.stats['modbus_packets'] += 1
-            modbus = pkt[ModbusADURequest]
-            
-            # Function Code 3 = Read Holding Registers
-            if modbus.funcCode == 3:
-                self.stats['read_requests'] += 1
-            
-            # Function Code 6 = Write Single Register
-            elif modbus.funcCode == 6:
-                self.stats['write_requests'] += 1
-                register = modbus.registerAddr if hasattr(modbus, 'registerAddr') else 'unknown'
-                value = modbus.registerValue if hasattr(modbus, 'registerValue') else 0
-                
-                self.write_operations[register] += 1
-                
-                # Check for out-of-range writes
-                self.check_write_anomaly(register, value, pkt)
+            self.analyze_adu(frame, frame.payload, True)
         
         # Check responses for out-of-range sensor values
         elif pkt.haslayer(ModbusADUResponse):
             self.stats['modbus_packets'] += 1
-            self.check_response_values(pkt)
+            self.check_response_values(frame, frame.payload)
+    
+    def analyze_frame(self, frame):
+        """Analyze a TCP segment decoded by the fast path (same rules as analyze_packet)"""
+        self.track_source(frame)
+        
+        payload = frame.payload
+        if not payload:
+            return
+        
+        if frame.dport == modbus_decoder.MODBUS_PORT:
+            is_request = True
+        elif frame.sport == modbus_decoder.MODBUS_PORT:
+            is_request = False
+        else:
+            return
+        
+        if self.reassembler is None:
+            self.analyze_adu(frame, payload, is_request)
+        else:
+            for adu in self.reassembler.feed(frame):
+                self.analyze_adu(frame, adu, is_request)
+    
+    def track_source(self, frame):
+        """Count a TCP segment for its source IP (heavy hitters) and its flow"""
+        src = frame.src_ip
+        self.source_ips.add(src)
+        self.flows.add((src, frame.sport, frame.dst_ip, frame.dport), frame.time, len(frame.payload))
+        if self.source_rates is not None:
+            self.track_packet_rate(src, frame.time)
+    
+    def analyze_adu(self, frame, adu, is_request):
+        """Analyze one Modbus ADU (MBAP header + PDU)"""
+        self.stats['modbus_packets'] += 1
+        if not is_request:
+            self.check_response_values(frame, adu)
+            return
+        
+        self.track_request(frame, adu)
+        if len(adu) < modbus_decoder.MBAP_SIZE:
+            return
+        if self.timing is not None:
+            self.track_timing(frame, adu)
+        handler = self.request_handlers.get(adu[7])
+        if handler is not None:
+            handler(frame, adu)
+    
+    def handle_read(self, frame, adu):
+        """FC3 Read Holding Registers (values are checked in the response)"""
+        self.stats['read_requests'] += 1
+    
+    def handle_write_register(self, frame, adu):
+        """FC6 Write Single Register"""
+        self.stats['write_requests'] += 1
+        if len(adu) >= 12:
+            register, value = modbus_decoder.REGISTER_PAIR.unpack_from(adu, 8)
+        else:
+            register, value = 'unknown', 0
+        self.write_operations[register] += 1
+        if self.write_rates is not None:
+            self.track_write_rate(frame.src_ip, register, frame.time)
+        self.check_write_anomaly(register, value, frame.time, adu[6], frame.src_ip, frame.dst_ip)
     
-    def check_write_anomaly(self, register, value, pkt):
+    def handle_write_block(self, frame, adu):
+        """FC5/FC15 coil writes, FC16 Write Multiple Registers, FC23 Read/Write Multiple Registers"""
+        self.stats['write_requests'] += 1
+        decoded = modbus_decoder.decode_write(adu)
+        if decoded is None:
+            return
+        start, values = decoded
+        coil = adu[7] in modbus_decoder.COIL_WRITE_CODES
+        write_operations = self.write_operations
+        if coil:
+            for address in range(start, start + len(values)):
+                write_operations[f"coil {address}"] += 1
+        else:
+            for register in range(start, start + len(values)):
+                write_operations[register] += 1
+        if self.write_rates is not None:
+            # One request: counted once, against its first address
+            self.track_write_rate(frame.src_ip, f"coil {start}" if coil else start, frame.time)
+        self.check_write_block(start, values, frame.time, adu[6], frame.src_ip, frame.dst_ip, coil)
+    
+    def analyze_events(self, events):
+        """Evaluate the write and reading rules as vectorized masks over a columnar event table"""
+        import numpy as np
+        from modbus_events import NO_VALUE
+        
+        self.stats['total_packets'] += events.total_packets
+        adus = ~events.continuation
+        self.stats['modbus_packets'] += int(np.count_nonzero(adus))
+        for src, count in events.source_counts.items():
+            self.source_ips.add(src, count)
+        for key, counters in sorted(events.flow_counts.items(), key=lambda item: item[1][0]):
+            self.flows.add_flow(key, *counters)
+        self.flows.settle()
+        
+        func_code = events.func_code
+        requests = events.is_request
+        self.stats['read_requests'] += int(np.count_nonzero(
+            requests & (func_code == modbus_decoder.FC_READ_HOLDING_REGISTERS)))
+        write_requests = requests & np.isin(func_code, modbus_decoder.WRITE_CODES)
+        self.stats['write_requests'] += int(np.count_nonzero(write_requests & adus))
+        
+        # One row per written value (a block write that could not be decoded has none)
+        register = events.register
+        value = events.value
+        writes = write_requests & ((func_code == modbus_decoder.FC_WRITE_SINGLE_REGISTER) | (value != NO_VALUE))
+        coils = writes & np.isin(func_code, modbus_decoder.COIL_WRITE_CODES)
+        writes &= ~coils
+        registers, counts = np.unique(register[writes], return_counts=True)
+        for reg, count in zip(registers.tolist(), counts.tolist()):
+            # A truncated FC6 carries no register: counted as 'unknown', like the per-packet path
+            self.write_operations['unknown' if reg == NO_VALUE else reg] += count
+        registers, counts = np.unique(register[coils], return_counts=True)
+        for reg, count in zip(registers.tolist(), counts.tolist()):
+            self.write_operations[f"coil {reg}"] += count
+        
+        unit_id = events.unit_id
+        started = time.perf_counter()
+        hits = writes & self.register_map.violation_mask(unit_id, register, value)
+        if self.register_map.coil_default or self.register_map.coil_units:
+            hits |= coils & self.register_map.violation_mask(unit_id, register, value, coils=True)
+        if self.baseline is not None:
+            rows = np.flatnonzero(writes)
+            hits[rows] |= self.baseline.deviation_mask(events.dst_ip[rows], unit_id[rows], register[rows],
+                                                       value[rows], events.addresses)
+        if self.metrics is not None:
+            self.metrics.add_rule_time('write_range_vectorized', time.perf_counter() - started,
+                                       int(np.count_nonzero(writes | coils)))
+            self.metrics.count_function_codes(func_code[requests & adus])
+        
+        # Responses: matched to their requests in capture order (the transaction table of the
+        # per-packet engines), then the register values they returned are range-checked at once
+        read_rows, read_registers, read_units, read_values = self.match_responses(events, adus)
+        started = time.perf_counter()
+        reading_hits = self.register_map.violation_mask(read_units, read_registers, read_values, readings=True)
+        if self.baseline is not None:
+            reading_hits |= self.baseline.deviation_mask(events.src_ip[read_rows], read_units, read_registers,
+                                                         read_values, events.addresses)
+        if self.metrics is not None:
+            self.metrics.add_rule_time('reading_range_vectorized', time.perf_counter() - started,
+                                       len(read_values))
+        
+        # Request timing: per-stream cadences over all requests at once
+        timing = []
+        if self.timing is not None:
+            started = time.perf_counter()
+            rows = np.flatnonzero(requests & adus)
+            timing = self.track_timing_events(events, rows)
+            if self.metrics is not None:
+                self.metrics.add_rule_time('timing_vectorized', time.perf_counter() - started, len(rows))
+        
+        # Only the (rare) hits are turned into anomaly records, in capture order with the timing
+        # findings (a request's timing before its writes, as in the per-packet engines)
+        timing_findings = ((i, self.report_timing, (kind, stream, measured, float(events.time[i])))
+                           for i, kind, stream, measured in timing)
+        write_findings = ((i, self.check_write_anomaly,
+                           (int(register[i]), int(value[i]), float(events.time[i]), int(unit_id[i]),
+                            events.address(int(events.src_ip[i])), events.address(int(events.dst_ip[i])),
+                            bool(coils[i])))
+                          for i in np.flatnonzero(hits).tolist())
+        reading_findings = ((int(read_rows[j]), self.check_reading,
+                             (int(read_registers[j]), int(read_values[j]), float(events.time[read_rows[j]]),
+                              int(read_units[j]), events.address(int(events.src_ip[read_rows[j]]))))
+                            for j in np.flatnonzero(reading_hits).tolist())
+        for _, check, args in heapq.merge(timing_findings, write_findings, reading_findings,
+                                          key=lambda item: item[0]):
+            check(*args)
+    
+    def match_responses(self, events, adus):
+        """Feed an event table's requests and responses through the transaction table.
+        
+        Returns (rows, registers, unit IDs, values) of the register values
+        returned by matched FC3/FC23 responses, addressed from their requests
+        as check_response_values() does.
+        """
+        import numpy as np
+        
+        rows = np.flatnonzero(adus)
+        ips = np.array(events.addresses, dtype=object)
+        columns = zip(rows.tolist(), events.is_request[rows].tolist(), events.time[rows].tolist(),
+                      ips[events.src_ip[rows]].tolist(), events.sport[rows].tolist(),
+                      ips[events.dst_ip[rows]].tolist(), events.dport[rows].tolist(),
+                      events.trans_id[rows].tolist(), events.unit_id[rows].tolist(),
+                      events.func_code[rows].tolist(), events.read_start[rows].tolist(),
+                      events.read_quantity[rows].tolist())
+        add_request = self.transactions.add_request
+        match_response = self.transactions.match_response
+        read_codes = modbus_decoder.REGISTER_READ_CODES
+        starts = np.zeros(len(events), dtype=np.int64)
+        quantities = np.zeros(len(events), dtype=np.int64)
+        units = np.zeros(len(events), dtype=np.uint8)
+        for row, is_request, ts, src, sport, dst, dport, trans_id, unit_id, func_code, start, quantity in columns:
+            if is_request:
+                add_request((src, sport), (dst, dport), trans_id,
+                            PendingRequest(ts, unit_id, func_code, start, quantity))
+                continue
+            request = match_response((dst, dport), (src, sport), trans_id, ts)
+            if request is not None and func_code == request.func_code and func_code in read_codes:
+                starts[row] = request.start
+                quantities[row] = request.count
+                units[row] = request.unit_id
+        
+        # Each response's values are consecutive in events.readings; a value's offset in its
+        # response gives its register, and values beyond the requested quantity are ignored
+        counts = events.reading_count.astype(np.int64)
+        read_rows = np.repeat(np.arange(len(events)), counts)
+        offset = np.arange(len(read_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        keep = offset < quantities[read_rows]
+        read_rows = read_rows[keep]
+        return (read_rows, starts[read_rows] + offset[keep], units[read_rows],
+                events.readings[keep].astype(np.int64))
+    
+    def check_write_anomaly(self, register, value, timestamp, unit_id=None, source=None, plc=None,
+                            coil=False):
         """Detect suspicious write operations"""
-        anomaly = None
-        timestamp = datetime.fromtimestamp(float(pkt.time)).strftime('%H:%M:%S.%f')[:-3]
-        
-        if register == 0:  # Temperature register
-            min_val, max_val = NORMAL_RANGES['temperature']
-            if value < min_val or value > max_val:
-                anomaly = {
-                    'type': 'OUT_OF_RANGE_WRITE',
-                    'severity': 'CRITICAL',
-                    'time': timestamp,
-                    'register': 'Temperature',
-                    'value': value / 10.0,
-                    'expected_range': f"{min_val/10.0}-{max_val/10.0}°C",
-                    'description': f"Dangerous temperature value written: {value/10.0}°C"
-                }
-        
-        elif register == 1:  # Pressure register
-            min_val, max_val = NORMAL_RANGES['pressure']
-            if value < min_val or value > max_val:
-                anomaly = {
-                    'type': 'OUT_OF_RANGE_WRITE',
-                    'severity': 'CRITICAL',
-                    'time': timestamp,
-                    'register': 'Pressure',
-                    'value': value,
-                    'expected_range': f"{min_val}-{max_val} PSI",
-                    'description': f"Dangerous pressure value written: {value} PSI"
-                }
-        
-        elif register == 2:  # Motor speed register
-            if value == 0:
-                anomaly = {
-                    'type': 'MOTOR_SHUTDOWN',
-                    'severity': 'HIGH',
-                    'time': timestamp,
-                    'register': 'Motor Speed',
-                    'value': value,
-                    'description': "Motor shutdown detected (speed set to 0)"
-                }
-            elif value < NORMAL_RANGES['motor_speed'][0] or value > NORMAL_RANGES['motor_speed'][1]:
-                anomaly = {
-                    'type': 'OUT_OF_RANGE_WRITE',
-                    'severity': 'MEDIUM',
-                    'time': timestamp,
-                    'register': 'Motor Speed',
-                    'value': value,
-                    'expected_range': f"{NORMAL_RANGES['motor_speed'][0]}-{NORMAL_RANGES['motor_speed'][1]} RPM",
-                    'description': f"Abnormal motor speed written: {value} RPM"
-                }
-        
-        elif register == 3:  # Safety valve register
-            if value == 1:
-                anomaly = {
-                    'type': 'UNAUTHORIZED_VALVE_OPERATION',
-                    'severity': 'CRITICAL',
-                    'time': timestamp,
-                    'register': 'Safety Valve',
-                    'value': value,
-                    'description': "Safety valve opened - potential unauthorized access"
-                }
-        
-        if anomaly:
-            self.anomalies.append(anomaly)
-            self.stats['out_of_range_values'] += 1
-    
-    def check_response_values(self, pkt):
+        if not isinstance(register, int):
+            return
+        
+        # One direct-indexed lookup, however many registers are configured
+        if coil:
+            rule = self.register_map.lookup_coil(unit_id, register)
+        else:
+            rule = self.register_map.lookup(unit_id, register)
+        hit = rule.check(value) if rule is not None else None
+        if hit is None:
+            if self.baseline is not None and not coil:
+                self.check_baseline(plc, unit_id, register, value, timestamp, source, rule, 'write')
+            return
+        self.report_write(rule, hit, timestamp, source)
+    
+    def check_write_block(self, start, values, timestamp, unit_id=None, source=None, plc=None, coil=False):
+        """Range-check a multi-value write in one pass over its values"""
+        hits = self.register_map.check_block(unit_id, start, values, coil)
+        for _, rule, hit in hits:
+            self.report_write(rule, hit, timestamp, source)
+        if self.baseline is not None and not coil:
+            flagged = {address for address, _, _ in hits}
+            for register, value in enumerate(values, start):
+                if register not in flagged:
+                    self.check_baseline(plc, unit_id, register, value, timestamp, source,
+                                        self.register_map.lookup(unit_id, register), 'write')
+    
+    def report_write(self, rule, hit, timestamp, source):
+        kind, severity, description, shown_value, expected_range = hit
+        self.report_anomaly(Anomaly(kind, severity, description, timestamp, source=source,
+                                    register=rule.name, value=shown_value,
+                                    expected_range=expected_range))
+        self.stats['out_of_range_values'] += 1
+    
+    def track_request(self, frame, adu):
+        """Remember a request so its response can be matched by transaction ID"""
+        if len(adu) < modbus_decoder.MBAP_SIZE:
+            return
+        trans_id, _, _, unit_id, func_code = modbus_decoder.MBAP.unpack_from(adu)
+        start = count = 0
+        if func_code in modbus_decoder.REGISTER_READ_CODES and len(adu) >= 12:
+            start, count = modbus_decoder.REGISTER_PAIR.unpack_from(adu, 8)
+        self.transactions.add_request((frame.src_ip, frame.sport), (frame.dst_ip, frame.dport),
+                                      trans_id, PendingRequest(frame.time, unit_id, func_code, start, count))
+    
+    def check_response_values(self, frame, adu):
         """Check response packets for out-of-range sensor readings"""
-        # This would require deeper packet parsing
-        # For now, we focus on write detection
-        pass
+        if len(adu) < modbus_decoder.MBAP_SIZE:
+            return
+        trans_id, _, _, _, func_code = modbus_decoder.MBAP.unpack_from(adu)
+        request = self.transactions.match_response((frame.dst_ip, frame.dport),
+                                                   (frame.src_ip, frame.sport), trans_id, frame.time)
+        
+        # Only successful FC3 (and FC23 read/write) responses carry register values
+        if (request is None or func_code != request.func_code
+                or func_code not in modbus_decoder.REGISTER_READ_CODES or len(adu) < 9):
+            return
+        count = min(adu[8] // 2, request.count, (len(adu) - 9) // 2)
+        if not count:
+            return
+        values = struct.unpack_from(f'>{count}H', adu, 9)
+        for offset, value in enumerate(values):
+            self.check_reading(request.start + offset, value, frame.time, request.unit_id, frame.src_ip)
+    
+    def check_reading(self, register, value, timestamp, unit_id=None, source=None):
+        """Detect spoofed or abnormal sensor values returned by the PLC (source)"""
+        rule = self.register_map.lookup(unit_id, register)
+        hit = rule.check_reading(value) if rule is not None else None
+        if hit is None:
+            if self.baseline is not None:
+                self.check_baseline(source, unit_id, register, value, timestamp, source, rule, 'reading')
+            return
+        
+        kind, severity, description, shown_value, expected_range = hit
+        self.report_anomaly(Anomaly(kind, severity, description, timestamp, source=source,
+                                    register=rule.name, value=shown_value,
+                                    expected_range=expected_range))
+        self.stats['out_of_range_values'] += 1
+    
+    def check_baseline(self, plc, unit_id, register, value, timestamp, source=None, rule=None,
+                       operation='write'):
+        """Learn a value that passed the register rules, or flag one outside its learned band"""
+        if self.learn_baseline:
+            self.baseline.observe(plc, unit_id, register, value)
+            return
+        band = self.baseline.bands.get((plc, unit_id, register))
+        if band is None or band.low <= value <= band.high:
+            return
+        
+        if rule is not None:
+            name, unit, display = rule.name, rule.unit, rule.display
+        else:
+            name, unit, display = f"Register {register}", '', lambda raw: raw
+        deviation = band.deviation(value)
+        sigma = f", {deviation:+.1f}σ" if deviation is not None else ""
+        shown = display(value)
+        low, high = (display(round(bound) if bound.is_integer() else round(bound, 1))
+                     for bound in (band.low, band.high))
+        expected_range = f"{low}-{with_unit(high, unit)}"
+        self.report_anomaly(Anomaly(
+            'BASELINE_DEVIATION', 'MEDIUM',
+            f"{name} {operation} outside learned baseline on {plc} unit {unit_id}: "
+            f"{with_unit(shown, unit)} (normal {expected_range}{sigma})",
+            timestamp, source=source, register=name, value=shown, expected_range=expected_range))
+        self.stats['out_of_range_values'] += 1
+    
+    def track_packet_rate(self, src, timestamp):
+        """Flag a source whose packet rate over the window exceeds DOS_RATE_THRESHOLD"""
+        count = self.source_rates.add(src, timestamp)
+        if count is not None:
+            window = self.rate_window
+            self.report_anomaly(Anomaly(
+                'DOS_RATE', 'HIGH',
+                f"Traffic burst from {src}: {count} packets in {window}s "
+                f"({count / window:.1f}/s, threshold: {DOS_RATE_THRESHOLD}/s)",
+                timestamp, source=src, count=count))
+    
+    def track_write_rate(self, src, register, timestamp):
+        """Flag write floods per source and per register over the window"""
+        window = self.rate_window
+        count = self.write_rates.add(src, timestamp)
+        if count is not None:
+            self.stats['suspicious_writes'] += count
+            self.report_anomaly(Anomaly(
+                'WRITE_FLOOD', 'MEDIUM',
+                f"Write flood from {src}: {count} writes in {window}s "
+                f"({count / window:.1f}/s, threshold: {WRITE_RATE_THRESHOLD}/s)",
+                timestamp, source=src, count=count))
+        count = self.register_rates.add(register, timestamp)
+        if count is not None:
+            self.report_anomaly(Anomaly(
+                'REGISTER_WRITE_FLOOD', 'MEDIUM',
+                f"Write flood on register {register}: {count} writes in {window}s "
+                f"({count / window:.1f}/s, threshold: {WRITE_RATE_THRESHOLD}/s)",
+                timestamp, register=register, count=count))
+    
+    def track_timing(self, frame, adu):
+        """Check a request against the learned cadence of its stream"""
+        src, plc = frame.src_ip, frame.dst_ip
+        stream = (src, plc, adu[6], adu[7])
+        for kind, value in self.timing.observe(stream, (src, plc), frame.time):
+            self.report_timing(kind, stream, value, frame.time)
+    
+    def track_timing_events(self, events, rows):
+        """track_timing() over the request rows of an event table at once; findings by row"""
+        import numpy as np
+        hosts = len(events.addresses)
+        pairs = events.src_ip[rows].astype(np.int64) * hosts + events.dst_ip[rows]
+        streams = (pairs * 256 + events.unit_id[rows]) * 256 + events.func_code[rows]
+        
+        def pair_key(code):
+            src, plc = divmod(code, hosts)
+            return events.address(src), events.address(plc)
+        
+        def stream_key(code):
+            code, func_code = divmod(code, 256)
+            code, unit_id = divmod(code, 256)
+            return pair_key(code) + (unit_id, func_code)
+        
+        findings = self.timing.observe_batch(events.time[rows], streams, pairs, stream_key, pair_key)
+        return [(int(rows[row]), kind, stream, value) for row, kind, stream, value in findings]
+    
+    def report_timing(self, kind, stream, value, timestamp):
+        src, plc, unit_id, func_code = stream
+        target = f"{src} -> {plc} unit {unit_id} FC{func_code}"
+        if kind == 'NEW_TALKER':
+            description = f"New talker {target}: first request {value:.1f}s into the traffic"
+        elif kind == 'CADENCE_BREAK':
+            period = self.timing.streams[stream].period
+            description = (f"Polling cadence break {target}: request {value:.3f}s after the previous one "
+                           f"({'early' if value < period else 'late'}, polled every {period:.3f}s)")
+        else:
+            cadence = self.timing.streams[stream]
+            description = (f"Polling jitter spike {target}: {value * 1000:.1f} ms mean deviation over "
+                           f"{JITTER_WINDOW} requests (learned {cadence.mad * 1000:.1f} ms, "
+                           f"polled every {cadence.period:.3f}s)")
+        self.report_anomaly(Anomaly(kind, 'MEDIUM', description, timestamp, source=src))
+    
+    def run_capture_rules(self):
+        """Rules that need the whole capture (skipped when sliding windows are used)"""
+        if self.rate_window:
+            return
+        self.detect_dos()
+        self.detect_excessive_writes()
     
     def detect_dos(self):
         """Detect potential DoS attacks based on traffic patterns"""
-        for src_ip, count in self.source_ips.items():
-            if count > DOS_THRESHOLD:
-                anomaly = {
-                    'type': 'POTENTIAL_DOS',
-                    'severity': 'HIGH',
-                    'source': src_ip,
-                    'packet_count': count,
-                    'description': f"Excessive traffic from {src_ip}: {count} packets (threshold: {DOS_THRESHOLD})"
-                }
-                self.anomalies.append(anomaly)
+        for src_ip, count, error in self.source_ips.items():
+            # Only sources certain to be over the threshold (counts are upper bounds)
+            if count - error > DOS_THRESHOLD:
+                packets = f"{count} packets" if not error else f"at least {count - error} packets"
+                busiest = self.flows.top(1, src_ip)
+                flow = f", busiest flow {format_flow(busiest[0][0])}" if busiest else ""
+                self.report_anomaly(Anomaly(
+                    'POTENTIAL_DOS', 'HIGH',
+                    f"Excessive traffic from {src_ip}: {packets} (threshold: {DOS_THRESHOLD}){flow}",
+                    source=src_ip, count=count - error))
     
     def detect_excessive_writes(self):
         """Detect excessive write operations"""
         total_writes = sum(self.write_operations.values())
         if total_writes > WRITE_THRESHOLD:
             self.stats['suspicious_writes'] = total_writes
-            anomaly = {
-                'type': 'EXCESSIVE_WRITES',
-                'severity': 'MEDIUM',
-                'write_count': total_writes,
-                'description': f"Excessive write operations detected: {total_writes} writes (threshold: {WRITE_THRESHOLD})"
-            }
-            self.anomalies.append(anomaly)
+            self.report_anomaly(Anomaly(
+                'EXCESSIVE_WRITES', 'MEDIUM',
+                f"Excessive write operations detected: {total_writes} writes (threshold: {WRITE_THRESHOLD})",
+                count=total_writes))
+    
+    def analyze_packets(self):
+        """Run the per-packet rules over the whole capture"""
+        if self.batch:
+            self.analyze_events(self.events)
+        elif self.engine == 'fast':
+            self.analyze_fast()
+        else:
+            packets = self.iter_packets() if self.stream else self.packets
+            for pkt in packets:
+                self.analyze_packet(pkt)
     
     def analyze(self):
         """Run full analysis on pcap"""
         print("\n[*] Analyzing Modbus traffic...")
         
-        for pkt in self.packets:
-            self.analyze_packet(pkt)
+        if self.cached_state is not None:
+            self.merge_state(self.cached_state)
+        else:
+            self.analyze_packets()
+            if self.cache is not None:
+                self.store_cached_state()
+            
+            if self.stream or self.engine == 'fast':
+                print(f"[+] Streamed {self.stats['total_packets']} packets")
         
         # Run additional detection rules
-        self.detect_dos()
-        self.detect_excessive_writes()
+        self.run_capture_rules()
         
         print(f"[+] Analysis complete\n")
     
+    def partial_state(self, final=True):
+        """Per-packet results of this detector, before the capture-wide rules run.
+        
+        final: the traffic ran to the end of its capture, so requests still
+        pending are counted as unanswered (otherwise the next piece re-tracks them).
+        """
+        transactions = dict(self.transactions.stats)
+        if final:
+            transactions['expired_requests'] += len(self.transactions)
+        return {
+            'stats': dict(self.stats),
+            'source_ips': self.source_ips,
+            'flows': self.flows,
+            'write_operations': dict(self.write_operations),
+            'anomalies': self.anomalies,
+            'latency': self.transactions.latency,
+            'transactions': transactions,
+            'metrics': self.metrics,
+            'timing': self.timing,
+        }
+    
+    def merge_state(self, state):
+        """Add the partial state of a later piece of traffic to this detector"""
+        for key, value in state['stats'].items():
+            self.stats[key] += value
+        self.source_ips.merge(state['source_ips'])
+        self.flows.merge(state['flows'])
+        for register, count in state['write_operations'].items():
+            self.write_operations[register] += count
+        self.anomalies.merge(state['anomalies'])
+        for plc, histogram in state['latency'].items():
+            self.transactions.latency.setdefault(plc, LatencyHistogram()).merge(histogram)
+        for key, value in state['transactions'].items():
+            self.transactions.stats[key] += value
+        if self.metrics is not None and state['metrics'] is not None:
+            self.metrics.merge(state['metrics'])
+        if state['timing'] is not None:
+            # Cadences need every request in order, so timing only comes from a whole capture
+            self.timing = state['timing']
+    
+    def checkpoint_state(self):
+        """Everything a later capture of the same series needs to continue this analysis"""
+        return {name: getattr(self, name) for name in CHECKPOINT_ATTRIBUTES}
+    
+    def restore_checkpoint(self, state):
+        """Continue from checkpoint_state() of an earlier run (alerts already written stay written)"""
+        sink = self.anomalies.sink
+        for name in CHECKPOINT_ATTRIBUTES:
+            setattr(self, name, state[name])
+        self.anomalies.sink = sink
+    
     def print_report(self):
         """Generate and print security report"""
         print("=" * 80)
@@ -210,33 +956,70 @@ class ModbusAnomalyDetector:
         print(f"  Read Operations: {self.stats['read_requests']}")
         print(f"  Write Operations: {self.stats['write_requests']}")
         
+        if self.source_ips:
+            print("\n[TOP TALKERS]")
+            approximate = "" if self.source_ips.exact else (
+                f" (approximate: more than {self.source_ips.capacity} sources seen)")
+            print(f"  Sources:{approximate}")
+            for src, count, error in self.source_ips.top(TOP_TALKERS):
+                print(f"    {src}: {count} packets" + (f" (±{error})" if error else ""))
+            evicted = f", {self.flows.evicted} evicted" if self.flows.evicted else ""
+            print(f"  Flows: {len(self.flows)} tracked{evicted}")
+            for key, flow in self.flows.top(TOP_TALKERS):
+                print(f"    {format_flow(key)}: {flow.packets} packets, {flow.bytes} bytes")
+        
+        if self.timing is not None and self.timing.streams:
+            print("\n[REQUEST TIMING]")
+            periodic = self.timing.periodic_streams()
+            learning = sum(cadence.periodic is None for cadence in self.timing.streams.values())
+            untracked = f", {self.timing.untracked} requests untracked" if self.timing.untracked else ""
+            print(f"  Request Streams: {len(self.timing)} tracked, {len(periodic)} periodic, "
+                  f"{learning} still learning{untracked}")
+            for (src, plc, unit_id, func_code), cadence in periodic[:TOP_TALKERS]:
+                print(f"    {src} -> {plc} unit {unit_id} FC{func_code}: every {cadence.period:.3f}s "
+                      f"(±{cadence.mad * 1000:.1f} ms)")
+        
+        if self.transactions.latency:
+            print("\n[PLC RESPONSE LATENCY]")
+            for plc, histogram in sorted(self.transactions.latency.items()):
+                print(f"  {plc}: {histogram.count} responses, "
+                      f"p50 {histogram.percentile(50) * 1000:.2f} ms, "
+                      f"p99 {histogram.percentile(99) * 1000:.2f} ms, "
+                      f"p99.9 {histogram.percentile(99.9) * 1000:.2f} ms")
+            print(f"  Unanswered Requests: {self.transactions.stats['expired_requests'] + len(self.transactions)}")
+        
         print("\n[SECURITY FINDINGS]")
         if not self.anomalies:
             print("  ✓ No anomalies detected - Traffic appears normal")
         else:
             print(f"  ⚠ {len(self.anomalies)} ANOMALIES DETECTED\n")
             
-            # Group by severity
-            critical = [a for a in self.anomalies if a.get('severity') == 'CRITICAL']
-            high = [a for a in self.anomalies if a.get('severity') == 'HIGH']
-            medium = [a for a in self.anomalies if a.get('severity') == 'MEDIUM']
+            # Group by severity (one pass; counts include records no longer kept)
+            groups = self.anomalies.by_severity()
+            counts = self.anomalies.severity_counts
             
-            if critical:
-                print(f"  🔴 CRITICAL ({len(critical)}):")
-                for anomaly in critical:
-                    print(f"     [{anomaly.get('time', 'N/A')}] {anomaly['description']}")
-                    if 'register' in anomaly:
-                        print(f"        Register: {anomaly['register']}, Value: {anomaly['value']}")
+            if counts['CRITICAL']:
+                print(f"  🔴 CRITICAL ({counts['CRITICAL']}):")
+                for entry in groups['CRITICAL']:
+                    anomaly = entry.first if isinstance(entry, AnomalySummary) else entry
+                    print(f"     [{anomaly.time or 'N/A'}] {anomaly.description}{_repeats(entry)}")
+                    if anomaly.register is not None:
+                        print(f"        Register: {anomaly.register}, Value: {anomaly.value}")
+                _print_omitted(counts['CRITICAL'], groups['CRITICAL'])
             
-            if high:
-                print(f"\n  🟠 HIGH ({len(high)}):")
-                for anomaly in high:
-                    print(f"     {anomaly['description']}")
+            if counts['HIGH']:
+                print(f"\n  🟠 HIGH ({counts['HIGH']}):")
+                for entry in groups['HIGH']:
+                    anomaly = entry.first if isinstance(entry, AnomalySummary) else entry
+                    print(f"     {anomaly.description}{_repeats(entry)}")
+                _print_omitted(counts['HIGH'], groups['HIGH'])
             
-            if medium:
-                print(f"\n  🟡 MEDIUM ({len(medium)}):")
-                for anomaly in medium:
-                    print(f"     {anomaly['description']}")
+            if counts['MEDIUM']:
+                print(f"\n  🟡 MEDIUM ({counts['MEDIUM']}):")
+                for entry in groups['MEDIUM']:
+                    anomaly = entry.first if isinstance(entry, AnomalySummary) else entry
+                    print(f"     {anomaly.description}{_repeats(entry)}")
+                _print_omitted(counts['MEDIUM'], groups['MEDIUM'])
         
         print("\n" + "=" * 80)
         print("RECOMMENDATIONS:")
@@ -251,18 +1034,393 @@ class ModbusAnomalyDetector:
             print("  • Maintain baseline traffic patterns")
         print("=" * 80 + "\n")
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python3 detect_anomalies.py <pcap_file>")
-        print("Example: python3 detect_anomalies.py ../captures/attack_traffic.pcap")
+def _repeats(entry):
+    """Report suffix for an aggregated entry: occurrence count and time span"""
+    if not isinstance(entry, AnomalySummary) or entry.count == 1:
+        return ""
+    first = entry.first.time
+    if first is None:
+        return f" (x{entry.count})"
+    last = datetime.fromtimestamp(entry.last_timestamp).strftime('%H:%M:%S.%f')[:-3]
+    return f" (x{entry.count}, {first} - {last})"
+
+
+def _print_omitted(count, shown):
+    occurrences = sum(e.count if isinstance(e, AnomalySummary) else 1 for e in shown)
+    if occurrences < count:
+        print(f"     ... {count - occurrences} more not kept in memory")
+
+
+def _analyze_piece(job):
+    """Process-pool worker: per-packet analysis of one capture or byte range"""
+    pcap_file, byte_range, earlier, options, profile = job
+    metrics = PipelineMetrics() if profile else None
+    detector = ModbusAnomalyDetector(pcap_file, stream=True, byte_range=byte_range,
+                                     metrics=metrics, **options)
+    if earlier and detector.reassembler is None:
+        detector.resume_transactions(earlier)
+    if detector.batch:
+        if metrics is not None:
+            with metrics.stage('load'):
+                detector.load_events()
+        else:
+            detector.load_events()
+    detector.analyze_packets()
+    if metrics is not None:
+        metrics.sample_memory()
+    end = byte_range[1]
+    return detector.partial_state(final=end is None or end >= os.path.getsize(pcap_file))
+
+
+def find_captures(paths):
+    """Expand directories into the capture files they contain (sorted by name)"""
+    captures = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(CAPTURE_EXTENSIONS):
+                    captures.append(os.path.join(path, name))
+        else:
+            captures.append(path)
+    return captures
+
+
+def plan_pieces(captures, jobs, engine, batch):
+    """Split captures into (capture index, file, byte range) work items in capture order.
+    
+    Captures given as None (already cached) are skipped.
+    """
+    total_size = sum(os.path.getsize(path) for path in captures if path is not None)
+    chunk_size = max(MIN_SPLIT_SIZE, total_size // (jobs * 2))
+    pieces = []
+    for index, path in enumerate(captures):
+        if path is None:
+            continue
+        # Only the mmap-based decoders can start reading in the middle of a file
+        if (engine == 'fast' or batch) and os.path.getsize(path) > chunk_size:
+            with modbus_decoder.MappedCapture(path) as capture:
+                ranges = modbus_decoder.split_records(capture.buffer, chunk_size)
+        else:
+            ranges = [(None, None)]
+        pieces.extend((index, path, byte_range) for byte_range in ranges)
+    return pieces
+
+
+def _piece_states(work, jobs):
+    """Partial states of the work items in order (computed in a pool when jobs > 1)"""
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            yield from pool.map(_analyze_piece, work)
+    else:
+        for job in work:
+            yield _analyze_piece(job)
+
+
+def _merge_pieces(detector, captures, cached, pieces, work, jobs, options):
+    """Merge cached and freshly computed states in capture order.
+    
+    With a cache, each analyzed capture's pieces are also merged into a
+    detector of its own, whose state is stored for the next run.
+    """
+    states = _piece_states(work, jobs)
+    next_piece = 0
+    for index, path in enumerate(captures):
+        if cached[index] is not None:
+            detector.merge_state(cached[index])
+            continue
+        capture = ModbusAnomalyDetector(path, **options) if options['cache'] is not None else None
+        while next_piece < len(pieces) and pieces[next_piece][0] == index:
+            state = next(states)
+            detector.merge_state(state)
+            if capture is not None:
+                capture.merge_state(state)
+            next_piece += 1
+        if capture is not None:
+            capture.store_cached_state()
+
+
+def analyze_captures(captures, jobs, engine='scapy', batch=False, register_map=None,
+                     reassemble=False, metrics=None, aggregate=False, alert_sink=None, cache=None,
+                     baseline=None, learn_baseline=False, max_flows=DEFAULT_MAX_FLOWS,
+                     flow_idle=DEFAULT_FLOW_IDLE, top_sources=DEFAULT_TOP_SOURCES):
+    """Analyze many captures (or pieces of one) in a process pool and merge the results.
+    
+    Pieces are merged in capture order, so the report equals a serial run.
+    A baseline is only learned with jobs=1, where pieces share this process.
+    """
+    flow_options = dict(max_flows=max_flows, flow_idle=flow_idle, top_sources=top_sources)
+    detector = ModbusAnomalyDetector(', '.join(captures), engine=engine, batch=batch,
+                                     register_map=register_map, metrics=metrics,
+                                     aggregate=aggregate, alert_sink=alert_sink, baseline=baseline,
+                                     **flow_options)
+    options = dict(engine=engine, batch=batch, register_map=detector.register_map,
+                   reassemble=reassemble, aggregate=aggregate, cache=cache, baseline=baseline,
+                   learn_baseline=learn_baseline, **flow_options)
+    
+    cached = [None] * len(captures)
+    try:
+        if cache is not None:
+            for index, path in enumerate(captures):
+                cached[index] = ModbusAnomalyDetector(path, **options).load_cached_state()
+        pieces = plan_pieces([path if state is None else None for path, state in zip(captures, cached)],
+                             jobs, engine, batch)
+    except (OSError, ValueError) as e:
+        print(f"[!] Error reading pcap: {e}")
+        sys.exit(1)
+    hits = sum(state is not None for state in cached)
+    print(f"[*] Analyzing {len(captures)} capture(s) as {len(pieces)} piece(s) on {jobs} worker(s)"
+          + (f", {hits} from cache" if hits else ""))
+    
+    # Each piece also gets the starts of the earlier pieces of its capture (see resume_transactions)
+    work = [(path, byte_range, [start for (other, _, (start, _)) in pieces[:position] if other == index],
+             options, metrics is not None)
+            for position, (index, path, byte_range) in enumerate(pieces)]
+    try:
+        if metrics is not None:
+            with metrics.stage('analyze'):
+                _merge_pieces(detector, captures, cached, pieces, work, jobs, options)
+        else:
+            _merge_pieces(detector, captures, cached, pieces, work, jobs, options)
+    except (OSError, ValueError) as e:
+        print(f"[!] Error reading pcap: {e}")
+        sys.exit(1)
+    print(f"[+] Processed {detector.stats['total_packets']} packets")
+    
+    detector.run_capture_rules()
+    print(f"[+] Analysis complete\n")
+    return detector
+
+
+def analyze_rotated(captures, checkpoint_file, **options):
+    """Analyze captures in order as one continuous stream, resuming from a checkpoint.
+    
+    Captures already in the checkpoint are skipped; the checkpoint is saved
+    after each new capture, so an interrupted run loses at most one file.
+    """
+    detector = ModbusAnomalyDetector(', '.join(captures), anomaly_history=CHECKPOINT_ANOMALY_HISTORY,
+                                     **options)
+    try:
+        checkpoint = Checkpoint.load(checkpoint_file, detector.cache_options())
+    except (OSError, ValueError) as e:
+        print(f"[!] Error loading checkpoint: {e}")
         sys.exit(1)
+    if checkpoint.state is not None:
+        detector.restore_checkpoint(checkpoint.state)
+        print(f"[+] Resumed from {checkpoint_file}: {len(checkpoint.captures)} capture(s), "
+              f"{detector.stats['total_packets']} packets")
+    
+    analyzed = []
+    for path in captures:
+        size = checkpoint.seen(path)
+        if size is not None:
+            if size != os.path.getsize(path):
+                print(f"[!] {path} changed since it was checkpointed (not analyzed again)")
+            continue
+        detector.pcap_file = path
+        detector.load_pcap()
+        detector.analyze_packets()
+        detector.packets = []
+        detector.events = None
+        try:
+            checkpoint.save(path, detector.checkpoint_state())
+        except OSError as e:
+            print(f"[!] Error saving checkpoint: {e}")
+            sys.exit(1)
+        analyzed.append(path)
+    print(f"\n[+] Analyzed {len(analyzed)} new capture(s), "
+          f"{len(checkpoint.captures)} in {checkpoint_file}")
+    
+    detector.pcap_file = ', '.join(analyzed) or checkpoint_file
+    detector.run_capture_rules()
+    print(f"[+] Analysis complete\n")
+    return detector
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyze a pcap file for malicious Modbus activity",
+        epilog="Example: python3 detect_anomalies.py ../captures/attack_traffic.pcap"
+    )
+    parser.add_argument('pcap_file', nargs='*',
+                        help="pcap/pcapng capture(s) to analyze; directories are expanded, "
+                             "'-' reads a live pcap stream from stdin (tcpdump -U -w -)")
+    parser.add_argument('--stream', action='store_true',
+                        help="read packets one at a time instead of loading the whole capture")
+    parser.add_argument('--engine', choices=['scapy', 'fast'], default='scapy',
+                        help="packet decoder: full scapy dissection or the struct-based fast path")
+    parser.add_argument('--batch', action='store_true',
+                        help="build a columnar event table and evaluate rules as vectorized masks (needs numpy)")
+    parser.add_argument('--register-map', metavar='FILE',
+                        help="JSON/YAML register map (default: built-in NORMAL_RANGES profile)")
+    parser.add_argument('--jobs', type=int, default=1, metavar='N',
+                        help="analyze captures (split at record boundaries) in N worker processes")
+    parser.add_argument('--rate-window', type=float, metavar='SECONDS',
+                        help="detect DoS/write floods as per-source and per-register rates over a "
+                             "sliding window instead of whole-capture totals")
+    parser.add_argument('--timing', action='store_true',
+                        help="learn each request stream's polling cadence and flag cadence breaks, "
+                             "jitter spikes and new talkers")
+    parser.add_argument('--reassemble', action='store_true',
+                        help="reassemble TCP streams into Modbus ADUs (pipelined and split requests)")
+    parser.add_argument('--follow', action='store_true',
+                        help="follow a capture file that is still being written (tcpdump -U -w FILE) "
+                             "like tail -f, across rotation and truncation")
+    parser.add_argument('--iface', metavar='IFACE',
+                        help="capture live from a network interface (needs root)")
+    parser.add_argument('--bpf', default='tcp port 502', metavar='FILTER',
+                        help="BPF filter for --iface (default: %(default)s)")
+    parser.add_argument('--aggregate', action='store_true',
+                        help="fold repeated anomalies (same type, source and register) into counted summaries")
+    parser.add_argument('--alerts-jsonl', metavar='FILE',
+                        help="write anomalies to FILE as JSON Lines as they are detected")
+    parser.add_argument('--cache', action='store_true',
+                        help="reuse parsed events and per-capture results from an on-disk cache "
+                             "keyed by file content")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, metavar='DIR',
+                        help="cache directory (default: %(default)s, or $ICS_CACHE_DIR)")
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help="treat the captures (e.g. tcpdump -G rotations) as one continuous stream: "
+                             "resume from FILE, skip captures already in it, save it after each capture")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="flag register values outside the bands of a learned baseline profile")
+    parser.add_argument('--learn-baseline', metavar='FILE',
+                        help="learn per-(PLC, unit, register) value bands from this (normal) traffic "
+                             "and save them to FILE; an existing profile is extended")
+    parser.add_argument('--max-flows', type=int, default=DEFAULT_MAX_FLOWS, metavar='N',
+                        help="flows (TCP 5-tuples) tracked at once; the least recently seen "
+                             "are evicted (default: %(default)s)")
+    parser.add_argument('--flow-idle', type=float, default=DEFAULT_FLOW_IDLE, metavar='SECONDS',
+                        help="drop flows idle this long in capture time (default: %(default)s)")
+    parser.add_argument('--top-sources', type=int, default=DEFAULT_TOP_SOURCES, metavar='N',
+                        help="source IPs counted for DoS detection; with more sources, counts "
+                             "are approximate (Space-Saving) (default: %(default)s)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="write per-stage timings, rule costs and counters to FILE "
+                             "(JSON for .json, Prometheus text format otherwise)")
+    args = parser.parse_args()
+    if not args.pcap_file and not args.iface:
+        parser.error("a pcap file, '-' or --iface is required")
+    if args.rate_window and args.batch:
+        parser.error("--rate-window is not supported in --batch mode")
+    if args.reassemble and args.batch:
+        parser.error("--reassemble is not supported in --batch mode")
+    if args.follow:
+        if args.iface or len(args.pcap_file) != 1 or args.pcap_file == ['-']:
+            parser.error("--follow needs exactly one capture file")
+        if args.cache or args.checkpoint or args.jobs > 1:
+            parser.error("--follow cannot be combined with --cache, --checkpoint or --jobs")
+    if args.cache and (args.iface or args.pcap_file == ['-']):
+        parser.error("--cache needs capture files")
+    if args.checkpoint:
+        if args.iface or args.pcap_file == ['-']:
+            parser.error("--checkpoint needs capture files")
+        if args.cache or args.jobs > 1:
+            parser.error("--checkpoint analyzes captures serially (no --cache or --jobs)")
+    if args.learn_baseline:
+        if args.baseline:
+            parser.error("--learn-baseline and --baseline cannot be combined")
+        if args.batch or args.cache or args.jobs > 1:
+            parser.error("--learn-baseline reads one capture at a time (no --batch, --cache or --jobs)")
+    
+    register_map = None
+    if args.register_map:
+        try:
+            register_map = RegisterMap.load(args.register_map)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[!] Error loading register map: {e}")
+            sys.exit(1)
+        print(f"[+] Loaded {len(register_map.rules)} register rules from {args.register_map}")
+    
+    baseline = None
+    if args.baseline or args.learn_baseline:
+        path = args.baseline or args.learn_baseline
+        try:
+            if args.baseline or os.path.exists(path):
+                baseline = BaselineProfile.load(path)
+                print(f"[+] Loaded baseline of {len(baseline)} registers from {path}")
+            else:
+                baseline = BaselineProfile()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[!] Error loading baseline: {e}")
+            sys.exit(1)
+    
+    metrics = PipelineMetrics() if args.metrics else None
+    live = bool(args.iface or args.follow or args.pcap_file == ['-'])
     
-    pcap_file = sys.argv[1]
+    alert_file = alert_sink = None
+    if args.alerts_jsonl:
+        try:
+            # Line buffered in live mode so each alert is visible as soon as it is written
+            alert_file = open(args.alerts_jsonl, 'w', encoding='utf-8', buffering=1 if live else -1)
+        except OSError as e:
+            print(f"[!] Error opening alert log: {e}")
+            sys.exit(1)
+        alert_sink = JsonLinesWriter(alert_file, stamp=live)
+    options = dict(register_map=register_map, metrics=metrics, aggregate=args.aggregate,
+                   alert_sink=alert_sink, baseline=baseline, max_flows=args.max_flows,
+                   flow_idle=args.flow_idle, top_sources=args.top_sources)
+    cache = CaptureCache(args.cache_dir) if args.cache else None
     
-    detector = ModbusAnomalyDetector(pcap_file)
-    detector.load_pcap()
-    detector.analyze()
+    if live:
+        if args.iface:
+            source = f"interface {args.iface}"
+        else:
+            source = args.pcap_file[0] if args.follow else "stdin"
+        detector = ModbusAnomalyDetector(source, live=True, rate_window=args.rate_window,
+                                         timing=args.timing, reassemble=args.reassemble,
+                                         learn_baseline=bool(args.learn_baseline), **options)
+        if args.iface:
+            detector.run_live(iface=args.iface, bpf_filter=args.bpf)
+        elif args.follow:
+            detector.run_live(follow=args.pcap_file[0])
+        else:
+            detector.run_live(stream=sys.stdin.buffer)
+    else:
+        captures = find_captures(args.pcap_file)
+        if args.checkpoint:
+            detector = analyze_rotated(captures, args.checkpoint, stream=args.stream, engine=args.engine,
+                                       batch=args.batch, rate_window=args.rate_window,
+                                       timing=args.timing, reassemble=args.reassemble,
+                                       learn_baseline=bool(args.learn_baseline), **options)
+        elif args.jobs > 1 or len(captures) != 1:
+            if args.rate_window or args.timing:
+                parser.error("--rate-window and --timing need a single capture and --jobs 1")
+            if not captures:
+                print("[!] No capture files found")
+                sys.exit(1)
+            detector = analyze_captures(captures, max(args.jobs, 1), engine=args.engine,
+                                        batch=args.batch, reassemble=args.reassemble,
+                                        cache=cache, learn_baseline=bool(args.learn_baseline), **options)
+        else:
+            detector = ModbusAnomalyDetector(captures[0], stream=args.stream, engine=args.engine,
+                                             batch=args.batch, rate_window=args.rate_window,
+                                             timing=args.timing, reassemble=args.reassemble, cache=cache,
+                                             learn_baseline=bool(args.learn_baseline), **options)
+            detector.load_pcap()
+            detector.analyze()
     detector.print_report()
+    
+    if alert_sink is not None:
+        if args.aggregate:
+            detector.anomalies.write_summaries(alert_sink)
+        alert_file.close()
+        print(f"[+] {alert_sink.written} anomaly records written to {args.alerts_jsonl}")
+    
+    if args.learn_baseline:
+        try:
+            baseline.save(args.learn_baseline)
+        except OSError as e:
+            print(f"[!] Error saving baseline: {e}")
+            sys.exit(1)
+        print(f"[+] Baseline of {len(baseline)} registers saved to {args.learn_baseline}")
+    
+    if metrics is not None:
+        try:
+            metrics.write(args.metrics, detector.stats)
+        except OSError as e:
+            print(f"[!] Error writing metrics: {e}")
+            sys.exit(1)
+        print(f"[+] Metrics written to {args.metrics}")
 
 if __name__ == "__main__":
     main()
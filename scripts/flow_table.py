@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Bounded Flow Accounting
+Per-flow (TCP 5-tuple) packet and byte counters in an LRU table with idle
+expiry, and a Space-Saving heavy-hitter summary of per-source packet counts,
+so memory stays fixed however many hosts (or spoofed sources) appear
+"""
+
+import heapq
+from collections import OrderedDict
+
+DEFAULT_MAX_FLOWS = 65536
+DEFAULT_FLOW_IDLE = 300.0       # seconds without packets before a flow is dropped
+DEFAULT_TOP_SOURCES = 1024
+
+
+class Flow:
+    """Counters of one direction of a TCP connection"""
+
+    __slots__ = ('first', 'last', 'packets', 'bytes')
+
+    def __init__(self, first, last=None, packets=0, bytes=0):
+        self.first = first
+        self.last = last if last is not None else first
+        self.packets = packets
+        self.bytes = bytes
+
+    def __getstate__(self):
+        return (self.first, self.last, self.packets, self.bytes)
+
+    def __setstate__(self, state):
+        self.first, self.last, self.packets, self.bytes = state
+
+
+def _ranked(items, n, count):
+    """The n items with the highest count; ties go by key, so every engine lists the same ones.
+
+    repr() orders keys that hold None (scapy frames without an IP layer) too.
+    """
+    return heapq.nsmallest(n, items, key=lambda item: (-count(item), repr(item[0])))
+
+
+def format_flow(key):
+    """(src IP, src port, dst IP, dst port) -> 'src:port -> dst:port' (IPv6 in brackets)"""
+    src, sport, dst, dport = key
+
+    def endpoint(ip, port):
+        return f"[{ip}]:{port}" if ':' in ip else f"{ip}:{port}"
+    return f"{endpoint(src, sport)} -> {endpoint(dst, dport)}"
+
+
+class FlowTable:
+    """Flows keyed by (src IP, src port, dst IP, dst port), least recently seen first.
+
+    The protocol is always TCP, so it is left out of the key. A new flow
+    evicts the least recently seen one once max_flows are tracked, and flows
+    idle for idle_timeout seconds (capture time) are dropped as new ones
+    arrive; both are O(1) per packet.
+    """
+
+    def __init__(self, max_flows=DEFAULT_MAX_FLOWS, idle_timeout=DEFAULT_FLOW_IDLE):
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.flows = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def add(self, key, timestamp, size):
+        flows = self.flows
+        flow = flows.get(key)
+        if flow is None:
+            flow = flows[key] = Flow(timestamp)
+            self._expire(timestamp)
+        else:
+            flows.move_to_end(key)
+            if timestamp > flow.last:
+                flow.last = timestamp
+        flow.packets += 1
+        flow.bytes += size
+
+    def _expire(self, now):
+        """Drop idle flows from the old end, then the oldest if still over capacity"""
+        flows = self.flows
+        horizon = now - self.idle_timeout
+        while flows:
+            oldest = next(iter(flows.values()))
+            if oldest.last >= horizon:
+                break
+            flows.popitem(last=False)
+            self.evicted += 1
+        while len(flows) > self.max_flows:
+            flows.popitem(last=False)
+            self.evicted += 1
+
+    def add_flow(self, key, first, last, packets, bytes):
+        """Add counters collected elsewhere (a later piece of traffic, a batch table).
+
+        Nothing is evicted here: the result would depend on the order flows
+        are added in. Call settle() once all of them are in.
+        """
+        flow = self.flows.pop(key, None)
+        if flow is None:
+            self.flows[key] = Flow(first, last, packets, bytes)
+            return
+        flow.first = min(flow.first, first)
+        flow.last = max(flow.last, last)
+        flow.packets += packets
+        flow.bytes += bytes
+        self.flows[key] = flow
+
+    def settle(self):
+        """Apply the per-packet table's rules once, after add_flow() calls.
+
+        Flows go back in least-recently-seen order. add() only expires flows
+        when a new flow starts, so flows idle as of the newest flow start are
+        dropped, then the least recently seen ones beyond max_flows. This
+        matches the per-packet table unless flows went idle (or were evicted)
+        and later resumed, which add() counts as new flows.
+        """
+        if not self.flows:
+            return
+        self.flows = OrderedDict(sorted(self.flows.items(), key=lambda item: item[1].last))
+        self._expire(max(flow.first for flow in self.flows.values()))
+
+    def merge(self, other):
+        """Add the flows of a later piece of traffic"""
+        for key, flow in other.flows.items():
+            self.add_flow(key, flow.first, flow.last, flow.packets, flow.bytes)
+        self.evicted += other.evicted
+        self.settle()
+
+    def top(self, n, src=None):
+        """The n flows with the most packets, optionally only those from src"""
+        flows = self.flows.items()
+        if src is not None:
+            flows = [(key, flow) for key, flow in flows if key[0] == src]
+        return _ranked(flows, n, lambda item: item[1].packets)
+
+
+class HeavyHitters:
+    """Space-Saving summary (Metwally et al.) of per-key counts in at most capacity keys.
+
+    Counts are exact until capacity keys have been seen. After that a new key
+    replaces one with the minimum count and inherits that count as its error,
+    so a kept count overestimates the true one by at most error, and every
+    key with more than total/capacity events is kept. Buckets of keys by
+    count make each update O(1).
+    """
+
+    def __init__(self, capacity=DEFAULT_TOP_SOURCES):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self.replaced = 0           # keys evicted to make room
+        self.buckets = None         # count -> set of keys, built when the summary fills up
+        self.min_count = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, key, count=1):
+        self.total += count
+        counts = self.counts
+        current = counts.get(key)
+        if current is not None:
+            counts[key] = current + count
+            if self.buckets is not None:
+                self._move(key, current, current + count)
+            return
+        if len(counts) < self.capacity:
+            # Not full yet (keys are only ever replaced, so there are no buckets either)
+            counts[key] = count
+            return
+
+        if self.buckets is None:
+            self.buckets = {}
+            for name, value in counts.items():
+                self.buckets.setdefault(value, set()).add(name)
+            self.min_count = min(self.buckets)
+        low = self.min_count
+        bucket = self.buckets[low]
+        victim = bucket.pop()
+        if not bucket:
+            del self.buckets[low]
+        del counts[victim]
+        self.errors.pop(victim, None)
+        self.replaced += 1
+        counts[key] = low + count
+        self.errors[key] = low
+        self.buckets.setdefault(low + count, set()).add(key)
+        if low not in self.buckets:
+            self.min_count = low + 1 if count == 1 else min(self.buckets)
+
+    def _move(self, key, old, new):
+        buckets = self.buckets
+        bucket = buckets[old]
+        bucket.discard(key)
+        buckets.setdefault(new, set()).add(key)
+        if not bucket:
+            del buckets[old]
+            if old == self.min_count:
+                # One-event updates raise the minimum by exactly one
+                self.min_count = new if new - old == 1 else min(buckets)
+
+    def items(self):
+        """(key, count, error) for the kept keys; the true count is in [count - error, count]"""
+        errors = self.errors
+        return [(key, count, errors.get(key, 0)) for key, count in self.counts.items()]
+
+    def top(self, n):
+        return _ranked(self.items(), n, lambda item: item[1])
+
+    @property
+    def exact(self):
+        return self.replaced == 0
+
+    def merge(self, other):
+        """Add another summary's counts (errors add up)"""
+        for key, count, error in other.items():
+            self.add(key, count)
+            if error:
+                self.errors[key] = self.errors.get(key, 0) + error
+        # Events of keys the other summary already dropped are still part of the total
+        self.total += other.total - sum(other.counts.values())
+        self.replaced += other.replaced
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Modbus/TCP Stream Reassembly
+Re-frames MBAP ADUs from TCP segments using the MBAP length field, so
+pipelined requests (several ADUs per segment) and ADUs split across
+segments are all seen by the detector
+"""
+
+import struct
+from collections import OrderedDict
+
+MBAP_HEADER_SIZE = 6        # transaction ID, protocol ID, length
+MIN_MBAP_LENGTH = 2         # unit ID + function code
+MAX_MBAP_LENGTH = 254       # unit ID + 253-byte PDU
+MAX_ADU_SIZE = MBAP_HEADER_SIZE + MAX_MBAP_LENGTH
+
+# Bounds on reassembly state
+MAX_FLOWS = 65536
+MAX_FLOW_BUFFER = 2 * MAX_ADU_SIZE
+FLOW_IDLE_TIMEOUT = 300.0   # seconds without traffic before a flow is dropped
+
+_MBAP_PREFIX = struct.Struct('>xxHH')   # protocol ID, length
+_SEQ_MOD = 1 << 32
+
+
+class _Flow:
+    __slots__ = ('next_seq', 'buffer', 'last_seen')
+
+    def __init__(self):
+        self.next_seq = None
+        self.buffer = None
+        self.last_seen = 0.0
+
+
+class MbapReassembler:
+    """Per-flow MBAP re-framing with bounded memory.
+
+    feed() returns the complete ADUs carried by a TCP segment. Segments that
+    hold only whole ADUs (the common case) are sliced without copying; only
+    partial ADUs are buffered.
+    """
+
+    def __init__(self, max_flows=MAX_FLOWS, idle_timeout=FLOW_IDLE_TIMEOUT):
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self.flows = OrderedDict()
+        self.stats = {'adus': 0, 'split_adus': 0, 'retransmissions': 0, 'resyncs': 0, 'evicted_flows': 0}
+        self._next_sweep = None
+
+    def __len__(self):
+        return len(self.flows)
+
+    def feed(self, frame):
+        """Return the list of complete ADUs (bytes-like) for one TCP segment"""
+        payload = frame.payload
+        key = (frame.src_ip, frame.sport, frame.dst_ip, frame.dport)
+        flows = self.flows
+        flow = flows.get(key)
+        if flow is None:
+            if len(flows) >= self.max_flows:
+                flows.popitem(last=False)
+                self.stats['evicted_flows'] += 1
+            flow = flows[key] = _Flow()
+        else:
+            flows.move_to_end(key)
+        flow.last_seen = frame.time
+        if self._next_sweep is None:
+            self._next_sweep = frame.time + self.idle_timeout
+        elif frame.time >= self._next_sweep:
+            self._evict_idle(frame.time)
+
+        # Sequence tracking: drop retransmitted bytes, resync after gaps
+        seq = frame.seq
+        size = len(payload)
+        if flow.next_seq is not None and seq != flow.next_seq:
+            delta = (seq - flow.next_seq) % _SEQ_MOD
+            if delta >= _SEQ_MOD // 2:
+                behind = _SEQ_MOD - delta
+                self.stats['retransmissions'] += 1
+                if behind >= size:
+                    return ()
+                payload = payload[behind:]
+                seq = flow.next_seq
+                size = len(payload)
+            else:
+                # Missing data: whatever was buffered can no longer be completed
+                flow.buffer = None
+                self.stats['resyncs'] += 1
+        flow.next_seq = (seq + size) % _SEQ_MOD
+
+        if flow.buffer:
+            flow.buffer += payload
+            data = flow.buffer
+            buffered = True
+        else:
+            data = payload
+            buffered = False
+
+        adus = []
+        offset = 0
+        end = len(data)
+        while offset + MBAP_HEADER_SIZE <= end:
+            protocol, length = _MBAP_PREFIX.unpack_from(data, offset)
+            if protocol != 0 or not MIN_MBAP_LENGTH <= length <= MAX_MBAP_LENGTH:
+                # Not an MBAP header: drop the rest of the segment and resync
+                self.stats['resyncs'] += 1
+                offset = end
+                break
+            adu_end = offset + MBAP_HEADER_SIZE + length
+            if adu_end > end:
+                break
+            if buffered:
+                adus.append(bytes(data[offset:adu_end]))
+                self.stats['split_adus'] += 1
+            else:
+                adus.append(data[offset:adu_end])
+            offset = adu_end
+
+        if offset == end:
+            flow.buffer = None
+        elif buffered:
+            # bytearray prefix deletion is O(1) amortized, so no quadratic copying
+            del data[:offset]
+        elif end - offset <= MAX_FLOW_BUFFER:
+            flow.buffer = bytearray(data[offset:])
+        if flow.buffer is not None and len(flow.buffer) > MAX_FLOW_BUFFER:
+            flow.buffer = None
+            self.stats['resyncs'] += 1
+
+        self.stats['adus'] += len(adus)
+        return adus
+
+    def _evict_idle(self, now):
+        """Drop flows idle for longer than idle_timeout (oldest first, LRU order)"""
+        cutoff = now - self.idle_timeout
+        flows = self.flows
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if flow.last_seen >= cutoff:
+                break
+            del flows[key]
+            self.stats['evicted_flows'] += 1
+        self._next_sweep = now + self.idle_timeout
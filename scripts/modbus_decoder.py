@@ -0,0 +1,615 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Fast Modbus/TCP Decoder
+Reads pcap/pcapng records straight from a memory-mapped file and decodes
+Ethernet/IP/TCP headers with fixed-offset struct reads, without scapy
+"""
+
+import importlib
+import mmap
+import os
+import socket
+import struct
+import time
+from collections import namedtuple
+
+MODBUS_PORT = 502
+
+# Link-layer types handled natively; anything else goes to scapy
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+VLAN_ETHERTYPES = (0x8100, 0x88A8)
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+
+# pcap / pcapng framing
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPT_TSRESOL = 9
+
+# scapy layers for the fallback path and the scapy engine. scapy.all loads every
+# layer and takes about a second; these (Ethernet/SLL/loopback, IPv4, IPv6 and
+# Modbus bound to TCP/502) take a fraction of that.
+SCAPY_MODULES = ('scapy.layers.l2', 'scapy.layers.inet', 'scapy.layers.inet6', 'scapy.contrib.modbus')
+
+# --follow: polling backoff (seconds) while waiting for a capture to grow
+FOLLOW_MIN_INTERVAL = 0.01
+FOLLOW_MAX_INTERVAL = 0.5
+
+PCAP_GLOBAL_HEADER_SIZE = 24
+PCAP_RECORD_HEADER_SIZE = 16
+
+# Modbus Application Protocol header: transaction, protocol, length, unit, function
+MBAP = struct.Struct('>HHHBB')
+MBAP_SIZE = MBAP.size
+REGISTER_PAIR = struct.Struct('>HH')
+
+# Function codes with a decoded payload
+FC_READ_HOLDING_REGISTERS = 3
+FC_WRITE_SINGLE_COIL = 5
+FC_WRITE_SINGLE_REGISTER = 6
+FC_WRITE_MULTIPLE_COILS = 15
+FC_WRITE_MULTIPLE_REGISTERS = 16
+FC_READ_WRITE_MULTIPLE_REGISTERS = 23
+
+# Requests whose response carries register values for (start, count) at PDU offset 1
+REGISTER_READ_CODES = (FC_READ_HOLDING_REGISTERS, FC_READ_WRITE_MULTIPLE_REGISTERS)
+WRITE_CODES = (FC_WRITE_SINGLE_COIL, FC_WRITE_SINGLE_REGISTER, FC_WRITE_MULTIPLE_COILS,
+               FC_WRITE_MULTIPLE_REGISTERS, FC_READ_WRITE_MULTIPLE_REGISTERS)
+COIL_WRITE_CODES = (FC_WRITE_SINGLE_COIL, FC_WRITE_MULTIPLE_COILS)
+
+_U16BE = struct.Struct('>H')
+_IPV4_HEADER = struct.Struct('>BxHxxHxB')     # ver/ihl, total length, flags/frag, protocol
+_IPV6_HEADER = struct.Struct('>4xHB')         # payload length, next header
+_TCP_PORTS_SEQ = struct.Struct('>HHI')
+_PCAP_HEADERS = {'<': struct.Struct('<IIII'), '>': struct.Struct('>IIII')}
+
+# A decoded TCP segment: everything the detector needs from the lower layers.
+# payload is a memoryview into the capture buffer (no copy).
+Frame = namedtuple('Frame', ['time', 'src', 'src_ip', 'dst_ip', 'sport', 'dport', 'payload', 'seq'])
+
+# Returned by decode_frame() for packets that must be dissected by scapy
+UNHANDLED = object()
+
+_mac_cache = {}
+_ip_cache = {}
+
+
+def _format_mac(raw):
+    """Format a 6-byte MAC address the same way scapy does (cached)"""
+    mac = _mac_cache.get(raw)
+    if mac is None:
+        mac = _mac_cache[raw] = bytes(raw).hex(':')
+    return mac
+
+
+def _format_ip(raw):
+    """Format a 4- or 16-byte IP address (cached)"""
+    ip = _ip_cache.get(raw)
+    if ip is None:
+        family = socket.AF_INET if len(raw) == 4 else socket.AF_INET6
+        ip = _ip_cache[raw] = socket.inet_ntop(family, raw)
+    return ip
+
+
+def decode_frame(linktype, ts, data, check_adu=True):
+    """Decode one captured frame down to its TCP payload.
+
+    Returns a Frame, None if the packet carries no TCP segment, or
+    UNHANDLED if the packet needs a full scapy dissection. With check_adu,
+    Modbus segments too short for a whole ADU are also left to scapy; stream
+    reassembly turns it off because it re-frames ADUs itself.
+    """
+    size = len(data)
+    src = None
+
+    if linktype == LINKTYPE_ETHERNET:
+        if size < 14:
+            return UNHANDLED
+        offset = 12
+        ethertype = _U16BE.unpack_from(data, offset)[0]
+        while ethertype in VLAN_ETHERTYPES:
+            offset += 4
+            if size < offset + 2:
+                return UNHANDLED
+            ethertype = _U16BE.unpack_from(data, offset)[0]
+        offset += 2
+        if ethertype == ETHERTYPE_IPV4:
+            version = 4
+        elif ethertype == ETHERTYPE_IPV6:
+            version = 6
+        elif ethertype < 0x0600:
+            # 802.3 length field - let scapy decide what is inside
+            return UNHANDLED
+        else:
+            return None
+        src = _format_mac(bytes(data[6:12]))
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, LINKTYPE_NULL):
+        offset = 4 if linktype == LINKTYPE_NULL else 0
+        if size <= offset:
+            return UNHANDLED
+        version = data[offset] >> 4
+        if version not in (4, 6):
+            return UNHANDLED
+    else:
+        return UNHANDLED
+
+    if version == 4:
+        if size < offset + 20:
+            return UNHANDLED
+        ver_ihl, total_length, frag, proto = _IPV4_HEADER.unpack_from(data, offset)
+        if proto != IPPROTO_TCP:
+            # ICMP errors quote TCP headers, which scapy still reports as TCP
+            return UNHANDLED if proto == IPPROTO_ICMP else None
+        if frag & 0x3FFF:
+            # Fragments are left to scapy
+            return UNHANDLED
+        ihl = (ver_ihl & 0x0F) * 4
+        src_ip = _format_ip(bytes(data[offset + 12:offset + 16]))
+        dst_ip = _format_ip(bytes(data[offset + 16:offset + 20]))
+        end = offset + total_length
+        offset += ihl
+    else:
+        if size < offset + 40:
+            return UNHANDLED
+        payload_length, next_header = _IPV6_HEADER.unpack_from(data, offset)
+        if next_header != IPPROTO_TCP:
+            if next_header in (IPPROTO_UDP, IPPROTO_ICMPV6):
+                return None
+            # Extension headers are left to scapy
+            return UNHANDLED
+        src_ip = _format_ip(bytes(data[offset + 8:offset + 24]))
+        dst_ip = _format_ip(bytes(data[offset + 24:offset + 40]))
+        offset += 40
+        end = offset + payload_length
+
+    if end > size or size < offset + 20:
+        # Truncated capture
+        return UNHANDLED
+    sport, dport, seq = _TCP_PORTS_SEQ.unpack_from(data, offset)
+    data_offset = (data[offset + 12] >> 4) * 4
+    if data_offset < 20 or offset + data_offset > end:
+        return UNHANDLED
+
+    payload = data[offset + data_offset:end]
+    if check_adu and payload and MODBUS_PORT in (sport, dport):
+        # Truncated ADUs get scapy's partial dissection instead
+        if len(payload) < MBAP_SIZE:
+            return UNHANDLED
+        if dport == MODBUS_PORT and payload[7] == 6 and len(payload) < MBAP_SIZE + 4:
+            return UNHANDLED
+
+    if src is None:
+        src = src_ip
+    return Frame(ts, src, src_ip, dst_ip, sport, dport, payload, seq)
+
+
+def _decode_write_coil(adu):
+    address, state = REGISTER_PAIR.unpack_from(adu, MBAP_SIZE)
+    # 0xFF00 = ON, 0x0000 = OFF (anything else is an illegal value, kept as is)
+    return address, (1 if state == 0xFF00 else state,)
+
+
+def _decode_write_register(adu):
+    address, value = REGISTER_PAIR.unpack_from(adu, MBAP_SIZE)
+    return address, (value,)
+
+
+def _decode_write_coils(adu):
+    start, quantity = REGISTER_PAIR.unpack_from(adu, MBAP_SIZE)
+    packed = adu[MBAP_SIZE + 5:MBAP_SIZE + 5 + adu[MBAP_SIZE + 4]]
+    quantity = min(quantity, len(packed) * 8)
+    return start, tuple((packed[i >> 3] >> (i & 7)) & 1 for i in range(quantity))
+
+
+def _decode_register_block(adu, offset):
+    start, quantity = REGISTER_PAIR.unpack_from(adu, offset)
+    byte_count = adu[offset + 4]
+    quantity = min(quantity, byte_count // 2, (len(adu) - offset - 5) // 2)
+    return start, struct.unpack_from(f'>{quantity}H', adu, offset + 5)
+
+
+def _decode_write_registers(adu):
+    return _decode_register_block(adu, MBAP_SIZE)
+
+
+def _decode_read_write_registers(adu):
+    # Read start/quantity come first; the write block follows them
+    return _decode_register_block(adu, MBAP_SIZE + 4)
+
+
+# Function code -> (minimum ADU length, decoder returning (start address, values))
+WRITE_DECODERS = {
+    FC_WRITE_SINGLE_COIL: (MBAP_SIZE + 4, _decode_write_coil),
+    FC_WRITE_SINGLE_REGISTER: (MBAP_SIZE + 4, _decode_write_register),
+    FC_WRITE_MULTIPLE_COILS: (MBAP_SIZE + 5, _decode_write_coils),
+    FC_WRITE_MULTIPLE_REGISTERS: (MBAP_SIZE + 5, _decode_write_registers),
+    FC_READ_WRITE_MULTIPLE_REGISTERS: (MBAP_SIZE + 9, _decode_read_write_registers),
+}
+
+
+def decode_write(adu):
+    """Decode the values written by a write request ADU.
+
+    Returns (start address, values) or None when the PDU is too short;
+    block writes are cut to the values actually present in the ADU.
+    """
+    entry = WRITE_DECODERS.get(adu[7])
+    if entry is None or len(adu) < entry[0]:
+        return None
+    return entry[1](adu)
+
+
+def _iter_pcap(view, byte_order, nano, start=None, end=None):
+    """Yield (linktype, timestamp, data) from a classic pcap buffer"""
+    header = _PCAP_HEADERS[byte_order]
+    linktype = struct.unpack_from(byte_order + 'I', view, 20)[0] & 0x0FFFFFFF
+    divisor = 1000000000 if nano else 1000000
+    offset = PCAP_GLOBAL_HEADER_SIZE if start is None else start
+    end = len(view) if end is None else min(end, len(view))
+    while offset + 16 <= end:
+        sec, frac, caplen, _ = header.unpack_from(view, offset)
+        offset += 16
+        if offset + caplen > end:
+            # Partial record at the end of the file
+            break
+        # Integer division keeps the timestamp identical to scapy's Decimal one
+        yield linktype, (sec * divisor + frac) / divisor, view[offset:offset + caplen]
+        offset += caplen
+
+
+def _iter_pcapng(view):
+    """Yield (linktype, timestamp, data) from a pcapng buffer"""
+    end = len(view)
+    offset = 0
+    byte_order = '<'
+    interfaces = []
+    while offset + 12 <= end:
+        block_type = struct.unpack_from(byte_order + 'I', view, offset)[0]
+        if block_type == PCAPNG_SHB:
+            magic = struct.unpack_from('<I', view, offset + 8)[0]
+            byte_order = '<' if magic == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+        block_length = struct.unpack_from(byte_order + 'I', view, offset + 4)[0]
+        if block_length < 12 or offset + block_length > end:
+            break
+        record = _pcapng_block(view, offset, block_type, block_length, byte_order, interfaces)
+        if record is not None:
+            yield record
+        offset += block_length
+
+
+def _pcapng_block(view, offset, block_type, block_length, byte_order, interfaces):
+    """Handle one pcapng block: record interfaces, return (linktype, timestamp, data) for packets"""
+    if block_type == PCAPNG_IDB:
+        linktype = struct.unpack_from(byte_order + 'H', view, offset + 8)[0]
+        interfaces.append((linktype, _pcapng_tsresol(view, offset, block_length, byte_order)))
+    elif block_type == PCAPNG_EPB:
+        if_id, ts_high, ts_low, caplen = struct.unpack_from(byte_order + 'IIII', view, offset + 8)
+        if if_id < len(interfaces):
+            linktype, tsresol = interfaces[if_id]
+            data = view[offset + 28:offset + 28 + caplen]
+            return linktype, ((ts_high << 32) | ts_low) / tsresol, data
+    elif block_type == PCAPNG_SPB and interfaces:
+        orig_len = struct.unpack_from(byte_order + 'I', view, offset + 8)[0]
+        caplen = min(orig_len, block_length - 16)
+        return interfaces[0][0], 0.0, view[offset + 12:offset + 12 + caplen]
+    return None
+
+
+def _pcapng_tsresol(view, offset, block_length, byte_order):
+    """Read the if_tsresol option of an Interface Description Block"""
+    opt = offset + 16
+    opt_end = offset + block_length - 4
+    while opt + 4 <= opt_end:
+        code, length = struct.unpack_from(byte_order + 'HH', view, opt)
+        if code == 0:
+            break
+        if code == PCAPNG_OPT_TSRESOL and length >= 1:
+            value = view[opt + 4]
+            return 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+        opt += 4 + ((length + 3) & ~3)
+    return 1000000
+
+
+def capture_format(buf):
+    """Identify a capture buffer: ('pcapng', None, None) or ('pcap', byte order, nanoseconds)"""
+    view = memoryview(buf)
+    if len(view) < PCAP_GLOBAL_HEADER_SIZE:
+        return None, None, None
+    magic_le = struct.unpack_from('<I', view, 0)[0]
+    magic_be = struct.unpack_from('>I', view, 0)[0]
+    if magic_le == PCAPNG_SHB:
+        return 'pcapng', None, None
+    if magic_le in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        return 'pcap', '<', magic_le == PCAP_MAGIC_NSEC
+    if magic_be in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        return 'pcap', '>', magic_be == PCAP_MAGIC_NSEC
+    raise ValueError("Not a pcap or pcapng file")
+
+
+def iter_records(buf, start=None, end=None):
+    """Yield (linktype, timestamp, data) for every record of a pcap/pcapng buffer.
+
+    data is a memoryview slice of buf, so nothing is copied. start/end limit a
+    classic pcap to a byte range produced by split_records().
+    """
+    kind, byte_order, nano = capture_format(buf)
+    if kind == 'pcapng':
+        yield from _iter_pcapng(memoryview(buf))
+    elif kind == 'pcap':
+        yield from _iter_pcap(memoryview(buf), byte_order, nano, start, end)
+
+
+def split_records(buf, chunk_size):
+    """Split a classic pcap buffer into (start, end) byte ranges at record boundaries.
+
+    Only record headers are read. pcapng files are returned as a single range
+    because their packet blocks depend on earlier interface blocks.
+    """
+    kind, byte_order, _ = capture_format(buf)
+    size = len(buf)
+    if kind != 'pcap':
+        return [(None, None)]
+    header = _PCAP_HEADERS[byte_order]
+    ranges = []
+    start = offset = PCAP_GLOBAL_HEADER_SIZE
+    while offset + PCAP_RECORD_HEADER_SIZE <= size:
+        if offset - start >= chunk_size:
+            ranges.append((start, offset))
+            start = offset
+        caplen = header.unpack_from(buf, offset)[2]
+        offset += PCAP_RECORD_HEADER_SIZE + caplen
+    ranges.append((start, size))
+    return ranges
+
+
+def _read_exact(stream, size):
+    """Read exactly size bytes from a stream; returns None at end of stream"""
+    data = stream.read(size)
+    if data is None or len(data) == size:
+        return data
+    chunks = [data]
+    received = len(data)
+    while received < size:
+        chunk = stream.read(size - received)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        received += len(chunk)
+    return b''.join(chunks)
+
+
+def iter_stream_records(stream):
+    """Yield (linktype, timestamp, data) from a pcap/pcapng byte stream such as
+    `tcpdump -U -w -` on stdin. Records are yielded as soon as they are complete.
+    """
+    head = _read_exact(stream, 4)
+    if head is None:
+        return
+    magic_le = struct.unpack('<I', head)[0]
+    magic_be = struct.unpack('>I', head)[0]
+
+    if magic_le == PCAPNG_SHB:
+        yield from _iter_pcapng_stream(stream, head)
+        return
+    if magic_le in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        byte_order, nano = '<', magic_le == PCAP_MAGIC_NSEC
+    elif magic_be in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+        byte_order, nano = '>', magic_be == PCAP_MAGIC_NSEC
+    else:
+        raise ValueError("Not a pcap or pcapng stream")
+
+    rest = _read_exact(stream, PCAP_GLOBAL_HEADER_SIZE - 4)
+    if rest is None:
+        return
+    linktype = struct.unpack_from(byte_order + 'I', rest, 16)[0] & 0x0FFFFFFF
+    header = _PCAP_HEADERS[byte_order]
+    divisor = 1000000000 if nano else 1000000
+    while True:
+        record_header = _read_exact(stream, PCAP_RECORD_HEADER_SIZE)
+        if record_header is None:
+            return
+        sec, frac, caplen, _ = header.unpack(record_header)
+        data = _read_exact(stream, caplen)
+        if data is None:
+            return
+        yield linktype, (sec * divisor + frac) / divisor, memoryview(data)
+
+
+class _Reopen(Exception):
+    """The followed capture was rotated (new file at the path) or truncated"""
+
+
+class _FollowedFile:
+    """Read-only view of a capture that is still being written.
+
+    read(size) waits until size bytes have been appended, polling with a
+    backoff from min_interval up to max_interval seconds. Each poll is one
+    read at the current offset plus one stat() of the path, whatever the
+    file size.
+    """
+
+    def __init__(self, path, min_interval, max_interval):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        delay = min_interval
+        while True:
+            try:
+                self.f = open(path, 'rb')
+                break
+            except FileNotFoundError:
+                # Between rotations the path may briefly not exist
+                time.sleep(delay)
+                delay = min(delay * 2, max_interval)
+        self.inode = os.fstat(self.f.fileno()).st_ino
+
+    def read(self, size):
+        chunks = []
+        received = 0
+        delay = self.min_interval
+        while True:
+            chunk = self.f.read(size - received)
+            if chunk:
+                chunks.append(chunk)
+                received += len(chunk)
+                if received == size:
+                    return b''.join(chunks)
+                delay = self.min_interval
+                continue
+            self._check_replaced()
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_interval)
+
+    def _check_replaced(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self.inode or st.st_size < self.f.tell():
+            raise _Reopen()
+
+    def close(self):
+        self.f.close()
+
+
+def follow_records(path, min_interval=FOLLOW_MIN_INTERVAL, max_interval=FOLLOW_MAX_INTERVAL):
+    """Yield (linktype, timestamp, data) from a capture file as it grows, like tail -f.
+
+    Existing records are read first, then only appended ones; a record still
+    being written is waited for. When the path is replaced (rotation) or the
+    file shrinks (truncation), the new file is followed from its start.
+    Runs until interrupted.
+    """
+    while True:
+        followed = _FollowedFile(path, min_interval, max_interval)
+        try:
+            yield from iter_stream_records(followed)
+            return
+        except _Reopen:
+            continue
+        finally:
+            followed.close()
+
+
+def _iter_pcapng_stream(stream, head):
+    """Yield records from a pcapng stream whose first 4 bytes were already read"""
+    byte_order = '<'
+    interfaces = []
+    block_type_raw = head
+    while True:
+        if block_type_raw is None:
+            block_type_raw = _read_exact(stream, 4)
+            if block_type_raw is None:
+                return
+        length_raw = _read_exact(stream, 4)
+        if length_raw is None:
+            return
+        block_type = struct.unpack(byte_order + 'I', block_type_raw)[0]
+        if block_type == PCAPNG_SHB:
+            # Byte order is only known after reading the byte-order magic
+            magic_raw = _read_exact(stream, 4)
+            if magic_raw is None:
+                return
+            byte_order = '<' if struct.unpack('<I', magic_raw)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            interfaces = []
+            prefix = block_type_raw + length_raw + magic_raw
+        else:
+            prefix = block_type_raw + length_raw
+        block_length = struct.unpack(byte_order + 'I', length_raw)[0]
+        if block_length < len(prefix) + 4:
+            raise ValueError("Corrupt pcapng block")
+        body = _read_exact(stream, block_length - len(prefix))
+        if body is None:
+            return
+        record = _pcapng_block(memoryview(prefix + body), 0, block_type, block_length,
+                               byte_order, interfaces)
+        if record is not None:
+            yield record
+        block_type_raw = None
+
+
+class MappedCapture:
+    """Read-only memory map of a capture file, usable as a context manager"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self.buffer = b''
+
+    def __enter__(self):
+        self._file = open(self.path, 'rb')
+        try:
+            self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self.buffer = b''
+        return self
+
+    def __exit__(self, *exc):
+        if isinstance(self.buffer, mmap.mmap):
+            try:
+                self.buffer.close()
+            except BufferError:
+                # A memoryview is still alive; the map is released with it
+                pass
+        self._file.close()
+        return False
+
+    def records(self, start=None, end=None):
+        return iter_records(self.buffer, start, end)
+
+
+def load_scapy():
+    """Import the scapy layers needed to dissect Modbus/TCP captures (cheap once loaded)"""
+    for name in SCAPY_MODULES:
+        importlib.import_module(name)
+
+
+def to_scapy(linktype, ts, data):
+    """Dissect a record with scapy (fallback for packets decode_frame cannot handle)"""
+    load_scapy()
+    from scapy.config import conf
+
+    cls = conf.l2types.get(linktype, conf.raw_layer)
+    try:
+        pkt = cls(bytes(data))
+    except Exception:
+        pkt = conf.raw_layer(bytes(data))
+    pkt.time = ts
+    return pkt
+
+
+def frame_from_scapy(pkt):
+    """Build a Frame from a scapy packet, or None if it has no TCP layer"""
+    from scapy.layers.inet import TCP
+
+    if not pkt.haslayer(TCP):
+        return None
+    tcp = pkt[TCP]
+    ip = tcp.underlayer
+    src_ip = getattr(ip, 'src', None)
+    dst_ip = getattr(ip, 'dst', None)
+    src = pkt.src if hasattr(pkt, 'src') else src_ip
+    # Raw bytes as captured: rebuilding the Modbus layer would drop pipelined ADUs
+    if tcp.original:
+        payload = tcp.original[tcp.dataofs * 4:]
+    else:
+        payload = bytes(tcp.payload)
+    return Frame(float(pkt.time), src, src_ip, dst_ip, tcp.sport, tcp.dport,
+                 memoryview(payload), tcp.seq)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Columnar Modbus Event Table
+Turns a capture into NumPy columns (one row per Modbus ADU, plus one per
+further value of a multi-value write) so detection rules and ad-hoc
+forensic queries run as vectorized masks. Register values returned by
+read responses are kept in one flat array next to the columns
+"""
+
+from array import array
+
+import numpy as np
+
+import modbus_decoder
+
+# Column name -> (array.array typecode used while building, NumPy dtype)
+COLUMNS = {
+    'time': ('d', np.float64),
+    'src': ('i', np.int32),          # index into table.addresses (link-layer source)
+    'src_ip': ('i', np.int32),       # index into table.addresses
+    'dst_ip': ('i', np.int32),       # index into table.addresses
+    'sport': ('H', np.uint16),
+    'dport': ('H', np.uint16),
+    'unit_id': ('B', np.uint8),
+    'func_code': ('B', np.uint8),
+    'trans_id': ('H', np.uint16),
+    'register': ('i', np.int32),     # -1 when the PDU carries no address
+    'value': ('i', np.int32),        # -1 when the PDU carries no value
+    'read_start': ('i', np.int32),   # registers requested by an FC3/FC23 request (0 otherwise)
+    'read_quantity': ('H', np.uint16),
+    'reading_count': ('H', np.uint16),  # register values returned by an FC3/FC23 response
+    'is_request': ('b', np.bool_),
+    'continuation': ('b', np.bool_), # further value of a multi-value write (same ADU as the row before)
+}
+
+NO_VALUE = -1
+
+
+class ModbusEventTable:
+    """Columnar table of Modbus events backed by NumPy arrays"""
+
+    def __init__(self, columns, addresses, source_counts=None, total_packets=0, flow_counts=None,
+                 readings=None):
+        self.columns = columns
+        # Values returned by read responses, in row order (reading_count per row)
+        self.readings = readings if readings is not None else np.empty(0, dtype=np.uint16)
+        self.addresses = addresses
+        self.source_counts = source_counts if source_counts is not None else {}   # source IP -> packets
+        # (src IP, src port, dst IP, dst port) -> [first, last, packets, payload bytes]
+        self.flow_counts = flow_counts if flow_counts is not None else {}
+        self.total_packets = total_packets
+        self._address_codes = {addr: code for code, addr in enumerate(addresses)}
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns')
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    @classmethod
+    def from_pcap(cls, pcap_file, byte_range=(None, None)):
+        """Build a table from a memory-mapped pcap/pcapng file (or a byte range of it)"""
+        builder = _TableBuilder()
+        with modbus_decoder.MappedCapture(pcap_file) as capture:
+            for linktype, ts, data in capture.records(*byte_range):
+                builder.add_record(linktype, ts, data)
+        return builder.build()
+
+    def address_code(self, address):
+        """Return the integer code used in src/src_ip/dst_ip columns, or -1"""
+        return self._address_codes.get(address, -1)
+
+    def address(self, code):
+        return self.addresses[code]
+
+    def select(self, mask):
+        """Return a new table holding only the rows where mask is True"""
+        columns = {name: col[mask] for name, col in self.columns.items()}
+        readings = self.readings[np.repeat(mask, self.reading_count)]
+        return ModbusEventTable(columns, self.addresses, self.source_counts, self.total_packets,
+                                self.flow_counts, readings)
+
+    def query(self, start=None, end=None, func_code=None, register=None,
+              src_ip=None, dst_ip=None, unit_id=None, requests_only=False):
+        """Filter events by time range, function code, register, host or unit ID"""
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.time >= start
+        if end is not None:
+            mask &= self.time < end
+        if func_code is not None:
+            mask &= self.func_code == func_code
+        if register is not None:
+            mask &= self.register == register
+        if src_ip is not None:
+            mask &= self.src_ip == self.address_code(src_ip)
+        if dst_ip is not None:
+            mask &= self.dst_ip == self.address_code(dst_ip)
+        if unit_id is not None:
+            mask &= self.unit_id == unit_id
+        if requests_only:
+            mask &= self.is_request
+        return self.select(mask)
+
+    def rows(self):
+        """Iterate over events as dicts (for printing small query results)"""
+        names = list(self.columns)
+        for values in zip(*(self.columns[name].tolist() for name in names)):
+            row = dict(zip(names, values))
+            for key in ('src', 'src_ip', 'dst_ip'):
+                row[key] = self.addresses[row[key]]
+            yield row
+
+
+class _TableBuilder:
+    """Accumulates decoded records into compact typed arrays"""
+
+    def __init__(self):
+        self.buffers = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        self.addresses = []
+        self.address_codes = {}
+        self.source_counts = {}
+        self.flow_counts = {}
+        self.readings = bytearray()     # big-endian register values, as on the wire
+        self.total_packets = 0
+
+    def _code(self, address):
+        code = self.address_codes.get(address)
+        if code is None:
+            code = self.address_codes[address] = len(self.addresses)
+            self.addresses.append(address)
+        return code
+
+    def add_record(self, linktype, ts, data):
+        self.total_packets += 1
+        frame = modbus_decoder.decode_frame(linktype, ts, data)
+        if frame is modbus_decoder.UNHANDLED:
+            frame = modbus_decoder.frame_from_scapy(modbus_decoder.to_scapy(linktype, ts, data))
+        if frame is None:
+            return
+        self.add_frame(frame)
+
+    def add_frame(self, frame):
+        src = frame.src_ip
+        self.source_counts[src] = self.source_counts.get(src, 0) + 1
+        payload = frame.payload
+        key = (src, frame.sport, frame.dst_ip, frame.dport)
+        flow = self.flow_counts.get(key)
+        if flow is None:
+            self.flow_counts[key] = [frame.time, frame.time, 1, len(payload)]
+        else:
+            flow[1] = max(flow[1], frame.time)
+            flow[2] += 1
+            flow[3] += len(payload)
+        if len(payload) < modbus_decoder.MBAP_SIZE:
+            return
+        if frame.dport == modbus_decoder.MODBUS_PORT:
+            is_request = True
+        elif frame.sport == modbus_decoder.MODBUS_PORT:
+            is_request = False
+        else:
+            return
+
+        trans_id, _, _, unit_id, func_code = modbus_decoder.MBAP.unpack_from(payload)
+        register = value = NO_VALUE
+        read_start = read_quantity = reading_count = 0
+        values = ()
+        if is_request and len(payload) >= modbus_decoder.MBAP_SIZE + 4:
+            register, value = modbus_decoder.REGISTER_PAIR.unpack_from(payload, modbus_decoder.MBAP_SIZE)
+            if func_code in modbus_decoder.REGISTER_READ_CODES:
+                read_start, read_quantity = register, value
+            if func_code != modbus_decoder.FC_WRITE_SINGLE_REGISTER:
+                # Reads carry a quantity; other writes are decoded below
+                value = NO_VALUE
+                if func_code in modbus_decoder.WRITE_DECODERS:
+                    decoded = modbus_decoder.decode_write(payload)
+                    if decoded is not None and decoded[1]:
+                        register, values = decoded
+                        value = values[0]
+        elif not is_request and func_code in modbus_decoder.REGISTER_READ_CODES and len(payload) > 9:
+            # Register values read: their addresses come from the matching request
+            reading_count = min(payload[8] // 2, (len(payload) - 9) // 2)
+            self.readings += payload[9:9 + 2 * reading_count]
+
+        b = self.buffers
+        b['time'].append(frame.time)
+        b['src'].append(self._code(frame.src))
+        b['src_ip'].append(self._code(frame.src_ip))
+        b['dst_ip'].append(self._code(frame.dst_ip))
+        b['sport'].append(frame.sport)
+        b['dport'].append(frame.dport)
+        b['unit_id'].append(unit_id)
+        b['func_code'].append(func_code)
+        b['trans_id'].append(trans_id)
+        b['register'].append(register)
+        b['value'].append(value)
+        b['read_start'].append(read_start)
+        b['read_quantity'].append(read_quantity)
+        b['reading_count'].append(reading_count)
+        b['is_request'].append(is_request)
+        b['continuation'].append(False)
+        if len(values) > 1:
+            self._add_continuations(b, len(values) - 1, register, values)
+
+    @staticmethod
+    def _add_continuations(b, extra, start, values):
+        """One more row per further value, copying the ADU's other columns"""
+        for name in ('time', 'src', 'src_ip', 'dst_ip', 'sport', 'dport', 'unit_id', 'func_code',
+                     'trans_id', 'read_start', 'read_quantity', 'is_request'):
+            column = b[name]
+            column.extend([column[-1]] * extra)
+        b['reading_count'].extend([0] * extra)
+        b['register'].extend(range(start + 1, start + 1 + extra))
+        b['value'].extend(values[1:])
+        b['continuation'].extend([True] * extra)
+
+    def build(self):
+        columns = {
+            name: np.frombuffer(self.buffers[name], dtype=dtype) if len(self.buffers[name])
+            else np.empty(0, dtype=dtype)
+            for name, (_, dtype) in COLUMNS.items()
+        }
+        readings = np.frombuffer(self.readings, dtype='>u2').astype(np.uint16)
+        return ModbusEventTable(columns, self.addresses, self.source_counts, self.total_packets,
+                                self.flow_counts, readings)
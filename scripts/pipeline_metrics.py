@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Pipeline Metrics
+Per-stage wall/CPU time, per-handler and per-rule call counts and cost,
+function-code and rule-hit counters and peak memory for one detector run,
+written as JSON or Prometheus text format
+"""
+
+import json
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+METRIC_PREFIX = 'ics_monitor_'
+
+# Stages whose time counts towards packets/sec
+PACKET_STAGES = ('load', 'analyze', 'live')
+
+
+class PipelineMetrics:
+    """Counters collected while a detector runs.
+
+    Nothing here is called unless --metrics is given: instrument() replaces
+    the detector's methods with timed wrappers on that one instance, so the
+    uninstrumented code path is unchanged.
+    """
+
+    def __init__(self):
+        self.stages = {}        # stage -> [calls, wall seconds, cpu seconds]
+        self.handlers = {}      # handler -> [calls, seconds]
+        self.rules = {}         # rule -> [evaluations, seconds]
+        self.rule_hits = {}     # anomaly type -> count
+        self.function_codes = {}    # request function code -> count
+        self.peak_rss = 0
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage (wall and CPU)"""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - wall
+            entry[2] += time.process_time() - cpu
+
+    def add_rule_time(self, rule, seconds, evaluations=1):
+        entry = self.rules.setdefault(rule, [0, 0.0])
+        entry[0] += evaluations
+        entry[1] += seconds
+
+    def count_function_codes(self, func_codes):
+        """Add request function codes from a NumPy column (batch mode)"""
+        import numpy as np
+
+        codes, counts = np.unique(func_codes, return_counts=True)
+        for code, count in zip(codes.tolist(), counts.tolist()):
+            self.function_codes[code] = self.function_codes.get(code, 0) + count
+
+    def instrument(self, detector, stages, handlers, rules):
+        """Wrap detector methods: {method: stage}, (handler, ...), {method: rule}"""
+        for method, name in stages.items():
+            setattr(detector, method, self._stage_wrapper(name, getattr(detector, method)))
+        for method in handlers:
+            setattr(detector, method, _call_timer(self.handlers, method, getattr(detector, method)))
+        for method, name in rules.items():
+            setattr(detector, method, _call_timer(self.rules, name, getattr(detector, method)))
+
+        report_anomaly = detector.report_anomaly
+        hits = self.rule_hits
+
+        def counted_report(anomaly):
+            kind = anomaly.type
+            hits[kind] = hits.get(kind, 0) + 1
+            report_anomaly(anomaly)
+        detector.report_anomaly = counted_report
+
+        track_request = detector.track_request
+        function_codes = self.function_codes
+
+        def counted_request(frame, adu):
+            if len(adu) > 7:
+                function_codes[adu[7]] = function_codes.get(adu[7], 0) + 1
+            track_request(frame, adu)
+        detector.track_request = counted_request
+
+    def _stage_wrapper(self, name, method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return method(*args, **kwargs)
+        return wrapper
+
+    def sample_memory(self):
+        """Record this process's peak resident set size"""
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            self.peak_rss = max(self.peak_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+    def merge(self, other, stage_prefix='worker_'):
+        """Add a worker's metrics; its stages are kept apart from the parent's"""
+        for name, (calls, wall, cpu) in other.stages.items():
+            entry = self.stages.setdefault(stage_prefix + name, [0, 0.0, 0.0])
+            entry[0] += calls
+            entry[1] += wall
+            entry[2] += cpu
+        for table, theirs in ((self.handlers, other.handlers), (self.rules, other.rules)):
+            for name, (calls, seconds) in theirs.items():
+                entry = table.setdefault(name, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+        for table, theirs in ((self.rule_hits, other.rule_hits),
+                              (self.function_codes, other.function_codes)):
+            for key, count in theirs.items():
+                table[key] = table.get(key, 0) + count
+        self.peak_rss = max(self.peak_rss, other.peak_rss)
+
+    def summary(self, stats):
+        """All metrics as a JSON-ready dict (stats: the detector's traffic counters)"""
+        self.sample_memory()
+        elapsed = sum(self.stages[s][1] for s in PACKET_STAGES if s in self.stages)
+        return {
+            'packets': stats['total_packets'],
+            'modbus_packets': stats['modbus_packets'],
+            'packets_per_sec': round(stats['total_packets'] / elapsed, 1) if elapsed else None,
+            'peak_rss_bytes': self.peak_rss or None,
+            'stages': {name: {'calls': calls, 'wall_seconds': round(wall, 6), 'cpu_seconds': round(cpu, 6)}
+                       for name, (calls, wall, cpu) in self.stages.items()},
+            'handlers': _timings(self.handlers, 'calls'),
+            'rules': _timings(self.rules, 'evaluations'),
+            'rule_hits': dict(sorted(self.rule_hits.items())),
+            'function_codes': {str(code): count for code, count in sorted(self.function_codes.items())},
+        }
+
+    def write(self, path, stats):
+        """Write metrics to path: JSON for .json files, Prometheus text format otherwise"""
+        summary = self.summary(stats)
+        with open(path, 'w') as f:
+            if path.lower().endswith('.json'):
+                json.dump(summary, f, indent=2)
+                f.write('\n')
+            else:
+                f.write(_prometheus(summary))
+
+
+def _call_timer(table, name, method):
+    perf_counter = time.perf_counter
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        started = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            entry = table.get(name)
+            if entry is None:
+                entry = table[name] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += perf_counter() - started
+    return wrapper
+
+
+def _timings(table, count_name):
+    return {name: {count_name: calls, 'seconds': round(seconds, 6),
+                   'mean_us': round(seconds / calls * 1e6, 3) if calls else 0.0}
+            for name, (calls, seconds) in sorted(table.items())}
+
+
+def _prometheus(summary):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{METRIC_PREFIX}{name}{{{label_text}}} {value}" if label_text
+                         else f"{METRIC_PREFIX}{name} {value}")
+
+    metric('packets_total', 'counter', "Packets read from the capture", [({}, summary['packets'])])
+    metric('modbus_packets_total', 'counter', "Modbus ADUs analyzed", [({}, summary['modbus_packets'])])
+    if summary['packets_per_sec'] is not None:
+        metric('packets_per_second', 'gauge', "Packets per second over the load/analyze stages",
+               [({}, summary['packets_per_sec'])])
+    if summary['peak_rss_bytes'] is not None:
+        metric('peak_rss_bytes', 'gauge', "Peak resident set size", [({}, summary['peak_rss_bytes'])])
+
+    stages = summary['stages']
+    metric('stage_wall_seconds', 'gauge', "Wall-clock time per pipeline stage",
+           [({'stage': s}, v['wall_seconds']) for s, v in stages.items()])
+    metric('stage_cpu_seconds', 'gauge', "CPU time per pipeline stage",
+           [({'stage': s}, v['cpu_seconds']) for s, v in stages.items()])
+    metric('handler_calls_total', 'counter', "Calls per packet handler",
+           [({'handler': h}, v['calls']) for h, v in summary['handlers'].items()])
+    metric('handler_seconds_total', 'counter', "Time in each packet handler (inclusive)",
+           [({'handler': h}, v['seconds']) for h, v in summary['handlers'].items()])
+    metric('rule_evaluations_total', 'counter', "Evaluations per detection rule",
+           [({'rule': r}, v['evaluations']) for r, v in summary['rules'].items()])
+    metric('rule_seconds_total', 'counter', "Time spent evaluating each detection rule",
+           [({'rule': r}, v['seconds']) for r, v in summary['rules'].items()])
+    metric('rule_hits_total', 'counter', "Anomalies reported per anomaly type",
+           [({'type': t}, count) for t, count in summary['rule_hits'].items()])
+    metric('requests_total', 'counter', "Modbus requests per function code",
+           [({'func_code': fc}, count) for fc, count in summary['function_codes'].items()])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Sliding Window Rate Tracking
+Per-key event rates over the last N seconds using bucketed ring counters,
+so bursts are caught on multi-day captures and live streams alike
+"""
+
+DEFAULT_BUCKETS = 10
+
+
+class _WindowCounter:
+    """Ring of per-bucket counts covering one sliding window"""
+
+    __slots__ = ('counts', 'total', 'last_bucket', 'alerted')
+
+    def __init__(self, buckets, bucket):
+        self.counts = [0] * buckets
+        self.total = 0
+        self.last_bucket = bucket
+        self.alerted = False
+
+    def advance(self, bucket, buckets):
+        """Expire buckets that fell out of the window (at most one pass over the ring)"""
+        steps = bucket - self.last_bucket
+        if steps <= 0:
+            return
+        if steps >= buckets:
+            self.counts = [0] * buckets
+            self.total = 0
+        else:
+            counts = self.counts
+            for i in range(self.last_bucket + 1, bucket + 1):
+                idx = i % buckets
+                self.total -= counts[idx]
+                counts[idx] = 0
+        self.last_bucket = bucket
+
+
+class RateTracker:
+    """Tracks events per key over a sliding window and flags keys above a rate.
+
+    Updates are O(1) amortized. Keys idle for a whole window are evicted, so
+    memory is bounded by the number of keys active within the window.
+    """
+
+    def __init__(self, window, threshold, buckets=DEFAULT_BUCKETS):
+        self.window = window
+        self.threshold = threshold              # events per second
+        self.limit = threshold * window         # events per window
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self.counters = {}
+        self._next_sweep = None
+
+    def __len__(self):
+        return len(self.counters)
+
+    def add(self, key, timestamp):
+        """Count one event for key.
+
+        Returns the number of events in the window when the key first exceeds
+        the threshold (once per burst), otherwise None.
+        """
+        bucket = int(timestamp / self.bucket_width)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = _WindowCounter(self.buckets, bucket)
+        elif bucket > counter.last_bucket:
+            counter.advance(bucket, self.buckets)
+        # Slightly out-of-order timestamps are counted in the current bucket
+        counter.counts[counter.last_bucket % self.buckets] += 1
+        counter.total += 1
+
+        if self._next_sweep is None:
+            self._next_sweep = bucket + self.buckets
+        elif bucket >= self._next_sweep:
+            self._sweep(bucket)
+
+        if counter.total > self.limit:
+            if not counter.alerted:
+                counter.alerted = True
+                return counter.total
+        elif counter.alerted:
+            # Re-arm once the rate has dropped back under the threshold
+            counter.alerted = False
+        return None
+
+    def rate(self, key):
+        """Current events/second for key over the window"""
+        counter = self.counters.get(key)
+        return counter.total / self.window if counter else 0.0
+
+    def _sweep(self, bucket):
+        """Drop keys with no events in the last window"""
+        horizon = bucket - self.buckets
+        idle = [key for key, counter in self.counters.items() if counter.last_bucket <= horizon]
+        for key in idle:
+            del self.counters[key]
+        self._next_sweep = bucket + self.buckets
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Register Rule Table
+Loads a register map (JSON/YAML) describing each holding register (and
+optionally each coil) and compiles it into a direct-indexed lookup keyed by
+(unit ID, address)
+"""
+
+import json
+import os
+
+SEVERITIES = ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW')
+MAX_REGISTER = 0xFFFF
+
+# Values below/above these never occur in a 16-bit register, so they mean "no limit"
+NO_MIN = -1
+NO_MAX = MAX_REGISTER + 1
+
+
+def with_unit(value, unit):
+    """Format a value with its engineering unit (°C/% attach, others are spaced)"""
+    if not unit:
+        return f"{value}"
+    if unit.startswith('°') or unit == '%':
+        return f"{value}{unit}"
+    return f"{value} {unit}"
+
+
+class RegisterRule:
+    """Compiled checks for one holding register"""
+
+    __slots__ = ('name', 'scale', 'unit', 'min', 'max', 'severity', 'type',
+                 'description', 'expected_range', 'forbidden')
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.scale = spec.get('scale', 1)
+        self.unit = spec.get('unit', '')
+        value_range = spec.get('range')
+        if value_range is not None:
+            self.min, self.max = value_range
+            self.expected_range = (
+                f"{self.display(self.min)}-{with_unit(self.display(self.max), self.unit)}"
+            )
+        else:
+            self.min, self.max = NO_MIN, NO_MAX
+            self.expected_range = None
+        self.severity = _severity(spec.get('severity', 'MEDIUM'))
+        self.type = spec.get('type', 'OUT_OF_RANGE_WRITE')
+        self.description = spec.get(
+            'description', f"Dangerous {self.name.lower()} value written: {{value}}")
+
+        # value -> (type, severity, description)
+        self.forbidden = {}
+        for entry in spec.get('forbidden', []):
+            if not isinstance(entry, dict):
+                entry = {'value': entry}
+            self.forbidden[entry['value']] = (
+                entry.get('type', 'FORBIDDEN_VALUE_WRITE'),
+                _severity(entry.get('severity', self.severity)),
+                entry.get('description', f"Forbidden {self.name.lower()} value written: {{value}}"),
+            )
+
+    def display(self, value):
+        """Convert a raw register value to engineering units"""
+        return value / self.scale if self.scale != 1 else value
+
+    def check(self, value):
+        """Return (type, severity, description, display value, expected range) or None"""
+        hit = self.forbidden.get(value)
+        if hit is not None:
+            kind, severity, description = hit
+            shown = self.display(value)
+            return kind, severity, description.format(value=with_unit(shown, self.unit)), shown, None
+        if value < self.min or value > self.max:
+            shown = self.display(value)
+            return (self.type, self.severity,
+                    self.description.format(value=with_unit(shown, self.unit)),
+                    shown, self.expected_range)
+        return None
+
+    def check_reading(self, value):
+        """Check a value reported by the PLC (range only; forbidden values are write rules)"""
+        if self.min <= value <= self.max:
+            return None
+        shown = self.display(value)
+        return ('OUT_OF_RANGE_READING', self.severity,
+                f"Out-of-range {self.name.lower()} reading from PLC: {with_unit(shown, self.unit)}",
+                shown, self.expected_range)
+
+
+class RegisterMap:
+    """Rule table compiled to direct-indexed lists: one lookup per write"""
+
+    def __init__(self, config):
+        self.config = config
+        self.rules = []
+        self.default, self.units = self._compile_specs(config.get('registers', []))
+        # Coils use the same rule format (values 0/1) in a table of their own
+        self.coil_default, self.coil_units = self._compile_specs(config.get('coils', []))
+
+    def _compile_specs(self, specs):
+        """Return (wildcard table, {unit ID: table}) for a list of rule specs"""
+        wildcard = {}
+        per_unit = {}
+        for spec in specs:
+            rule = RegisterRule(spec)
+            self.rules.append(rule)
+            address = spec['address']
+            if not 0 <= address <= MAX_REGISTER:
+                raise ValueError(f"Register address out of range: {address}")
+            unit_ids = spec.get('unit_id')
+            if unit_ids is None:
+                wildcard[address] = rule
+            else:
+                if isinstance(unit_ids, int):
+                    unit_ids = [unit_ids]
+                for unit_id in unit_ids:
+                    per_unit.setdefault(unit_id, {})[address] = rule
+
+        # Rules without a unit ID apply to every unit; unit-specific rules override them
+        return (_compile(wildcard),
+                {unit_id: _compile({**wildcard, **rules}) for unit_id, rules in per_unit.items()})
+
+    @classmethod
+    def load(cls, path):
+        """Load a register map from a .json or .yaml/.yml file"""
+        with open(path, encoding='utf-8') as f:
+            if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ValueError("PyYAML is required for YAML register maps (pip install pyyaml)")
+                config = yaml.safe_load(f)
+            else:
+                config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError(f"Invalid register map: {path}")
+        return cls(config)
+
+    def lookup(self, unit_id, register):
+        """Return the RegisterRule for (unit ID, register), or None"""
+        table = self.units.get(unit_id, self.default)
+        if 0 <= register < len(table):
+            return table[register]
+        return None
+
+    def lookup_coil(self, unit_id, coil):
+        """Return the RegisterRule for (unit ID, coil), or None"""
+        table = self.coil_units.get(unit_id, self.coil_default)
+        if 0 <= coil < len(table):
+            return table[coil]
+        return None
+
+    def check(self, unit_id, register, value):
+        """Check a single write; returns RegisterRule.check() output or None"""
+        rule = self.lookup(unit_id, register)
+        if rule is None:
+            return None
+        return rule.check(value)
+
+    def check_block(self, unit_id, start, values, coils=False):
+        """Check a multi-register (or multi-coil) write in one pass over its values.
+
+        Returns [(address, rule, RegisterRule.check() output)] for the values
+        that violate a rule; values without a rule cost one slice element.
+        """
+        units, default = (self.coil_units, self.coil_default) if coils else (self.units, self.default)
+        table = units.get(unit_id, default)
+        hits = []
+        for offset, (rule, value) in enumerate(zip(table[start:start + len(values)], values)):
+            if rule is not None and (value < rule.min or value > rule.max or value in rule.forbidden):
+                hits.append((start + offset, rule, rule.check(value)))
+        return hits
+
+    def violation_mask(self, unit_id, register, value, coils=False, readings=False):
+        """Vectorized check: boolean mask of writes that violate a rule.
+
+        With readings=True the values are PLC readings, checked against the
+        range only (as RegisterRule.check_reading does).
+        """
+        import numpy as np
+
+        units, default = (self.coil_units, self.coil_default) if coils else (self.units, self.default)
+        mask = np.zeros(len(register), dtype=bool)
+        for unit in np.unique(unit_id).tolist():
+            rows = unit_id == unit
+            table = units.get(unit, default)
+            if not table:
+                continue
+            mins = np.array([r.min if r else NO_MIN for r in table], dtype=np.int64)
+            maxs = np.array([r.max if r else NO_MAX for r in table], dtype=np.int64)
+            forbidden = np.array([addr * (NO_MAX + 1) + v
+                                  for addr, r in enumerate(table) if r
+                                  for v in r.forbidden], dtype=np.int64)
+
+            reg = register[rows].astype(np.int64)
+            val = value[rows].astype(np.int64)
+            known = (reg >= 0) & (reg < len(table))
+            idx = np.where(known, reg, 0)
+            hits = known & ((val < mins[idx]) | (val > maxs[idx]))
+            if len(forbidden) and not readings:
+                hits |= known & np.isin(reg * (NO_MAX + 1) + val, forbidden)
+            mask[rows] = hits
+        return mask
+
+
+def _compile(rules_by_address):
+    """Build a list indexed by register address (None where no rule exists)"""
+    if not rules_by_address:
+        return []
+    table = [None] * (max(rules_by_address) + 1)
+    for address, rule in rules_by_address.items():
+        table[address] = rule
+    return table
+
+
+def _severity(severity):
+    severity = str(severity).upper()
+    if severity not in SEVERITIES:
+        raise ValueError(f"Unknown severity: {severity}")
+    return severity
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Request Timing Analysis
+Learns the polling period of every (client, PLC, unit, function code) request
+stream and flags cadence breaks, jitter spikes and clients that start talking
+to a PLC after the traffic has settled. The tracker takes one request at a
+time (streaming input) or a whole event table as NumPy columns, with the same
+results either way
+"""
+
+from collections import deque
+
+LEARN_INTERVALS = 16        # first intervals of a stream its period is learned from (even)
+PERIODIC_JITTER = 0.1       # periodic: median absolute deviation at most this fraction of the period
+CADENCE_TOLERANCE = 0.5     # cadence break: interval off the period by more than this fraction of it
+JITTER_WINDOW = 8           # intervals in the rolling jitter window
+JITTER_FACTOR = 4.0         # jitter spike: mean deviation over the window above this many learned
+JITTER_FLOOR = 0.2          # deviations and above this fraction of the period
+TALKER_WARMUP = 60.0        # seconds after the first request before a new client/PLC pair is flagged
+MAX_TIMING_STREAMS = 65536  # streams (and client/PLC pairs) tracked; later ones are only counted
+
+
+class Cadence:
+    """Timing state of one request stream"""
+
+    __slots__ = ('last', 'intervals', 'learning', 'period', 'mad', 'periodic', 'limit',
+                 'recent', 'spiking')
+
+    def __init__(self, timestamp):
+        self.last = timestamp
+        self.intervals = 0          # intervals seen
+        self.learning = []          # first intervals, until the period is learned
+        self.period = self.mad = self.limit = None
+        self.periodic = None        # None while learning
+        self.recent = deque(maxlen=JITTER_WINDOW)   # deviations of the latest intervals
+        self.spiking = False
+
+    def learn(self, period, mad):
+        self.period = period
+        self.mad = mad
+        self.periodic = period > 0 and mad <= PERIODIC_JITTER * period
+        self.limit = max(JITTER_FACTOR * mad, JITTER_FLOOR * period)
+        self.learning = None
+
+    def __getstate__(self):
+        return (self.last, self.intervals, self.learning, self.period, self.mad, self.periodic,
+                self.limit, list(self.recent), self.spiking)
+
+    def __setstate__(self, state):
+        (self.last, self.intervals, self.learning, self.period, self.mad, self.periodic,
+         self.limit, recent, self.spiking) = state
+        self.recent = deque(recent, maxlen=JITTER_WINDOW)
+
+
+def _median(ordered):
+    half = len(ordered) // 2
+    return (ordered[half - 1] + ordered[half]) / 2
+
+
+def _learned_profile(intervals):
+    """(period, MAD) of the learning intervals: medians of an even number of values"""
+    period = _median(sorted(intervals))
+    return period, _median(sorted(abs(interval - period) for interval in intervals))
+
+
+class TimingTracker:
+    """Per-stream request cadence, learned from each stream's first intervals.
+
+    A stream is periodic when its learned intervals barely vary. After that,
+    an interval far from the period is a cadence break (an injected request
+    or a gap), and the mean deviation of the other intervals over a rolling
+    window flags a jitter spike once when it rises past its limit. Client/PLC
+    pairs first seen more than warmup seconds after the first request are new
+    talkers. Memory is bounded by max_streams.
+    """
+
+    def __init__(self, warmup=TALKER_WARMUP, max_streams=MAX_TIMING_STREAMS):
+        self.warmup = warmup
+        self.max_streams = max_streams
+        self.streams = {}           # (client, PLC, unit ID, function code) -> Cadence
+        self.talkers = set()        # (client, PLC)
+        self.first_time = None
+        self.untracked = 0          # requests of streams beyond max_streams
+
+    def __len__(self):
+        return len(self.streams)
+
+    def observe(self, stream, pair, timestamp):
+        """Add one request; returns its findings as (kind, value) pairs.
+
+        value is the offset into the traffic (s) for NEW_TALKER, the interval
+        (s) for CADENCE_BREAK and the mean window deviation (s) for JITTER_SPIKE.
+        """
+        findings = []
+        if self.first_time is None:
+            self.first_time = timestamp
+        if pair not in self.talkers and len(self.talkers) < self.max_streams:
+            self.talkers.add(pair)
+            offset = timestamp - self.first_time
+            if offset > self.warmup:
+                findings.append(('NEW_TALKER', offset))
+
+        cadence = self.streams.get(stream)
+        if cadence is None:
+            if len(self.streams) < self.max_streams:
+                self.streams[stream] = Cadence(timestamp)
+            else:
+                self.untracked += 1
+            return findings
+        interval = timestamp - cadence.last
+        cadence.last = timestamp
+        cadence.intervals += 1
+        if cadence.periodic is None:
+            cadence.learning.append(interval)
+            if len(cadence.learning) == LEARN_INTERVALS:
+                cadence.learn(*_learned_profile(cadence.learning))
+            return findings
+        if not cadence.periodic:
+            return findings
+
+        period = cadence.period
+        deviation = abs(interval - period)
+        if deviation > CADENCE_TOLERANCE * period:
+            findings.append(('CADENCE_BREAK', interval))
+            deviation = 0.0     # breaks are reported on their own, not as jitter
+        recent = cadence.recent
+        recent.append(deviation)
+        if len(recent) == JITTER_WINDOW:
+            total = 0.0
+            for value in recent:
+                total += value
+            mean = total / JITTER_WINDOW
+            spiking = mean > cadence.limit
+            if spiking and not cadence.spiking:
+                findings.append(('JITTER_SPIKE', mean))
+            cadence.spiking = spiking
+        return findings
+
+    def observe_batch(self, times, stream_codes, pair_codes, stream_key, pair_key):
+        """Add many requests at once (arrays in arrival order) with vectorized rules.
+
+        stream_codes/pair_codes are integer codes of each request's stream and
+        client/PLC pair, and stream_key/pair_key turn a code into its key.
+        Returns (row, kind, stream, value) findings ordered by row, exactly as
+        observe() would have reported them one request at a time. Python work
+        is per stream, not per request.
+        """
+        import numpy as np
+
+        findings = []
+        count = len(times)
+        if not count:
+            return findings
+        if self.first_time is None:
+            self.first_time = float(times[0])
+
+        # New talkers: the first request of each pair not seen before
+        codes, first_rows = np.unique(pair_codes, return_index=True)
+        offsets = times[first_rows] - self.first_time
+        for i in np.argsort(first_rows, kind='stable').tolist():
+            pair = pair_key(int(codes[i]))
+            if pair in self.talkers or len(self.talkers) >= self.max_streams:
+                continue
+            self.talkers.add(pair)
+            if offsets[i] > self.warmup:
+                findings.append((int(first_rows[i]), 0, 'NEW_TALKER', float(offsets[i])))
+
+        # Group requests by stream with one stable sort, keeping arrival order within each stream
+        order = np.argsort(stream_codes, kind='stable')
+        ordered = stream_codes[order]
+        heads = np.ones(count, dtype=bool)
+        heads[1:] = ordered[1:] != ordered[:-1]
+        starts = np.flatnonzero(heads)
+        groups = len(starts)
+        codes = ordered[starts]
+        first_rows = order[starts]
+        group = np.cumsum(heads) - 1
+        group_of = np.empty(count, dtype=group.dtype)
+        group_of[order] = group
+        ts = times[order]
+        sizes = np.diff(np.append(starts, count))
+        position = np.arange(count) - starts[group]
+
+        # Streams resumed from earlier traffic, and new ones admitted in order of first request
+        cadences = [None] * groups
+        keys = [None] * groups
+        fresh = np.zeros(groups, dtype=bool)
+        for g in np.argsort(first_rows, kind='stable').tolist():
+            key = keys[g] = stream_key(int(codes[g]))
+            cadence = self.streams.get(key)
+            if cadence is None and len(self.streams) < self.max_streams:
+                cadence = self.streams[key] = Cadence(None)
+                fresh[g] = True
+            cadences[g] = cadence
+        tracked = np.array([cadence is not None for cadence in cadences])
+        self.untracked += int(sizes[~tracked].sum())
+
+        # Seed per-stream arrays from the tracker state
+        window = JITTER_WINDOW
+        last = np.full(groups, np.nan)
+        seen = np.zeros(groups, dtype=np.int64)
+        learned = np.zeros(groups, dtype=bool)
+        periodic = np.zeros(groups, dtype=bool)
+        period = np.full(groups, np.nan)
+        limit = np.full(groups, np.nan)
+        spiking = np.zeros(groups, dtype=bool)
+        learning = np.full((groups, LEARN_INTERVALS), np.nan)
+        recent = np.full((groups, window - 1), np.nan)
+        for g, cadence in enumerate(cadences):
+            if cadence is None or fresh[g]:
+                continue
+            last[g] = cadence.last
+            seen[g] = cadence.intervals
+            if cadence.periodic is None:
+                learning[g, :len(cadence.learning)] = cadence.learning
+                continue
+            learned[g] = True
+            periodic[g] = cadence.periodic
+            period[g] = cadence.period
+            limit[g] = cadence.limit
+            spiking[g] = cadence.spiking
+            tail = list(cadence.recent)[-(window - 1):]
+            if tail:
+                recent[g, window - 1 - len(tail):] = tail
+
+        # Interval before each request (none for the first request of a new stream)
+        previous = np.empty(count)
+        previous[1:] = ts[:-1]
+        previous[heads] = last[group[heads]]
+        interval = ts - previous
+        valid = tracked[group] & ~np.isnan(interval)
+        index = seen[group] + position - fresh[group]      # interval number within its stream
+
+        # Learn the period of streams whose learning intervals are all in by now
+        rows = np.flatnonzero(valid & (index < LEARN_INTERVALS))
+        learning[group[rows], index[rows]] = interval[rows]
+        intervals = seen + sizes - fresh
+        completed = np.flatnonzero(tracked & ~learned & (intervals >= LEARN_INTERVALS))
+        if len(completed):
+            values = learning[completed]
+            half = LEARN_INTERVALS // 2
+            ordered = np.sort(values, axis=1)
+            medians = (ordered[:, half - 1] + ordered[:, half]) / 2
+            ordered = np.sort(np.abs(values - medians[:, None]), axis=1)
+            mads = (ordered[:, half - 1] + ordered[:, half]) / 2
+            period[completed] = medians
+            periodic[completed] = (medians > 0) & (mads <= PERIODIC_JITTER * medians)
+            limit[completed] = np.maximum(JITTER_FACTOR * mads, JITTER_FLOOR * medians)
+            for g, median, mad in zip(completed.tolist(), medians.tolist(), mads.tolist()):
+                cadences[g].learn(median, mad)
+
+        # Cadence breaks, and each later interval's deviation from the period
+        rows = np.flatnonzero(valid & (index >= LEARN_INTERVALS) & periodic[group])
+        expected = period[group[rows]]
+        deviation = np.abs(interval[rows] - expected)
+        breaks = deviation > CADENCE_TOLERANCE * expected
+        deviation[breaks] = 0.0
+        for row in rows[breaks].tolist():
+            findings.append((int(order[row]), 1, 'CADENCE_BREAK', float(interval[row])))
+
+        # Rolling windows over [earlier deviations | this batch] laid out per stream
+        extended = np.full(count + groups * (window - 1), np.nan)
+        block_starts = starts + np.arange(groups) * (window - 1)
+        extended[block_starts[:, None] + np.arange(window - 1)] = recent
+        slot = np.arange(count) + (group + 1) * (window - 1)
+        extended[slot[rows]] = deviation
+        full = rows[index[rows] >= LEARN_INTERVALS + window - 1]
+        total = np.zeros(len(full))
+        for back in range(window - 1, -1, -1):
+            total = total + extended[slot[full] - back]
+        means = total / window
+        full_group = group[full]
+        spikes = means > limit[full_group]
+        before = np.empty(len(full), dtype=bool)
+        before[1:] = spikes[:-1]
+        firsts = np.ones(len(full), dtype=bool)
+        firsts[1:] = full_group[1:] != full_group[:-1]
+        before[firsts] = spiking[full_group[firsts]]
+        onsets = spikes & ~before
+        for row, mean in zip(full[onsets].tolist(), means[onsets].tolist()):
+            findings.append((int(order[row]), 2, 'JITTER_SPIKE', mean))
+
+        # Store what the next requests of each stream continue from
+        lasts = ts[starts + sizes - 1]
+        block_ends = block_starts + (window - 1) + sizes
+        last_spike = dict(zip(full_group.tolist(), spikes.tolist()))    # latest window per stream
+        for g, cadence in enumerate(cadences):
+            if cadence is None:
+                continue
+            cadence.last = float(lasts[g])
+            cadence.intervals = int(intervals[g])
+            if cadence.periodic is None:
+                cadence.learning = learning[g, :cadence.intervals].tolist()
+                continue
+            if cadence.periodic:
+                tail = extended[block_ends[g] - window:block_ends[g]]
+                cadence.recent = deque(tail[~np.isnan(tail)].tolist(), maxlen=window)
+                cadence.spiking = last_spike.get(g, cadence.spiking)
+
+        # By row, then in observe() order: new talker, cadence break, jitter spike
+        findings.sort(key=lambda finding: (finding[0], finding[1]))
+        return [(row, kind, keys[group_of[row]], value) for row, _, kind, value in findings]
+
+    def periodic_streams(self):
+        """(stream, Cadence) of the periodic streams, most intervals first"""
+        streams = [(key, cadence) for key, cadence in self.streams.items() if cadence.periodic]
+        return sorted(streams, key=lambda item: -item[1].intervals)
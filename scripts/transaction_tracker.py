@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+ICS Security Monitoring - Modbus Transaction Correlation
+Matches responses to requests by (flow, transaction ID) and records
+request -> response latency per PLC as log-bucketed histograms
+"""
+
+import math
+from collections import OrderedDict
+
+MAX_PENDING = 100000          # outstanding requests kept for matching
+TRANSACTION_TIMEOUT = 10.0    # seconds before an unanswered request is dropped
+
+# Histogram buckets grow by 5%, so percentiles are accurate to about 5%
+HISTOGRAM_GROWTH = 1.05
+_INV_LOG_GROWTH = 1.0 / math.log(HISTOGRAM_GROWTH)
+
+
+class PendingRequest:
+    __slots__ = ('time', 'unit_id', 'func_code', 'start', 'count')
+
+    def __init__(self, time, unit_id, func_code, start, count):
+        self.time = time
+        self.unit_id = unit_id
+        self.func_code = func_code
+        self.start = start
+        self.count = count
+
+
+class LatencyHistogram:
+    """Fixed-precision latency histogram (sparse log buckets, constant memory)"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = seconds * 1e6
+        index = int(math.log(micros) * _INV_LOG_GROWTH) if micros > 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        """Latency in seconds below which pct percent of samples fall"""
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100.0
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                # Upper edge of the bucket, capped by the largest sample
+                return min(HISTOGRAM_GROWTH ** (index + 1) / 1e6, self.max)
+        return self.max
+
+
+class TransactionTracker:
+    """Bounded table of outstanding requests keyed by (flow, transaction ID)"""
+
+    def __init__(self, max_pending=MAX_PENDING, timeout=TRANSACTION_TIMEOUT):
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = OrderedDict()
+        self.latency = {}       # PLC address -> LatencyHistogram
+        self.stats = {'matched': 0, 'unmatched_responses': 0, 'expired_requests': 0}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add_request(self, client, server, trans_id, request):
+        """Remember a request until its response arrives (or it times out)"""
+        pending = self.pending
+        key = (client, server, trans_id)
+        if key in pending:
+            # Transaction ID reused before the previous one was answered
+            del pending[key]
+        pending[key] = request
+        self._expire(request.time)
+        if len(pending) > self.max_pending:
+            pending.popitem(last=False)
+            self.stats['expired_requests'] += 1
+
+    def match_response(self, client, server, trans_id, time):
+        """Return the matching PendingRequest (and record its latency), or None"""
+        request = self.pending.pop((client, server, trans_id), None)
+        if request is None:
+            self.stats['unmatched_responses'] += 1
+            return None
+        self.stats['matched'] += 1
+        histogram = self.latency.get(server[0])
+        if histogram is None:
+            histogram = self.latency[server[0]] = LatencyHistogram()
+        histogram.record(max(time - request.time, 0.0))
+        return request
+
+    def _expire(self, now):
+        """Drop requests older than the timeout (oldest first)"""
+        cutoff = now - self.timeout
+        pending = self.pending
+        while pending:
+            request = next(iter(pending.values()))
+            if request.time >= cutoff:
+                break
+            pending.popitem(last=False)
+            self.stats['expired_requests'] += 1
@@ -3,7 +3,14 @@
 Modbus HMI Simulator - pymodbus 3.11.3 compatible
 """
 
-from pymodbus.client import ModbusTcpClient
+from pymodbus.client import ModbusTcpClient, AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+from array import array
+import argparse
+import asyncio
+import json
+import random
+import sys
 import time
 import logging
 
@@ -135,8 +142,224 @@ class HMISimulator:
         self.client.close()
         log.info("HMI disconnected from PLC")
 
-if __name__ == "__main__":
-    hmi = HMISimulator()
+
+
+class HMIFleet:
+    """Many simulated HMIs polling PLCs over a shared pool of async connections.
+    
+    Each HMI does what HMISimulator.normal_operation() does (read the sensor
+    block, sometimes write the motor speed), on its own poll schedule. Polls
+    are scheduled on absolute deadlines, so an overloaded PLC shows up as late
+    polls and a lower achieved rate rather than a silently slower loop.
+    """
+    
+    MOTOR_SPEED_REGISTER = 2
+    
+    def __init__(self, plc_host='127.0.0.1', ports=(502,), hmis=100, connections=None,
+                 poll_interval=1.0, block_size=4, write_ratio=0.0, unit_ids=(1,), timeout=3.0):
+        self.plc_host = plc_host
+        self.ports = list(ports)
+        self.hmis = hmis
+        # One connection per HMI unless a smaller pool is requested
+        self.connections = max(connections or hmis, len(self.ports))
+        self.poll_interval = poll_interval
+        self.block_size = block_size
+        self.write_ratio = write_ratio
+        self.unit_ids = list(unit_ids)
+        self.timeout = timeout
+        self.pools = {}
+        self.clients = []
+        self._reset()
+    
+    def _reset(self):
+        self.latencies = array('d')
+        self.reads = self.writes = self.errors = self.late_polls = 0
+    
+    async def connect(self):
+        """Open the connection pool, spread evenly over the PLC ports"""
+        for port in self.ports:
+            self.pools[port] = asyncio.Queue()
+        clients = [(self.ports[i % len(self.ports)],
+                    AsyncModbusTcpClient(self.plc_host, port=self.ports[i % len(self.ports)],
+                                         timeout=self.timeout, retries=0))
+                   for i in range(self.connections)]
+        results = await asyncio.gather(*(client.connect() for _, client in clients))
+        for (port, client), ok in zip(clients, results):
+            if ok:
+                self.clients.append(client)
+                self.pools[port].put_nowait(client)
+        empty = [port for port, pool in self.pools.items() if pool.empty()]
+        if empty:
+            raise ConnectionError(f"Could not connect to {self.plc_host} on port(s) {empty}")
+        log.info(f"✓ Fleet connected: {len(self.clients)}/{self.connections} connections "
+                 f"to {self.plc_host} ports {self.ports}")
+    
+    def close(self):
+        for client in self.clients:
+            client.close()
+    
+    async def _hmi(self, index, end):
+        loop = asyncio.get_running_loop()
+        pool = self.pools[self.ports[index % len(self.ports)]]
+        unit_id = self.unit_ids[index % len(self.unit_ids)]
+        interval = self.poll_interval
+        # Random phase so HMIs do not poll in lockstep
+        deadline = loop.time() + random.uniform(0, interval)
+        while deadline < end:
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > interval:
+                # Missed whole poll slots: skip them, as a real HMI would
+                missed = int(-delay / interval)
+                self.late_polls += missed
+                deadline += missed * interval
+            deadline += interval
+            
+            write = self.write_ratio and random.random() < self.write_ratio
+            client = await pool.get()
+            started = time.perf_counter()
+            try:
+                if write:
+                    result = await client.write_register(self.MOTOR_SPEED_REGISTER,
+                                                         random.randint(1450, 1550), device_id=unit_id)
+                else:
+                    result = await client.read_holding_registers(0, count=self.block_size,
+                                                                 device_id=unit_id)
+            except ModbusException:
+                self.errors += 1
+                continue
+            finally:
+                pool.put_nowait(client)
+            if result.isError():
+                self.errors += 1
+                continue
+            self.latencies.append(time.perf_counter() - started)
+            if write:
+                self.writes += 1
+            else:
+                self.reads += 1
+    
+    async def run(self, duration):
+        """Poll for duration seconds and return throughput/latency statistics"""
+        self._reset()
+        end = asyncio.get_running_loop().time() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(self._hmi(i, end) for i in range(self.hmis)))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(self.latencies)
+        completed = self.reads + self.writes
+        return {
+            'hmis': self.hmis,
+            'poll_interval': self.poll_interval,
+            'target_rate': self.hmis / self.poll_interval,
+            'achieved_rate': completed / elapsed,
+            'reads': self.reads,
+            'writes': self.writes,
+            'errors': self.errors,
+            'late_polls': self.late_polls,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'p999_ms': _percentile(latencies, 99.9) * 1000,
+        }
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def log_fleet_stats(stats):
+    log.info(f"📊 Fleet: target {stats['target_rate']:.0f} req/s, achieved {stats['achieved_rate']:.0f} req/s "
+             f"({stats['reads']} reads, {stats['writes']} writes, {stats['errors']} errors, "
+             f"{stats['late_polls']} late polls) | latency p50 {stats['p50_ms']:.2f} ms, "
+             f"p99 {stats['p99_ms']:.2f} ms, p99.9 {stats['p999_ms']:.2f} ms")
+
+
+def keeping_up(stats, tolerance=0.9):
+    """True while the PLC answers (almost) every scheduled poll"""
+    return (stats['achieved_rate'] >= tolerance * stats['target_rate']
+            and not stats['errors'] and not stats['late_polls'])
+
+
+async def run_fleet(args):
+    fleet = HMIFleet(args.host, args.ports, hmis=args.hmis, connections=args.connections,
+                     poll_interval=args.poll_interval, block_size=args.block_size,
+                     write_ratio=args.write_ratio, unit_ids=args.unit_ids, timeout=args.timeout)
+    await fleet.connect()
+    results = []
+    try:
+        for step in range(max(args.ramp, 1)):
+            stats = await fleet.run(args.duration)
+            log_fleet_stats(stats)
+            results.append(stats)
+            if args.ramp and not keeping_up(stats):
+                log.warning(f"⚠️  PLC fell behind at {stats['target_rate']:.0f} req/s")
+                break
+            fleet.poll_interval /= args.ramp_factor
+    finally:
+        fleet.close()
+    
+    if args.ramp:
+        sustained = [s['target_rate'] for s in results if keeping_up(s)]
+        if sustained:
+            log.info(f"✓ Highest sustained poll rate: {max(sustained):.0f} req/s")
+        else:
+            log.info("✗ The PLC did not keep up with the first step")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        log.info(f"Results written to {args.output}")
+
+
+def _int_list(text):
+    return [int(part) for part in text.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modbus/TCP HMI simulator")
+    parser.add_argument('--host', default='127.0.0.1', help="PLC address (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=502, help="PLC port for the single HMI")
+    parser.add_argument('--fleet', action='store_true',
+                        help="run many concurrent HMIs instead of one interactive HMI")
+    fleet = parser.add_argument_group('fleet mode')
+    fleet.add_argument('--hmis', type=int, default=100, help="number of HMIs (default: %(default)s)")
+    fleet.add_argument('--ports', type=_int_list, default=None,
+                       help="comma-separated PLC ports the HMIs are spread over (default: --port)")
+    fleet.add_argument('--connections', type=int, help="connection pool size (default: one per HMI)")
+    fleet.add_argument('--poll-interval', type=float, default=10.0,
+                       help="seconds between polls per HMI (default: %(default)s)")
+    fleet.add_argument('--block-size', type=int, default=4,
+                       help="holding registers per read (default: %(default)s)")
+    fleet.add_argument('--write-ratio', type=float, default=0.0,
+                       help="fraction of polls that write the motor speed instead of reading")
+    fleet.add_argument('--unit-ids', type=_int_list, default=[1],
+                       help="comma-separated unit IDs the HMIs are spread over (default: 1)")
+    fleet.add_argument('--duration', type=float, default=30.0,
+                       help="seconds per run or ramp step (default: %(default)s)")
+    fleet.add_argument('--ramp', type=int, default=0, metavar='STEPS',
+                       help="up to STEPS runs, each polling --ramp-factor times faster, "
+                            "stopping when the PLC falls behind")
+    fleet.add_argument('--ramp-factor', type=float, default=2.0)
+    fleet.add_argument('--timeout', type=float, default=3.0, help="request timeout in seconds")
+    fleet.add_argument('--output', metavar='FILE', help="write per-run statistics as JSON")
+    args = parser.parse_args()
+    
+    if args.fleet:
+        # Per-packet debug logging would dominate a fleet run
+        log.setLevel(logging.INFO)
+        args.ports = args.ports or [args.port]
+        try:
+            asyncio.run(run_fleet(args))
+        except KeyboardInterrupt:
+            pass
+        except (ConnectionError, OSError) as e:
+            log.error(f"✗ Fleet failed: {e}")
+            sys.exit(1)
+        return
+    
+    hmi = HMISimulator(args.host, args.port)
     
     if hmi.connect():
         try:
@@ -146,3 +369,6 @@ if __name__ == "__main__":
     else:
         log.error("Could not establish connection to PLC")
         log.error("Exiting...")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,15 @@
 """
 Modbus PLC Simulator - pymodbus 3.11.3
 Using ModbusDeviceContext for proper data store setup
+
+Farm mode (--farm CONFIG) serves many PLCs (ports) and unit IDs from one
+asyncio event loop and reports requests/sec and response latency
+
+Guard mode (--guard) rejects client writes that break the register rules
+before they reach the registers, and keeps a binary audit ring of writes
+
+Pipelined requests (several ADUs sent before the first is answered, or in
+one segment) are all answered, in order
 """
 
 from pymodbus.datastore import (
@@ -9,78 +18,414 @@ from pymodbus.datastore import (
     ModbusDeviceContext,
     ModbusServerContext
 )
-from pymodbus.server import StartTcpServer
+from pymodbus.constants import ExcCodes
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.requesthandler import ServerRequestHandler
+from register_guard import GUARD_RULES, AuditRing, GuardedRegisterBlock, guard_summary, load_guard_rules
+import argparse
+import asyncio
+import json
 import logging
+import os
 import random
+import sys
 import time
+from collections import deque
 from threading import Thread
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 log = logging.getLogger(__name__)
 
-# Create data blocks for all register types
-di_block = ModbusSequentialDataBlock(0, [0]*100)  # Discrete Inputs
-co_block = ModbusSequentialDataBlock(0, [0]*100)  # Coils
-ir_block = ModbusSequentialDataBlock(0, [0]*100)  # Input Registers
-hr_block = ModbusSequentialDataBlock(1, [0]*100)  # Holding Registers (start at 1 for ModbusDeviceContext)
-
-# Set initial PLC values in holding registers - START AT ADDRESS 1
-values = [250, 1000, 1500, 0]  # temp, pressure, motor, valve
-hr_block.setValues(1, values)  # Write to address 1 (will be read as address 0)
-
-# Create device context - this wraps all the data blocks properly
-device_context = ModbusDeviceContext(
-    di=di_block,
-    co=co_block,
-    ir=ir_block,
-    hr=hr_block
-)
+# Initial holding register values: temp, pressure, motor, valve
+INITIAL_VALUES = [250, 1000, 1500, 0]
+
+# Sensor drift bands per register (None = not a sensor, keep its value)
+SENSOR_BANDS = [(240, 260), (950, 1050), (1450, 1550), None]
+
+SENSOR_INTERVAL = 5          # seconds between sensor updates
+STATS_INTERVAL = 10          # seconds between farm statistics lines
+LATENCY_SAMPLES = 100000     # latencies kept per statistics interval
+
+
+def create_device(values, guard=None, audit=None, port=0, unit_id=0):
+    """Build one device context (holding registers start at 1, read as address 0).
+
+    With guard rules the holding registers are a GuardedRegisterBlock.
+    """
+    if guard is not None:
+        hr_block = GuardedRegisterBlock(1, list(values) + [0]*(100 - len(values)), guard,
+                                        audit, port, unit_id)
+    else:
+        hr_block = ModbusSequentialDataBlock(1, [0]*100)
+        hr_block.setValues(1, values)
+    device = ModbusDeviceContext(
+        di=ModbusSequentialDataBlock(0, [0]*100),
+        co=ModbusSequentialDataBlock(0, [0]*100),
+        ir=ModbusSequentialDataBlock(0, [0]*100),
+        hr=hr_block
+    )
+    return device, hr_block
+
+
+def update_sensors(hr_block, bands):
+    """Write new random sensor readings, keeping non-sensor registers as they are"""
+    if isinstance(hr_block, GuardedRegisterBlock):
+        return hr_block.update_sensors(bands)
+    current = hr_block.getValues(1, len(bands))
+    values = [random.randint(*band) if band else current[i] for i, band in enumerate(bands)]
+    hr_block.setValues(1, values)
+    return values
+
+
+def run_single_plc(port=502, guard=None, audit=None):
+    """Original single PLC: unit 1, four registers, sensor thread"""
+    # Create device context - this wraps all the data blocks properly
+    device_context, hr_block = create_device(INITIAL_VALUES, guard, audit, port, 1)
+
+    # Create server context with the device
+    context = ModbusServerContext(devices=device_context, single=True)
+
+    log.info("=" * 60)
+    log.info("PLC INITIALIZED - Modbus Server Ready")
+    log.info("=" * 60)
+    log.info("Unit ID: 1")
+    log.info("Register 0: Temperature = 250 (25.0°C)")
+    log.info("Register 1: Pressure = 1000 PSI")
+    log.info("Register 2: Motor Speed = 1500 RPM")
+    log.info("Register 3: Safety Valve = 0 (Closed)")
+    if guard is not None:
+        log.info(f"Write guard: ON ({len(guard)} register rules)")
+    log.info("=" * 60)
+
+    def simulate_sensors():
+        """Update sensor values to simulate real PLC"""
+        iteration = 0
+        while True:
+            iteration += 1
+            temp, pressure, motor, valve = update_sensors(hr_block, SENSOR_BANDS)
+
+            # DEBUG: Read back what we just wrote
+            if iteration % 12 == 0:
+                stored = hr_block.snapshot(4) if guard is not None else hr_block.getValues(1, 4)
+                log.info(f"📊 Writing: Temp={temp}, Press={pressure}, Motor={motor}, Valve={valve}")
+                log.info(f"📊 Stored at addresses [1-4]: {stored}")
+
+            time.sleep(SENSOR_INTERVAL)
+
+    # Start sensor simulation in background
+    Thread(target=simulate_sensors, daemon=True).start()
+
+    log.info(f"\nStarting Modbus TCP Server on 0.0.0.0:{port}")
+    log.info("Press Ctrl+C to stop\n")
+
+    # Start the server
+    try:
+        asyncio.run(serve_pipelined(context, address=("0.0.0.0", port)))
+    except KeyboardInterrupt:
+        log.info("\nShutting down PLC...")
+    if guard is not None:
+        writes, rejected, check_us = guard_summary([hr_block])
+        log.info(f"🛡️  Write guard: {writes} writes, {rejected} blocked, {check_us:.2f} µs/write check")
+
+
+class FarmStats:
+    """Request counters and response latencies shared by every farm server"""
+
+    def __init__(self):
+        self.requests = 0
+        self.responses = 0
+        self.errors = 0
+        self.connections = 0
+        self.peak_connections = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.started = time.perf_counter()
+
+    def connection_tracers(self):
+        """trace_pdu/trace_connect callbacks for one client connection.
+
+        Requests are matched to responses by transaction ID within the
+        connection, so concurrent HMIs reusing the same IDs do not collide.
+        """
+        pending = {}
+        perf_counter = time.perf_counter
+
+        def trace_pdu(sending, pdu):
+            if sending:
+                started = pending.pop(pdu.transaction_id, None)
+                if started is not None:
+                    self.latencies.append(perf_counter() - started)
+                self.responses += 1
+                if pdu.isError():
+                    self.errors += 1
+            else:
+                self.requests += 1
+                pending[pdu.transaction_id] = perf_counter()
+            return pdu
+
+        def trace_connect(connected):
+            if connected:
+                self.connections += 1
+                self.peak_connections = max(self.peak_connections, self.connections)
+            else:
+                self.connections -= 1
+                pending.clear()
+
+        return trace_pdu, trace_connect
+
+    def snapshot(self):
+        """Counters since the last snapshot; resets the latency window"""
+        now = time.perf_counter()
+        elapsed = max(now - self.started, 1e-9)
+        latencies = sorted(self.latencies)
+        self.latencies.clear()
+        snapshot = {
+            'requests': self.requests,
+            'responses': self.responses,
+            'errors': self.errors,
+            'requests_per_sec': self.requests / elapsed,
+            'connections': self.connections,
+            'peak_connections': self.peak_connections,
+            'p50_ms': _percentile(latencies, 50) * 1000,
+            'p99_ms': _percentile(latencies, 99) * 1000,
+            'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        }
+        self.requests = self.responses = self.errors = 0
+        self.started = now
+        return snapshot
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class PipelinedRequestHandler(ServerRequestHandler):
+    """Client connection that answers every request it receives, in order.
+
+    pymodbus frames one ADU per read into last_pdu and clears its receive
+    buffer on every send, so requests pipelined behind the first were lost.
+    Here every complete ADU of a read is queued, one task per connection
+    answers the queue, and a partial ADU is kept across sends.
+    """
+
+    def __init__(self, owner, trace_packet, trace_pdu, trace_connect):
+        super().__init__(owner, trace_packet, trace_pdu, trace_connect)
+        self.queue = asyncio.Queue()
+        self.worker = None
 
-# Create server context with the device
-context = ModbusServerContext(devices=device_context, single=True)
-
-log.info("=" * 60)
-log.info("PLC INITIALIZED - Modbus Server Ready")
-log.info("=" * 60)
-log.info("Unit ID: 1")
-log.info("Register 0: Temperature = 250 (25.0°C)")
-log.info("Register 1: Pressure = 1000 PSI")
-log.info("Register 2: Motor Speed = 1500 RPM")
-log.info("Register 3: Safety Valve = 0 (Closed)")
-log.info("=" * 60)
-
-def simulate_sensors():
-    """Update sensor values to simulate real PLC"""
-    iteration = 0
+    def callback_data(self, data, addr=None):
+        used = 0
+        while used < len(data):
+            try:
+                cut, pdu = self.framer.handleFrame(self.trace_packet(False, data[used:]), 0, 0)
+            except ModbusIOException:
+                self.server_send(ExceptionResponse(40, exception_code=ExcCodes.ILLEGAL_FUNCTION), 0)
+                return len(data)
+            if not cut:
+                break       # partial ADU: wait for the rest
+            used += cut
+            if pdu:
+                self.queue.put_nowait((self.trace_pdu(False, pdu), addr))
+        if self.worker is None and not self.queue.empty():
+            self.worker = asyncio.get_running_loop().create_task(self.answer_requests())
+        return used
+
+    async def answer_requests(self):
+        while True:
+            self.last_pdu, self.last_addr = await self.queue.get()
+            await self.handle_request()
+
+    def send(self, data, addr=None):
+        pending = self.recv_buffer
+        super().send(data, addr)
+        self.recv_buffer = pending
+
+    def callback_disconnected(self, exc):
+        if self.worker is not None:
+            self.worker.cancel()
+        super().callback_disconnected(exc)
+
+
+class PipelinedTcpServer(ModbusTcpServer):
+    """ModbusTcpServer whose connections answer pipelined requests"""
+
+    def callback_new_connection(self):
+        return PipelinedRequestHandler(self, self.trace_packet, self.trace_pdu, self.trace_connect)
+
+
+async def serve_pipelined(context, **kwargs):
+    """StartAsyncTcpServer with pipelined request handling"""
+    await PipelinedTcpServer(context, **kwargs).serve_forever()
+
+
+class FarmServer(PipelinedTcpServer):
+    """PipelinedTcpServer whose connections report to a shared FarmStats"""
+
+    def __init__(self, context, stats, **kwargs):
+        super().__init__(context, **kwargs)
+        self.stats = stats
+
+    def callback_new_connection(self):
+        trace_pdu, trace_connect = self.stats.connection_tracers()
+        return PipelinedRequestHandler(self, self.trace_packet, trace_pdu, trace_connect)
+
+
+def load_farm_config(path):
+    """Load a farm description from a .json or .yaml/.yml file"""
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required for YAML farm configs (pip install pyyaml)")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if not isinstance(config, dict) or not config.get('plcs'):
+        raise ValueError(f"Invalid farm config (no 'plcs' list): {path}")
+    return config
+
+
+def build_farm(config, guard=None, audit=None):
+    """Expand the config into (port, server context, [(unit ID, hr block)], spec) per PLC"""
+    plcs = []
+    ports = set()
+    for spec in config['plcs']:
+        first_port = spec['port']
+        unit_ids = spec.get('unit_ids') or list(range(1, spec.get('unit_count', 1) + 1))
+        values = spec.get('registers', INITIAL_VALUES)
+        for port in range(first_port, first_port + spec.get('port_count', 1)):
+            if port in ports:
+                raise ValueError(f"Port {port} is used by more than one PLC")
+            ports.add(port)
+            devices = {}
+            blocks = []
+            for unit_id in unit_ids:
+                device, hr_block = create_device(values, guard, audit, port, unit_id)
+                devices[unit_id] = device
+                blocks.append((unit_id, hr_block))
+            plcs.append((port, ModbusServerContext(devices=devices, single=False), blocks, spec))
+    return plcs
+
+
+async def sensor_task(blocks, bands, interval):
+    """Drift the sensor registers of one PLC's devices every interval seconds"""
+    # Random phase so thousands of PLCs do not all update at the same instant
+    await asyncio.sleep(random.uniform(0, interval))
     while True:
-        iteration += 1
-        temp = random.randint(240, 260)
-        pressure = random.randint(950, 1050)
-        motor = random.randint(1450, 1550)
-        
-        # Read current valve state (address 4, which maps to register 3)
-        current_values = hr_block.getValues(1, 4)
-        valve = current_values[3]
-        
-        # Write all 4 values at once starting at address 1
-        hr_block.setValues(1, [temp, pressure, motor, valve])
-        
-        # DEBUG: Read back what we just wrote
-        if iteration % 12 == 0:
-            stored = hr_block.getValues(1, 4)
-            log.info(f"📊 Writing: Temp={temp}, Press={pressure}, Motor={motor}, Valve={valve}")
-            log.info(f"📊 Stored at addresses [1-4]: {stored}")
-        
-        time.sleep(5)
-
-# Start sensor simulation in background
-Thread(target=simulate_sensors, daemon=True).start()
-
-log.info("\nStarting Modbus TCP Server on 0.0.0.0:502")
-log.info("Press Ctrl+C to stop\n")
-
-# Start the server
-try:
-    StartTcpServer(context=context, address=("0.0.0.0", 502))
-except KeyboardInterrupt:
-    log.info("\nShutting down PLC...")
+        for _, hr_block in blocks:
+            update_sensors(hr_block, bands)
+        await asyncio.sleep(interval)
+
+
+async def stats_task(stats, interval, guarded=()):
+    while True:
+        await asyncio.sleep(interval)
+        s = stats.snapshot()
+        log.info(f"📈 Farm: {s['connections']} connections (peak {s['peak_connections']}), "
+                 f"{s['requests_per_sec']:.0f} req/s, p50 {s['p50_ms']:.2f} ms, "
+                 f"p99 {s['p99_ms']:.2f} ms, max {s['max_ms']:.2f} ms, {s['errors']} errors")
+        if guarded:
+            writes, rejected, check_us = guard_summary(guarded)
+            log.info(f"🛡️  Guard: {writes} writes, {rejected} blocked, {check_us:.2f} µs/write check")
+
+
+async def run_farm(config, guard=None, audit=None):
+    """Serve every PLC in the config from this event loop until cancelled"""
+    host = config.get('host', '0.0.0.0')
+    plcs = build_farm(config, guard, audit)
+    stats = FarmStats()
+    guarded = [hr_block for _, _, blocks, _ in plcs for _, hr_block in blocks] if guard is not None else ()
+
+    servers = []
+    tasks = []
+    for port, context, blocks, spec in plcs:
+        server = FarmServer(context, stats, address=(host, port),
+                            ignore_missing_devices=spec.get('ignore_missing_devices', False))
+        servers.append(server)
+        await server.serve_forever(background=True)
+        bands = spec.get('sensors', SENSOR_BANDS)
+        tasks.append(asyncio.create_task(
+            sensor_task(blocks, bands, spec.get('update_interval', SENSOR_INTERVAL))))
+    tasks.append(asyncio.create_task(
+        stats_task(stats, config.get('stats_interval', STATS_INTERVAL), guarded)))
+
+    devices = sum(len(blocks) for _, _, blocks, _ in plcs)
+    log.info("=" * 60)
+    log.info(f"PLC FARM READY - {len(plcs)} PLC(s), {devices} unit(s)")
+    log.info(f"Ports: {plcs[0][0]}-{plcs[-1][0]} on {host}")
+    log.info("=" * 60)
+    log.info("Press Ctrl+C to stop\n")
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for server in servers:
+            await server.shutdown()
+        s = stats.snapshot()
+        log.info(f"\nShutting down PLC farm (peak {s['peak_connections']} connections)...")
+
+
+def raise_file_limit():
+    """Allow as many open sockets as the hard limit permits (one per HMI connection)"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modbus/TCP PLC simulator")
+    parser.add_argument('--port', type=int, default=502, help="port of the single PLC (default: 502)")
+    parser.add_argument('--farm', metavar='CONFIG',
+                        help="JSON/YAML farm config: many PLCs and unit IDs in one event loop")
+    parser.add_argument('--guard', action='store_true',
+                        help="reject client writes outside the register rules (exception response)")
+    parser.add_argument('--guard-map', metavar='FILE',
+                        help="JSON/YAML register map with the guard rules (implies --guard; "
+                             "default: built-in limits)")
+    parser.add_argument('--audit', metavar='FILE',
+                        help="with --guard, save the write audit ring to FILE on shutdown")
+    args = parser.parse_args()
+
+    guard = audit = None
+    if args.guard or args.guard_map:
+        try:
+            guard = load_guard_rules(args.guard_map) if args.guard_map else GUARD_RULES
+        except (OSError, ValueError) as e:
+            log.error(f"Error loading guard rules: {e}")
+            sys.exit(1)
+        audit = AuditRing()
+
+    if not args.farm:
+        run_single_plc(args.port, guard, audit)
+    else:
+        try:
+            config = load_farm_config(args.farm)
+        except (OSError, ValueError) as e:
+            log.error(f"Error loading farm config: {e}")
+            sys.exit(1)
+        raise_file_limit()
+        try:
+            asyncio.run(run_farm(config, guard, audit))
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            log.error(f"PLC farm failed: {e}")
+            sys.exit(1)
+
+    if audit is not None and args.audit:
+        audit.dump(args.audit)
+        log.info(f"🛡️  {len(audit)} audit records written to {args.audit}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Modbus PLC Simulator - Inline Write Guard
+Array-backed holding register store that checks every client write against
+per-register range/forbidden-value rules before committing it, and records
+each written register in a fixed-size binary audit ring
+"""
+
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore.store import BaseModbusDataBlock
+from array import array
+import json
+import logging
+import os
+import random
+import struct
+import time
+
+log = logging.getLogger(__name__)
+
+# Built-in rules: the limits of the detector's default register map
+# (register address, as seen by clients, and raw values)
+GUARD_RULES = [
+    {'address': 0, 'name': 'Temperature', 'range': [200, 300]},
+    {'address': 1, 'name': 'Pressure', 'range': [900, 1100]},
+    {'address': 2, 'name': 'Motor Speed', 'range': [1400, 1600], 'forbidden': [0]},
+    {'address': 3, 'name': 'Safety Valve', 'forbidden': [1]},
+]
+
+# Records kept in the audit ring before the oldest are overwritten
+AUDIT_RECORDS = 65536
+
+MAX_VALUE = 0xFFFF
+
+
+def load_guard_rules(path):
+    """Read the 'registers' list of a JSON/YAML register map (same format as
+    detect_anomalies.py --register-map; only address, range, forbidden and
+    unit_id are used)"""
+    with open(path, encoding='utf-8') as f:
+        if os.path.splitext(path)[1].lower() in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required for YAML register maps (pip install pyyaml)")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if not isinstance(config, dict) or not config.get('registers'):
+        raise ValueError(f"Invalid register map (no 'registers' list): {path}")
+    return config['registers']
+
+
+def compile_rules(rules, unit_id, size):
+    """Direct-indexed (low, high, forbidden) tables for one unit's first size registers.
+
+    Rules without a unit_id apply to every unit; unit-specific rules override them.
+    """
+    selected = {}
+    for specific in (False, True):
+        for rule in rules:
+            unit_ids = rule.get('unit_id')
+            if isinstance(unit_ids, int):
+                unit_ids = [unit_ids]
+            if (unit_ids is not None) != specific or (specific and unit_id not in unit_ids):
+                continue
+            selected[rule['address']] = rule
+    low = array('l', [0]) * size
+    high = array('l', [MAX_VALUE]) * size
+    forbidden = {}
+    for address, rule in selected.items():
+        if not 0 <= address < size:
+            continue
+        if rule.get('range') is not None:
+            low[address], high[address] = rule['range']
+        values = [entry['value'] if isinstance(entry, dict) else entry
+                  for entry in rule.get('forbidden', [])]
+        if values:
+            forbidden[address] = frozenset(values)
+    return low, high, forbidden
+
+
+class AuditRing:
+    """Fixed-size binary log of written registers; the oldest records are overwritten.
+
+    One RECORD per register: wall-clock time of the write (time.time()), PLC
+    port, unit ID, register address, value and whether the write was
+    accepted. dump() writes the kept records oldest first, readable with
+    RECORD.iter_unpack().
+    """
+
+    RECORD = struct.Struct('<dHBHH?')
+
+    def __init__(self, capacity=AUDIT_RECORDS):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * self.RECORD.size)
+        self.count = 0      # records ever appended
+
+    def append(self, timestamp, port, unit_id, address, values, accepted):
+        pack_into = self.RECORD.pack_into
+        size = self.RECORD.size
+        capacity = self.capacity
+        index = self.count
+        for offset, value in enumerate(values):
+            pack_into(self.buffer, ((index + offset) % capacity) * size,
+                      timestamp, port, unit_id, address + offset, value, accepted)
+        self.count = index + len(values)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def ordered(self):
+        """The kept records as bytes, oldest first"""
+        if self.count <= self.capacity:
+            return bytes(self.buffer[:self.count * self.RECORD.size])
+        split = (self.count % self.capacity) * self.RECORD.size
+        return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def records(self):
+        """Decoded (timestamp, port, unit ID, address, value, accepted) tuples, oldest first"""
+        return list(self.RECORD.iter_unpack(self.ordered()))
+
+    def dump(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.ordered())
+
+
+class GuardedRegisterBlock(BaseModbusDataBlock):
+    """Holding registers in an array('H'), with writes checked before they are committed.
+
+    A write that breaks any rule is rejected as a whole (nothing is stored)
+    and the client gets an illegal data value exception response. Reads and
+    commits are single array slice operations, so other threads (the sensor
+    simulation) see either all of a write or none of it without a lock.
+    """
+
+    def __init__(self, address, values, rules, audit=None, port=0, unit_id=0):
+        self.address = address
+        self.values = array('H', values)
+        self.default_value = 0
+        self.low, self.high, self.forbidden = compile_rules(rules, unit_id, len(self.values))
+        self.audit = audit
+        self.port = port
+        self.unit_id = unit_id
+        self.writes = self.rejected = 0
+        self.check_ns = 0       # time spent checking writes
+
+    def reset(self):
+        self.values = array('H', [self.default_value]) * len(self.values)
+
+    def getValues(self, address, count=1):
+        start = address - self.address
+        if start < 0 or len(self.values) < start + count:
+            return ExcCodes.ILLEGAL_ADDRESS
+        return self.values[start:start + count].tolist()
+
+    def setValues(self, address, values):
+        """Client write: check every register, then commit all of them or none"""
+        if not isinstance(values, list):
+            values = [values]
+        start = address - self.address
+        if start < 0 or len(self.values) < start + len(values):
+            return ExcCodes.ILLEGAL_ADDRESS
+        started = time.perf_counter_ns()
+        low, high, forbidden = self.low, self.high, self.forbidden
+        violation = None
+        for index, value in enumerate(values, start):
+            if value < low[index] or value > high[index] or (forbidden and value in forbidden.get(index, ())):
+                violation = index
+                break
+        if violation is None:
+            self.values[start:start + len(values)] = array('H', values)
+        self.check_ns += time.perf_counter_ns() - started
+        self.writes += 1
+        if self.audit is not None:
+            self.audit.append(time.time(), self.port, self.unit_id, start, values, violation is None)
+        if violation is None:
+            return None
+        self.rejected += 1
+        value = values[violation - start]
+        if low[violation] <= value <= high[violation]:
+            rule = "forbidden value"
+        else:
+            rule = f"allowed {low[violation]}-{high[violation]}"
+        log.warning(f"🛡️  BLOCKED write to unit {self.unit_id} register {violation}: {value} ({rule})")
+        return ExcCodes.ILLEGAL_VALUE
+
+    def snapshot(self, count=None):
+        """Consistent copy of the first count registers (one slice, no lock)"""
+        return self.values[:count].tolist()
+
+    def update_sensors(self, bands):
+        """Store new random sensor readings; only the sensor registers are written,
+        so a concurrent client write to another register is never lost"""
+        values = self.values
+        for index, band in enumerate(bands):
+            if band:
+                values[index] = random.randint(*band)
+        return self.snapshot(len(bands))
+
+
+def guard_summary(blocks):
+    """(writes, rejected, mean check time in µs) over guarded blocks"""
+    writes = sum(block.writes for block in blocks)
+    rejected = sum(block.rejected for block in blocks)
+    check_ns = sum(block.check_ns for block in blocks)
+    return writes, rejected, (check_ns / writes / 1000 if writes else 0.0)